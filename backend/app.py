@@ -1,22 +1,107 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
+import asyncio
+import json
+import multiprocessing
 import os
+import re
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 from data.api_wrappers.weather import WeatherFetcher
-from data.api_wrappers.electric_cost import UtilityRatesFetcher
+from data.api_wrappers.electric_cost import UtilityRatesFetcher, rate_query
+from data.api_wrappers.electric_usage import EIA_SECTORS, EIADataFetcher
 from data.api_wrappers.kaggle_appliances import KaggleAppliancesAPI
+from data.api_wrappers.cache import TTLCache
+from data.api_wrappers.rate_cache import RateCache
+from data.api_wrappers.zip_index import get_zip_index
+from data.api_wrappers.http_client import get_client
+from data.topic_hub import TopicHub
+from data.instrumentation import REGISTRY, begin_request, end_request, log_event, stage
+from data.responses import json_response, make_etag, not_modified
+from database.db import Database
+from database.persistence import Persistence
+from database.rollups import RollupEngine
+from database.telemetry import KnownDevices, TelemetryBuffer, TelemetryError, parse_readings
+from database.write_behind import WriteBehindQueue
+from models.anomalies import AnomalyDetector, AnomalyScorer
+from models.baseline import BaselineEngine
+from models.forecasting import HOUR_MS, household_coordinates, hourly_temperatures
+from models.registry import ModelRegistry, ModelServer
+from models.scheduler import appliance_loads
+from models.simulation import DAYS_PER_YEAR, Scenario, Simulator, load_fleet, simulation_pool, summarize
+from models.tou_cost import load_schedules, monthly_bills
 
 # Load environment variables
 load_dotenv()
 
+class TimedJSONProvider(DefaultJSONProvider):
+    """
+    Times every jsonify() as the request's "serialize" stage.
+    """
+    def dumps(self, obj, **kwargs):
+        with stage("serialize"):
+            return super().dumps(obj, **kwargs)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize API wrappers
-weather_fetcher = WeatherFetcher()
-utility_rates_fetcher = UtilityRatesFetcher(os.getenv("nreal_api_key"))
-kaggle_api = KaggleAppliancesAPI()
+# Largest number of locations accepted by the batch endpoints
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000))
+
+# Appliance data never changes while the server runs; clients revalidate after this long
+APPLIANCE_MAX_AGE = 300
+
+# Forecasting models served by /api/forecast
+FORECAST_MODELS = {'appliance': 'appliance_load', 'household': 'household_load'}
+FORECAST_MAX_HOURS = 168
+
+# What-if runs of /api/simulate; household profiles are rebuilt from the rollups after FLEET_TTL seconds
+SIMULATION_MAX_SCENARIOS = 20
+SIMULATION_FLEET_TTL = float(os.getenv("SIMULATION_FLEET_TTL", 3600))
+# Every gunicorn worker holds its own copy of the cache; size it for WEB_CONCURRENCY copies
+simulation_fleets = TTLCache("simulation_fleets",
+                             max_bytes=int(os.getenv("SIMULATION_FLEET_CACHE_BYTES", 128 * 1024 * 1024)),
+                             default_ttl=SIMULATION_FLEET_TTL)
+# Each worker starts one simulation pool on its first run and shares it between requests;
+# by default the workers split the CPUs between them (same default as gunicorn.conf.py)
+SIMULATION_PROCESSES = int(os.getenv("SIMULATION_PROCESSES", max(
+    multiprocessing.cpu_count() // int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8))), 1)))
+simulation_processes = None
+simulation_processes_lock = threading.Lock()
+
+# Live topics for /api/stream
+STREAM_MAX_TOPICS = 20
+STREAM_KEEPALIVE_SECONDS = 15
+# Every open stream holds a gthread worker thread; past this many per worker new streams
+# get a 503, leaving the rest of the thread pool (GUNICORN_THREADS) for ordinary requests
+STREAM_MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", max(int(os.getenv("GUNICORN_THREADS", 32)) // 2, 1)))
+stream_connections = {'open': 0, 'rejected': 0}
+stream_connections_lock = threading.Lock()
+
+# Built by create_app(). Fetchers, caches, appliance data, the ZIP index and models are
+# loaded once (before gunicorn forks, so workers share them copy-on-write); database
+# connections and background threads belong to each worker.
+weather_fetcher = utility_rates_fetcher = eia_fetcher = kaggle_api = model_server = topic_hub = None
+database = write_behind = persistence = telemetry_buffer = rollups = baselines = anomaly_scorer = None
+readiness = {'shared_state': False, 'worker_state': False, 'warmup': None}
+
+@app.before_request
+def start_request_trace():
+    g.trace = begin_request(request.url_rule.rule if request.url_rule else 'unmatched', request.method)
+
+@app.after_request
+def finish_request_trace(response):
+    # Finished when the body has been sent, so streamed responses are timed in full
+    trace = g.pop('trace', None)
+    if trace is not None:
+        response.call_on_close(lambda: end_request(trace, response.status_code))
+    return response
 
 @app.route('/api/weather', methods=['GET'])
 def get_weather():
@@ -42,12 +127,73 @@ def get_weather():
             return jsonify(weather_data), 400
         
         # Process and format the weather data for frontend
-        formatted_data = format_weather_for_frontend(weather_data)
+        with stage("format"):
+            formatted_data = format_weather_for_frontend(weather_data)
         return jsonify(formatted_data)
     
     except Exception as e:
         return jsonify({'error': f'Failed to fetch weather data: {str(e)}'}), 500
 
+def read_batch_items(key):
+    """
+    Reads a list of locations from a batch request body, e.g. {"zipcodes": [...]}.
+    :return: Tuple (items, error_response). Exactly one of them is None.
+    """
+    body = request.get_json(silent=True) or {}
+    items = body.get(key)
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({'error': f'A non-empty "{key}" list is required'}), 400)
+    if len(items) > BATCH_MAX_ITEMS:
+        return None, (jsonify({'error': f'At most {BATCH_MAX_ITEMS} {key} per request'}), 400)
+    return [str(item).strip() for item in items], None
+
+def ndjson_response(lines):
+    """
+    Streams dictionaries to the client as newline-delimited JSON, one line per result.
+    """
+    def encode():
+        for line in lines:
+            with stage("serialize"):
+                encoded = json.dumps(line) + "\n"
+            yield encoded
+
+    return Response(encode(), mimetype='application/x-ndjson')
+
+@app.route('/api/weather/batch', methods=['POST'])
+def get_weather_batch():
+    """
+    Endpoint to get weather data for many ZIP codes in one request
+    Example: POST /api/weather/batch  {"zipcodes": ["33620", "33612", "10001"]}
+    Streams one NDJSON line per ZIP code as soon as its forecast is ready.
+    ZIP codes are resolved in one vectorized lookup and fetched concurrently;
+    ZIPs on the same NWS gridpoint share one upstream forecast request.
+    """
+    zipcodes, error = read_batch_items('zipcodes')
+    if error:
+        return error
+
+    coordinates = weather_fetcher.get_coordinates_batch(list(dict.fromkeys(zipcodes)))
+    by_location = {}
+    for zipcode in zipcodes:
+        by_location.setdefault(coordinates[zipcode], []).append(zipcode)
+    unresolved = by_location.pop((None, None), [])
+
+    async def fetch(location):
+        return location, await weather_fetcher.get_weather_for_coordinates_async(*location)
+
+    def generate():
+        for zipcode in unresolved:
+            yield {'zipcode': zipcode, 'error': 'Invalid ZIP code or unable to fetch coordinates.'}
+        for future in get_client().run_as_completed(fetch(location) for location in by_location):
+            location, weather_data = future.result()
+            if 'error' not in weather_data:
+                with stage("format"):
+                    weather_data = format_weather_for_frontend(weather_data)
+            for zipcode in by_location[location]:
+                yield {'zipcode': zipcode, **weather_data}
+
+    return ndjson_response(generate())
+
 def format_weather_for_frontend(weather_data):
     """
     Format the weather data for the frontend
@@ -86,10 +232,14 @@ def format_weather_for_frontend(weather_data):
                 "windSpeed": period.get("windSpeed")
             })
         
-        return {
+        formatted = {
             "current": current_weather,
             "forecast": forecast
         }
+        # Served from cache past its lifetime (NWS slow or down); a refresh is under way
+        if weather_data.get("stale"):
+            formatted["stale"] = True
+        return formatted
         
     except Exception as e:
         return {"error": f"Error formatting weather data: {str(e)}"}
@@ -101,11 +251,36 @@ def health_check():
     """
     return jsonify({'status': 'healthy'})
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics: request latency by route, per-stage timings, upstream status
+    codes, retries and latency, and cache outcomes. Summed across gunicorn workers when
+    METRICS_DIR is set, otherwise this process only.
+    """
+    return Response(REGISTRY.render_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    Hit/miss/eviction counters for the upstream response caches, and the state of
+    each upstream's circuit breaker
+    """
+    return jsonify({
+        'weather': weather_fetcher.get_cache_stats(),
+        'utility_rates': utility_rates_fetcher.get_cache_stats(),
+        'forecast_models': model_server.stats(),
+        'baselines': baselines.stats() if baselines else None,
+        'simulation_fleets': simulation_fleets.stats(),
+        'upstream_breakers': get_client().breaker_stats()
+    })
+
 @app.route('/api/electric-cost', methods=['GET'])
 def get_electric_cost():
     """
-    Endpoint to get electricity cost data based on address or ZIP code
+    Endpoint to get electricity cost data based on address, ZIP code or "lat,lon"
     Example: /api/electric-cost?address=33620
+    Rates are cached per ZIP code for weeks in a store shared by all workers.
     """
     try:
         address = request.args.get('address')
@@ -124,6 +299,60 @@ def get_electric_cost():
     except Exception as e:
         return jsonify({'error': f'Failed to fetch electricity cost data: {str(e)}'}), 500
 
+@app.route('/api/electric-usage', methods=['GET'])
+def get_electric_usage():
+    """
+    Endpoint for monthly EIA retail electricity sales of a state
+    Example: /api/electric-usage?state=FL&start=2023-01&end=2023-12&sector=RES
+    Query params:
+      - state: two-letter state id
+      - start, end (optional): first and last period (YYYY-MM); default the past twelve months
+      - sector (optional): ALL (default), RES, COM, IND, TRA or OTH
+    Fetched records are also stored in energy_usage.HistoricalElectricityUsage.
+    """
+    state = request.args.get('state')
+    sector = request.args.get('sector', 'ALL').upper()
+    if not state:
+        return jsonify({'error': 'state is required'}), 400
+    if sector not in EIA_SECTORS:
+        return jsonify({'error': f"sector must be one of {', '.join(EIA_SECTORS)}"}), 400
+    try:
+        result = eia_fetcher.get_historical_electricity_usage(
+            {'state': state}, request.args.get('start'), request.args.get('end'), sector
+        )
+        if not result.get('success'):
+            return jsonify({'error': result.get('error')}), 502
+        return json_response(result)
+    except Exception as e:
+        return jsonify({'error': f'Failed to fetch electricity usage data: {str(e)}'}), 500
+
+@app.route('/api/electric-cost/batch', methods=['POST'])
+def get_electric_cost_batch():
+    """
+    Endpoint to get electricity cost data for many addresses or ZIP codes in one request
+    Example: POST /api/electric-cost/batch  {"addresses": ["33620", "4202 E Fowler Ave, Tampa, FL 33620"]}
+    Streams one NDJSON line per address as soon as its rate is ready.
+    Addresses that resolve to the same ZIP code (or rounded coordinates) are looked up once.
+    """
+    addresses, error = read_batch_items('addresses')
+    if error:
+        return error
+
+    by_key = {}
+    for address in addresses:
+        by_key.setdefault(rate_query(address)[0], []).append(address)
+
+    async def fetch(key):
+        return key, await utility_rates_fetcher.get_residential_rate_async(by_key[key][0])
+
+    def generate():
+        for future in get_client().run_as_completed(fetch(key) for key in by_key):
+            key, cost_data = future.result()
+            for address in by_key[key]:
+                yield {'address': address, **cost_data}
+
+    return ndjson_response(generate())
+
 @app.route('/api/appliances', methods=['GET'])
 def get_appliances_data():
     """
@@ -132,22 +361,694 @@ def get_appliances_data():
       - /api/appliances                       # Get data for all appliances
       - /api/appliances?name=refrigerator     # Get data for a specific appliance
       - /api/appliances?average=true          # Get average consumption data
+      - /api/appliances?name=washing_machine&sample_size=500&offset=1000   # Page through rows
+      - /api/appliances?name=oven&sample_size=50&sample=true               # Random sample of rows
+    Rows come column-oriented, {"timestamps": [epoch ms], "values": {column: [...]}};
+    format=records returns the older list of row objects instead.
+    Responses carry an ETag (304 when unchanged) and are compressed when accepted.
     """
     try:
         appliance_name = request.args.get('name')
         average_only = request.args.get('average', 'false').lower() == 'true'
-        
+        orient = request.args.get('format', 'columns')
+        if orient not in ('columns', 'records'):
+            return jsonify({'error': 'format must be columns or records'}), 400
+        sample = request.args.get('sample', 'false').lower() == 'true'
+
+        # The store never changes after loading, so the ETag is known before building the payload
+        # (random samples differ on every call and get none)
+        etag = None if sample else make_etag(kaggle_api.store.version, sorted(request.args.items()))
+        unchanged = not_modified(etag, APPLIANCE_MAX_AGE) if etag else None
+        if unchanged:
+            return unchanged
+
         if average_only:
             # Get average power consumption data
-            return jsonify(kaggle_api.get_average_consumption(appliance_name))
+            payload = kaggle_api.get_average_consumption(appliance_name)
         else:
             # Get detailed appliance data
             sample_size = int(request.args.get('sample_size', 5))
-            return jsonify(kaggle_api.get_appliance_data(appliance_name, sample_size))
+            offset = int(request.args.get('offset', 0))
+            payload = kaggle_api.get_appliance_data(appliance_name, sample_size, offset, sample, orient)
+        return json_response(payload, etag=etag, max_age=APPLIANCE_MAX_AGE)
     
     except Exception as e:
         return jsonify({'error': f'Failed to fetch appliance data: {str(e)}'}), 500
 
+@app.route('/api/telemetry', methods=['POST'])
+def ingest_telemetry():
+    """
+    Endpoint for batched device energy readings
+    Accepts JSON or msgpack (Content-Type: application/msgpack) in either form:
+      - {"readings": [{"device_id": 1, "timestamp": "2024-06-01T12:00:00", "energy_used_kWh": 0.012}, ...]}
+      - {"device_id": [1, 2], "timestamp": [1717243200, 1717243200], "energy_used_kWh": [0.012, 0.3]}
+    Timestamps are ISO-8601 strings or epoch seconds (UTC).
+    Returns 202 once buffered, 400 (listing them) when any device_id is not in household.Devices,
+    or 503 with Retry-After when the ingest buffer is full.
+    Accepted readings are scored for anomalies once they are stored (see /api/anomalies).
+    """
+    if telemetry_buffer is None:
+        return jsonify({'error': 'Telemetry storage is not configured (set DATABASE_URL)'}), 503
+    try:
+        if request.mimetype in ('application/msgpack', 'application/x-msgpack'):
+            import msgpack
+            payload = msgpack.unpackb(request.get_data(), raw=False)
+        else:
+            payload = request.get_json(silent=True)
+        device_ids, timestamps, energy = parse_readings(payload)
+    except (TelemetryError, ValueError) as e:
+        return jsonify({'error': f'Invalid telemetry payload: {str(e)}'}), 400
+
+    unknown = telemetry_buffer.devices.unknown(device_ids)
+    if len(unknown):
+        return jsonify({
+            'error': f'{len(unknown)} unknown device_id(s); no readings were accepted',
+            'unknown_device_ids': unknown[:100].tolist()
+        }), 400
+    if not telemetry_buffer.add(device_ids, timestamps, energy):
+        response = jsonify({'error': 'Telemetry buffer is full, retry shortly'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return jsonify({'accepted': len(device_ids)}), 202
+
+@app.route('/api/anomalies', methods=['GET'])
+def get_anomalies():
+    """
+    Endpoint for recent device anomaly alerts raised while scoring stored telemetry
+    Query params:
+      - device_id (optional): one device's alerts, plus its hourly profile
+      - since (optional): only alerts for readings after this ISO date/time
+      - limit (optional): most recent alerts returned, default 100
+    """
+    if anomaly_scorer is None:
+        return jsonify({'error': 'Telemetry storage is not configured (set DATABASE_URL)'}), 503
+    try:
+        device_id = int(request.args['device_id']) if request.args.get('device_id') else None
+        since = request.args.get('since')
+        since_ms = int(np.datetime64(since, 'ms').astype(np.int64)) if since else None
+        result = {
+            'alerts': anomaly_scorer.recent(device_id, since_ms, int(request.args.get('limit', 100))),
+            'detector': anomaly_scorer.stats()
+        }
+        if device_id is not None:
+            result['profile'] = anomaly_scorer.profile(device_id)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/usage', methods=['GET'])
+def get_usage():
+    """
+    Endpoint for rolled-up energy usage
+    Query params:
+      - level: device, room or household
+      - id: device_id, room_id or household_id
+      - start, end: ISO date/time range [start, end)
+      - grain (optional): hour, day or month to also return the per-bucket series
+    """
+    if rollups is None:
+        return jsonify({'error': 'Usage rollups are not configured (set DATABASE_URL)'}), 503
+    level = request.args.get('level', 'household')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    grain = request.args.get('grain')
+    if not start or not end or not request.args.get('id'):
+        return jsonify({'error': 'id, start and end are required'}), 400
+    try:
+        entity_id = int(request.args['id'])
+        result = rollups.total(level, entity_id, start, end)
+        if grain:
+            result['series'] = rollups.series(level, entity_id, start, end, grain)
+        return json_response(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Failed to fetch usage: {str(e)}'}), 500
+
+@app.route('/api/cost', methods=['GET'])
+def get_cost():
+    """
+    Endpoint for time-of-use electricity bills computed from the hourly usage rollups
+    Query params:
+      - level: device, room or household
+      - id (optional): one entity; omit to bill every entity at the level
+      - start, end: ISO date/time range [start, end)
+      - state or zip: selects the pricing.PeakEnergyPricing schedule (zip resolves the state)
+      - base_rate (optional): off-peak $/kWh; defaults to the NREL residential rate for zip
+      - utc_offset (optional): local time offset from UTC in minutes, e.g. -300
+    """
+    if rollups is None:
+        return jsonify({'error': 'Usage rollups are not configured (set DATABASE_URL)'}), 503
+    level = request.args.get('level', 'household')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    state = request.args.get('state')
+    zipcode = request.args.get('zip')
+    if not start or not end or not (state or zipcode):
+        return jsonify({'error': 'start, end and state or zip are required'}), 400
+    try:
+        if not state:
+            state = get_zip_index().lookup([zipcode])["state"][0].decode() or None
+            if not state:
+                return jsonify({'error': f'Unknown ZIP code: {zipcode}'}), 400
+        base_rate = request.args.get('base_rate')
+        if base_rate is None and zipcode:
+            base_rate = utility_rates_fetcher.get_residential_rate(zipcode).get('residential_rate')
+        if base_rate is None:
+            return jsonify({'error': 'base_rate is required when no rate is available for the location'}), 400
+        schedule = load_schedules(database, float(base_rate), [state.upper()])[state.upper()]
+
+        entity_id = int(request.args['id']) if request.args.get('id') else None
+        entity_ids, buckets, kwh = rollups.series_all(level, start, end, 'hour', entity_id=entity_id)
+        bills = monthly_bills(entity_ids, buckets, kwh, schedule, duration_minutes=60,
+                              utc_offset_minutes=int(request.args.get('utc_offset', 0)))
+        return jsonify({
+            'level': level,
+            'state': schedule.state_id,
+            'base_rate': schedule.base_rate,
+            'peak_windows': len(schedule.windows),
+            'energy_kWh': round(float(bills['kWh'].sum()), 4),
+            'cost': round(float(bills['cost'].sum()), 2),
+            'bills': [
+                {'id': int(i), 'month': m, 'kWh': round(float(k), 4), 'cost': round(float(c), 2)}
+                for i, m, k, c in zip(bills['entity_id'], bills['month'], bills['kWh'], bills['cost'])
+            ]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Failed to compute cost: {str(e)}'}), 500
+
+@app.route('/api/forecast', methods=['GET', 'POST'])
+def get_forecast():
+    """
+    Endpoint for hourly load forecasts from the published forecasting models
+    Example: /api/forecast?model=household&ids=1,2,3&hours=48&zip=33620
+             POST /api/forecast?model=household  {"ids": [1, 2, 3]}
+    Query params:
+      - model: appliance (mean W per hour) or household (kWh per hour)
+      - ids: comma-separated appliance names or household ids (or a JSON "ids" list via POST)
+      - hours (optional): forecast horizon, default 24, at most 168
+      - start (optional): first hour (UTC), defaults to the next whole hour
+      - zip (optional): location whose NWS forecast supplies temperatures for every series;
+        without it each household gets the forecast for its own address
+    All requested series are predicted together in one batch.
+    """
+    started = time.perf_counter()
+    kind = request.args.get('model', 'household')
+    if kind not in FORECAST_MODELS:
+        return jsonify({'error': f"model must be one of {', '.join(FORECAST_MODELS)}"}), 400
+    if request.method == 'POST':
+        ids, error = read_batch_items('ids')
+        if error:
+            return error
+    else:
+        ids = [i.strip() for i in request.args.get('ids', '').split(',') if i.strip()]
+        if not ids:
+            return jsonify({'error': 'ids is required'}), 400
+    model = model_server.get(FORECAST_MODELS[kind])
+    if model is None:
+        return jsonify({'error': f'No {kind} forecasting model has been published'}), 503
+    try:
+        hours = int(request.args.get('hours', 24))
+        if not 1 <= hours <= FORECAST_MAX_HOURS:
+            return jsonify({'error': f'hours must be between 1 and {FORECAST_MAX_HOURS}'}), 400
+        start = request.args.get('start')
+        first_hour = (np.datetime64(start, 'h') if start else np.datetime64('now', 'h') + 1)
+        timestamps = np.arange(hours) * HOUR_MS + first_hour.astype('datetime64[ms]').astype(np.int64)
+
+        temperature = locations = None
+        if model.weather and request.args.get('zip'):
+            weather = weather_fetcher.get_weather({'zipcode': request.args['zip']})
+            if 'error' not in weather:
+                temperature = hourly_temperatures(weather, timestamps)
+        elif model.weather and kind == 'household' and database is not None:
+            with stage("forecast_weather"):
+                temperature, locations = household_temperatures(ids, timestamps)
+        predictions = model.predict(ids, timestamps, temperature, locations)
+        if persistence:
+            persistence.record_model_execution(
+                f"{model.name}:v{model.meta.get('version')}", time.perf_counter() - started,
+                {'stage': 'predict', 'series': len(predictions), 'hours': hours}
+            )
+        return json_response({
+            'model': model.name,
+            'version': model.meta.get('version'),
+            'unit': model.unit,
+            'start': str(first_hour.astype('datetime64[s]')),
+            'step_minutes': 60,
+            'weather': temperature is not None and (locations is None or bool((locations >= 0).any())),
+            'forecasts': {k: np.round(values, 4) for k, values in predictions.items()},
+            'unknown_ids': [i for i in ids if i not in predictions]
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Failed to forecast: {str(e)}'}), 500
+
+def household_temperatures(ids, timestamps):
+    """
+    Hourly temperatures for each household from the NWS forecast at its own address,
+    fetched once per distinct gridpoint.
+    :return: Tuple ((T, L) temperatures, (len(ids),) column of each household; -1 when it has none).
+    """
+    household_ids = [int(i) if str(i).isdigit() else -1 for i in ids]
+    latitude, longitude = (np.round(values, 4) for values in household_coordinates(database, household_ids))
+    located = ~np.isnan(latitude)
+    coordinates = sorted(set(zip(latitude[located].tolist(), longitude[located].tolist())))
+    gridpoints, forecasts = get_client().run(weather_fetcher.get_weather_for_locations_async(coordinates))
+    columns = {key: column for column, key in enumerate(forecasts)}
+    column_at = {c: columns.get(key, -1) for c, key in zip(coordinates, gridpoints)}
+    locations = np.array([column_at[(lat, lon)] if ok else -1 for lat, lon, ok in
+                          zip(latitude.tolist(), longitude.tolist(), located)], dtype=np.int64)
+    temperature = np.zeros((len(timestamps), len(forecasts)))
+    for column, forecast in enumerate(forecasts.values()):
+        temperature[:, column] = hourly_temperatures(forecast, timestamps)
+    return temperature, locations
+
+@app.route('/api/baseline', methods=['GET'])
+def get_baseline():
+    """
+    Endpoint for a household's weather-normalized usage: actual daily kWh next to the kWh
+    its fitted temperature-response baseline expects for each day's temperature
+    Query params:
+      - id: household_id
+      - start, end: ISO date range [start, end)
+    A ratio above 1 means the household used more than the weather explains.
+    """
+    if baselines is None:
+        return jsonify({'error': 'Usage baselines are not configured (set DATABASE_URL)'}), 503
+    start = request.args.get('start')
+    end = request.args.get('end')
+    if not start or not end or not request.args.get('id'):
+        return jsonify({'error': 'id, start and end are required'}), 400
+    try:
+        household_id = int(request.args['id'])
+        model = baselines.model(household_id)
+        if model is None:
+            return jsonify({'error': f'No baseline has been fitted for household {household_id} yet'}), 404
+        days = rollups.series('household', household_id, start, end, 'day')
+        dates = [day['start'][:10] for day in days]
+        actual = np.array([day['energy_kWh'] for day in days], dtype=np.float64)
+        temperature = baselines.temperatures_for(household_id, dates)
+        expected = BaselineEngine.expected(model, temperature)
+        covered = ~np.isnan(expected)
+        actual_total, expected_total = float(actual[covered].sum()), float(expected[covered].sum())
+        return json_response({
+            'id': household_id,
+            'model': model,
+            'days': {
+                'dates': dates,
+                'temperature_f': np.round(temperature, 2),
+                'actual_kWh': np.round(actual, 4),
+                'expected_kWh': np.round(expected, 4)
+            },
+            'actual_kWh': round(actual_total, 4),
+            'expected_kWh': round(expected_total, 4),
+            'ratio': round(actual_total / expected_total, 4) if expected_total > 0 else None
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Failed to compute baseline: {str(e)}'}), 500
+
+@app.route('/api/simulate', methods=['POST'])
+def simulate():
+    """
+    Endpoint for what-if scenarios: annual kWh and cost of households under other tariffs
+    and device changes, next to their current state's time-of-use schedule
+    Example: POST /api/simulate
+             {"base_rate": 0.14, "ids": [1, 2],
+              "scenarios": [{"name": "washer off-peak", "changes": [{"appliance": "washing_machine", "shift_to": "off_peak"}]},
+                            {"name": "evening peak", "tariff": {"windows": [{"start": "17:00", "end": "20:00", "rate": 0.45}]}}]}
+    Body fields:
+      - scenarios: list of {name, tariff ("current", {"state": ...} or {"windows": [...], "base_rate": ...}),
+        changes ([{appliance, scale, remove, shift_to ("off_peak", "HH:MM" or hour)}])}
+      - base_rate or zip: off-peak $/kWh, or the location whose NREL residential rate supplies it
+      - ids (optional): household ids to report individually; omit to simulate every household
+      - start, end (optional): usage history the device profiles are averaged over, default the past year
+    """
+    if rollups is None:
+        return jsonify({'error': 'Usage rollups are not configured (set DATABASE_URL)'}), 503
+    body = request.get_json(silent=True) or {}
+    specs = body.get('scenarios')
+    if not isinstance(specs, list) or not specs:
+        return jsonify({'error': 'A non-empty "scenarios" list is required'}), 400
+    if len(specs) > SIMULATION_MAX_SCENARIOS:
+        return jsonify({'error': f'At most {SIMULATION_MAX_SCENARIOS} scenarios per request'}), 400
+    try:
+        base_rate = body.get('base_rate')
+        if base_rate is None and body.get('zip'):
+            base_rate = utility_rates_fetcher.get_residential_rate(str(body['zip'])).get('residential_rate')
+        if base_rate is None:
+            return jsonify({'error': 'base_rate is required when no rate is available for the location'}), 400
+        base_rate = float(base_rate)
+        end = str(body.get('end') or np.datetime64('today', 'D'))
+        start = str(body.get('start') or np.datetime64(end, 'D') - DAYS_PER_YEAR)
+
+        schedules = load_schedules(database, base_rate)
+        scenarios = [Scenario('current')] + [Scenario.from_dict(spec, schedules, base_rate, f'scenario {i + 1}')
+                                             for i, spec in enumerate(specs)]
+        with stage("simulation_profiles"):
+            fleet = simulation_fleets.get_or_load(
+                (start, end), lambda: (load_fleet(database, rollups, kaggle_api.store, start, end), None)
+            )
+        ids = body.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or len(ids) > BATCH_MAX_ITEMS:
+                return jsonify({'error': f'ids must be a list of at most {BATCH_MAX_ITEMS} household ids'}), 400
+            fleet = fleet.select([int(i) for i in ids])
+        pool = get_simulation_pool()
+        simulator = Simulator(schedules, base_rate, appliance_loads(kaggle_api.store),
+                              processes=SIMULATION_PROCESSES, pool=pool)
+        with stage("simulation"):
+            try:
+                result = simulator.run(fleet, scenarios)
+            except BrokenProcessPool:
+                reset_simulation_pool(pool)
+                raise
+
+        payload = {
+            'base_rate': base_rate,
+            'start': start,
+            'end': end,
+            'scenarios': summarize(fleet, scenarios, result),
+            'stats': result['stats']
+        }
+        if ids is not None:
+            payload['households'] = {
+                'ids': fleet.keys,
+                'states': fleet.states,
+                'kWh': np.round(result['kWh'], 2),
+                'cost': np.round(result['cost'], 2),
+                'peak_kWh': np.round(result['peak_kWh'], 2)
+            }
+            payload['unknown_ids'] = sorted(set(int(i) for i in ids) - set(fleet.keys.tolist()))
+        return json_response(payload)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Failed to simulate: {str(e)}'}), 500
+
+def get_simulation_pool():
+    """
+    This worker's simulation pool, started on first use (None when SIMULATION_PROCESSES is 1).
+    """
+    global simulation_processes
+    if SIMULATION_PROCESSES <= 1:
+        return None
+    with simulation_processes_lock:
+        if simulation_processes is None:
+            simulation_processes = simulation_pool(SIMULATION_PROCESSES)
+        return simulation_processes
+
+def reset_simulation_pool(pool):
+    """
+    Drops a pool that broke (a process died) so the next run starts a new one.
+    """
+    global simulation_processes
+    with simulation_processes_lock:
+        if simulation_processes is pool:
+            simulation_processes = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def canonical_zipcode(zipcode):
+    if not re.fullmatch(r"\d{5}", zipcode.strip()):
+        raise ValueError(f"Invalid ZIP code: {zipcode}")
+    return zipcode.strip()
+
+async def load_weather_topic(zipcode):
+    weather_data = await weather_fetcher.get_weather_async({"zipcode": zipcode})
+    return weather_data if 'error' in weather_data else format_weather_for_frontend(weather_data)
+
+async def load_rates_topic(key):
+    # Topics are keyed by rate_query's cache key, so every address in a ZIP shares one topic
+    return await utility_rates_fetcher.get_residential_rate_async(key.partition(':')[2])
+
+def canonical_usage(argument):
+    level, _, entity_id = argument.partition(':')
+    if level not in ('device', 'room', 'household') or not entity_id.isdigit():
+        raise ValueError(f"Usage topics look like usage:household:<id>, got usage:{argument}")
+    return f"{level}:{int(entity_id)}"
+
+async def load_usage_topic(argument):
+    if rollups is None:
+        return {'error': 'Usage rollups are not configured (set DATABASE_URL)'}
+    level, _, entity_id = argument.partition(':')
+    today = np.datetime64('now', 'D')
+
+    def read():
+        result = rollups.total(level, int(entity_id), str(today), str(today + 1))
+        result['series'] = rollups.series(level, int(entity_id), str(today), str(today + 1), 'hour')
+        return result
+
+    return await asyncio.get_running_loop().run_in_executor(None, read)
+
+def canonical_anomalies(argument):
+    if argument != 'all' and not argument.isdigit():
+        raise ValueError(f"Anomaly topics look like anomalies:all or anomalies:<device_id>, got anomalies:{argument}")
+    return argument if argument == 'all' else str(int(argument))
+
+async def load_anomalies_topic(argument):
+    if anomaly_scorer is None:
+        return {'error': 'Telemetry storage is not configured (set DATABASE_URL)'}
+    device_id = None if argument == 'all' else int(argument)
+    alerts = await asyncio.get_running_loop().run_in_executor(None, lambda: anomaly_scorer.recent(device_id, limit=20))
+    return {'alerts': alerts}
+
+def release_stream_slot():
+    with stream_connections_lock:
+        stream_connections['open'] -= 1
+
+@app.route('/api/stream', methods=['GET'])
+def stream_topics():
+    """
+    Server-Sent Events endpoint for live dashboard data
+    Example: /api/stream?topic=weather:33620&topic=rates:33620&topic=usage:household:1
+    Each topic is its own (URL-encoded) topic parameter, so addresses may contain commas;
+    topics=a,b,c also works for topics without commas.
+    Topics:
+      - weather:<zip>             formatted forecast, as from /api/weather
+      - rates:<address or zip>    residential rate, as from /api/electric-cost
+      - usage:<level>:<id>        today's kWh and hourly series from the usage rollups
+      - anomalies:<device_id|all> latest anomaly alerts, as from /api/anomalies
+    Each message is {"topic", "sequence", "data"}; the latest value of every topic is sent
+    on connect and then again whenever it changes. Comment lines keep idle connections open.
+    At most STREAM_MAX_CONNECTIONS streams are open per worker; beyond that the response is 503.
+    """
+    topics = [t.strip() for t in request.args.getlist('topic') if t.strip()]
+    topics += [t.strip() for t in request.args.get('topics', '').split(',') if t.strip()]
+    if not topics:
+        return jsonify({'error': 'topic is required'}), 400
+    if len(topics) > STREAM_MAX_TOPICS:
+        return jsonify({'error': f'At most {STREAM_MAX_TOPICS} topics per stream'}), 400
+    with stream_connections_lock:
+        if stream_connections['open'] >= STREAM_MAX_CONNECTIONS:
+            stream_connections['rejected'] += 1
+            full = True
+        else:
+            stream_connections['open'] += 1
+            full = False
+    if full:
+        response = jsonify({'error': 'Too many open streams; retry shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    try:
+        subscription = topic_hub.subscribe(topics)
+    except ValueError as e:
+        release_stream_slot()
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        try:
+            yield f"retry: 5000\n: subscribed to {', '.join(subscription.topics)}\n\n"
+            while True:
+                message = subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"id: {message['sequence']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            # Runs when the client disconnects and the server closes the generator
+            topic_hub.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also runs for a response closed before its body was started
+    response.call_on_close(release_stream_slot)
+    return response
+
+@app.route('/api/stream/stats', methods=['GET'])
+def stream_stats():
+    """
+    Live topics with their subscriber, refresh and update counts, and this worker's open streams
+    """
+    with stream_connections_lock:
+        connections = {**stream_connections, 'max': STREAM_MAX_CONNECTIONS}
+    return jsonify({'topics': topic_hub.stats(), 'connections': connections})
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe: 200 once this worker has its shared state, database pool and
+    background writers up (and the configured cache warmup has run), 503 before that.
+    /api/health only says the process is serving.
+    """
+    checks = dict(readiness)
+    if readiness['shared_state']:
+        checks['zip_codes'] = len(get_zip_index().zips)
+        checks['appliances'] = len(kaggle_api.store.series)
+        checks['forecast_models'] = model_server.stats()['models']
+        checks['caches'] = {
+            'weather': weather_fetcher.get_cache_stats(),
+            'utility_rates': utility_rates_fetcher.get_cache_stats()
+        }
+    ready = readiness['shared_state'] and readiness['worker_state']
+    if database is not None:
+        try:
+            database.query("SELECT 1")
+            checks['database'] = 'ok'
+        except Exception as e:
+            checks['database'] = f'unavailable: {str(e)}'
+            ready = False
+    return jsonify({'ready': ready, **checks}), 200 if ready else 503
+
+def record_weather_forecast(forecast, gridpoint):
+    if persistence:
+        persistence.record_weather_forecast(forecast, gridpoint)
+
+def record_electricity_cost(result):
+    if persistence:
+        persistence.record_electricity_cost(result)
+
+def record_historical_usage(result):
+    if persistence:
+        persistence.record_historical_usage(result)
+
+def init_shared_state():
+    """
+    Builds the fetchers, appliance data, ZIP index, forecasting models and topic hub.
+    None of these hold connections or threads, so they can be built before a fork.
+    """
+    global weather_fetcher, utility_rates_fetcher, eia_fetcher, kaggle_api, model_server, topic_hub
+    weather_fetcher = WeatherFetcher(on_fetch=record_weather_forecast)
+    utility_rates_fetcher = UtilityRatesFetcher(
+        os.getenv("nreal_api_key"),
+        on_fetch=record_electricity_cost,
+        rate_cache=RateCache()
+    )
+    eia_fetcher = EIADataFetcher(os.getenv("eia_api_key"), on_fetch=record_historical_usage)
+    kaggle_api = KaggleAppliancesAPI()
+    get_zip_index()
+
+    # Forecasting models stay in memory and are swapped when a new version is published
+    model_server = ModelServer(ModelRegistry(), check_interval=float(os.getenv("MODEL_CHECK_INTERVAL", 5)))
+
+    # Each distinct /api/stream topic has one refresher shared by all subscribers
+    topic_hub = TopicHub(get_client(), linger=float(os.getenv("STREAM_TOPIC_LINGER", 30)))
+    topic_hub.register('weather', load_weather_topic, interval=float(os.getenv("STREAM_WEATHER_INTERVAL", 600)),
+                       canonical=canonical_zipcode)
+    topic_hub.register('rates', load_rates_topic, interval=float(os.getenv("STREAM_RATES_INTERVAL", 3600)),
+                       canonical=lambda address: rate_query(address)[0])
+    topic_hub.register('usage', load_usage_topic, interval=float(os.getenv("STREAM_USAGE_INTERVAL", 30)),
+                       canonical=canonical_usage)
+    topic_hub.register('anomalies', load_anomalies_topic, interval=float(os.getenv("STREAM_ANOMALY_INTERVAL", 5)),
+                       canonical=canonical_anomalies)
+    readiness['shared_state'] = True
+
+def warm_up(zipcodes):
+    """
+    Fetches weather and utility rates for the given ZIP codes concurrently, so the
+    caches are hot before the first user request arrives.
+    """
+    started = time.perf_counter()
+
+    async def fetch(zipcode):
+        weather_data, cost_data = await asyncio.gather(
+            weather_fetcher.get_weather_async({"zipcode": zipcode}),
+            utility_rates_fetcher.get_residential_rate_async(zipcode)
+        )
+        return 'error' not in weather_data, 'error' not in cost_data
+
+    results = [future.result() for future in get_client().run_as_completed(fetch(z) for z in zipcodes)]
+    readiness['warmup'] = {
+        'zipcodes': len(zipcodes),
+        'weather': sum(w for w, _ in results),
+        'utility_rates': sum(r for _, r in results),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+    log_event('warmup', **readiness['warmup'])
+
+def init_worker_state():
+    """
+    Opens the database pool and starts the background writers, usage rollups and baselines when
+    DATABASE_URL is set. Runs in every worker after the fork (gunicorn post_fork hook).
+    """
+    global database, write_behind, persistence, telemetry_buffer, rollups, baselines, anomaly_scorer
+    database = Database.from_env()
+    if database:
+        write_behind = WriteBehindQueue(database)
+        persistence = Persistence(write_behind)
+        telemetry_buffer = TelemetryBuffer(
+            database,
+            capacity=int(os.getenv("TELEMETRY_BUFFER_CAPACITY", 1_000_000)),
+            flush_rows=int(os.getenv("TELEMETRY_FLUSH_ROWS", 50_000)),
+            flush_interval=float(os.getenv("TELEMETRY_FLUSH_INTERVAL", 2.0)),
+            devices=KnownDevices(database, max_age=float(os.getenv("TELEMETRY_DEVICE_REFRESH", 60)))
+        )
+        # Scores in whichever worker holds the detector's state lock; the others read its alerts
+        anomaly_scorer = AnomalyScorer(
+            database,
+            AnomalyDetector(max_device_id=int(os.getenv("ANOMALY_MAX_DEVICE_ID", 10_000_000))),
+            interval=float(os.getenv("ANOMALY_INTERVAL", 5))
+        )
+        rollups = RollupEngine(database, interval=float(os.getenv("ROLLUP_INTERVAL", 30)))
+        baselines = BaselineEngine(database, rollups, interval=float(os.getenv("BASELINE_INTERVAL", 3600)))
+    if os.getenv("METRICS_DIR"):
+        REGISTRY.share(os.getenv("METRICS_DIR"), interval=float(os.getenv("METRICS_EXPORT_INTERVAL", 5)))
+    readiness['worker_state'] = True
+
+def close_worker_state():
+    """
+    Flushes buffered telemetry and queued writes and closes the database and simulation pools
+    (gunicorn worker_exit hook).
+    """
+    for component in (telemetry_buffer, anomaly_scorer, write_behind, baselines, rollups, database):
+        if component is not None:
+            try:
+                component.close()
+            except Exception as e:
+                print(f"Error closing {type(component).__name__}: {str(e)}")
+    global simulation_processes
+    with simulation_processes_lock:
+        pool, simulation_processes = simulation_processes, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+    REGISTRY.retire()
+    readiness['worker_state'] = False
+
+def create_app(preload=False):
+    """
+    Application factory.
+    :param preload: True when called in the gunicorn master before forking (see gunicorn.conf.py):
+        shared state is built and warmed here, and each worker opens its own connections
+        and threads in post_fork. Otherwise everything is set up in this process.
+    """
+    if not readiness['shared_state']:
+        init_shared_state()
+        zipcodes = [z.strip() for z in os.getenv("WARMUP_ZIPCODES", "").split(",") if z.strip()]
+        if zipcodes:
+            warm_up(zipcodes)
+    if preload:
+        # The client's loop thread and sockets would not survive the fork; workers start their own
+        get_client().close()
+        # Warmup metrics are saved by the master; workers start counting from zero
+        REGISTRY.save(os.getenv("METRICS_DIR"))
+    elif not readiness['worker_state']:
+        init_worker_state()
+    return app
+
 if __name__ == '__main__':
+    # Development server; production runs gunicorn -c gunicorn.conf.py (see start_server.sh)
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=port, debug=os.getenv("FLASK_DEBUG") == "1", threaded=True) 
\ No newline at end of file
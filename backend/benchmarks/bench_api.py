@@ -0,0 +1,233 @@
+'''
+Benchmark: HTTP load test of the Flask API, fully offline
+Starts the app (gunicorn, or the Flask development server) with upstream calls served
+from recorded fixtures (see data.api_wrappers.replay), drives it with a fixed number
+of concurrent closed-loop clients, and reports throughput and p50/p95/p99 latency per
+endpoint. Results can be saved and compared against an earlier run.
+
+Usage (from backend/):
+    python -m benchmarks.bench_api --concurrency 64 --duration 30 --save baseline.json
+    python -m benchmarks.bench_api --concurrency 64 --duration 30 --baseline baseline.json
+    python -m benchmarks.bench_api --upstream-latency 0.2 --error-rate 0.05 --endpoints weather
+    python -m benchmarks.bench_api --url http://localhost:5000   # an already running server
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import aiohttp
+import numpy as np
+from data.api_wrappers.zip_index import get_zip_index
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(BACKEND_DIR, "benchmarks", "fixtures")
+APPLIANCES = ("refrigerator", "washing_machine", "oven", "dishwasher", None)
+
+
+def endpoint_requests(name: str, zipcodes: list, rng: random.Random):
+    """
+    Endless stream of request paths for one endpoint.
+    """
+    while True:
+        if name == "weather":
+            yield f"/api/weather?zipcode={rng.choice(zipcodes)}"
+        elif name == "electric-cost":
+            yield f"/api/electric-cost?address={rng.choice(zipcodes)}"
+        elif name == "appliances":
+            appliance = rng.choice(APPLIANCES)
+            query = f"name={appliance}&" if appliance else ""
+            yield f"/api/appliances?{query}sample_size={rng.choice((5, 50, 500))}&offset={rng.randrange(0, 10_000)}"
+        elif name == "appliances-average":
+            yield "/api/appliances?average=true"
+        elif name == "health":
+            yield "/api/health"
+        else:
+            raise ValueError(f"Unknown endpoint {name!r}")
+
+
+def start_server(args, port: int, workdir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "UPSTREAM_REPLAY_DIR": args.fixtures,
+        "UPSTREAM_REPLAY_JITTER": str(args.jitter),
+        "UPSTREAM_REPLAY_ERROR_RATE": str(args.error_rate),
+        "UPSTREAM_REPLAY_FAILURE_RATE": str(args.failure_rate),
+        "UPSTREAM_REPLAY_SEED": "0",
+        # A fresh rate store per run, so results do not depend on earlier runs
+        "RATE_CACHE_PATH": os.path.join(workdir, "utility_rates.sqlite"),
+        "LOG_LEVEL": "WARNING",
+        "nreal_api_key": os.getenv("nreal_api_key") or "DEMO_KEY",
+    }
+    env.pop("DATABASE_URL", None)
+    env.pop("UPSTREAM_RECORD_DIR", None)
+    if args.upstream_latency is not None:
+        env["UPSTREAM_REPLAY_LATENCY"] = str(args.upstream_latency)
+
+    if args.server == "gunicorn":
+        env.update(WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.threads),
+                   GUNICORN_ACCESS_LOG=os.devnull, GUNICORN_LOG_LEVEL="warning")
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:create_app(preload=True)"]
+    else:
+        command = [sys.executable, "app.py"]
+    log = open(os.path.join(workdir, "server.log"), "w")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(url: str, timeout: float = 180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/api/ready", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not become ready within {timeout:.0f}s")
+
+
+async def drive(url: str, endpoints: list, zipcodes: list, concurrency: int, duration: float,
+                warmup: float, seed: int = 0) -> dict:
+    """
+    Runs concurrency clients, each sending its next request as soon as the previous one
+    completes. Requests finishing during the warmup are not counted.
+    :return: {endpoint: {"latencies": [...seconds], "errors": int, "statuses": {status: count}}}
+    """
+    results = {name: {"latencies": [], "errors": 0, "statuses": {}} for name in endpoints}
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def client(index: int, session: aiohttp.ClientSession):
+        rng = random.Random(seed * 100_003 + index)
+        streams = {name: endpoint_requests(name, zipcodes, rng) for name in endpoints}
+        while True:
+            name = rng.choice(endpoints)
+            path = next(streams[name])
+            t = time.perf_counter()
+            try:
+                async with session.get(url + path) as response:
+                    await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = "error"
+            done = time.perf_counter()
+            if done >= stop_at:
+                return
+            if t >= measure_from:
+                result = results[name]
+                result["latencies"].append(done - t)
+                result["statuses"][status] = result["statuses"].get(status, 0) + 1
+                if status == "error" or status >= 400:
+                    result["errors"] += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        await asyncio.gather(*(client(i, session) for i in range(concurrency)))
+    return results
+
+
+def summarize(results: dict, duration: float) -> dict:
+    summary = {}
+    for name, result in results.items():
+        latencies = np.array(result["latencies"]) * 1000
+        summary[name] = {
+            "requests": len(latencies),
+            "errors": result["errors"],
+            "statuses": {str(k): v for k, v in result["statuses"].items()},
+            "throughput_rps": round(len(latencies) / duration, 1),
+            **{f"p{q}_ms": round(float(np.percentile(latencies, q)), 2) if len(latencies) else None
+               for q in (50, 95, 99)},
+            "max_ms": round(float(latencies.max()), 2) if len(latencies) else None
+        }
+    return summary
+
+
+def print_report(summary: dict, baseline: dict = None):
+    header = f"{'endpoint':<20}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, s in summary.items():
+        print(f"{name:<20}{s['requests']:>10}{s['errors']:>8}{s['throughput_rps']:>10}"
+              f"{s['p50_ms'] or 0:>10.2f}{s['p95_ms'] or 0:>10.2f}{s['p99_ms'] or 0:>10.2f}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            def change(key):
+                if not previous.get(key) or s.get(key) is None:
+                    return "n/a"
+                return f"{(s[key] / previous[key] - 1) * 100:+.1f}%"
+            print(f"{'  vs baseline':<20}{'':>10}{'':>8}{change('throughput_rps'):>10}"
+                  f"{change('p50_ms'):>10}{change('p95_ms'):>10}{change('p99_ms'):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of the Flask API.")
+    parser.add_argument("--endpoints", default="weather,electric-cost,appliances",
+                        help="Comma-separated mix: weather, electric-cost, appliances, appliances-average, health")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+    parser.add_argument("--zipcodes", type=int, default=500, help="Distinct ZIP codes to request")
+    parser.add_argument("--server", choices=("gunicorn", "flask"), default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--upstream-latency", type=float, default=None,
+                        help="Seconds per upstream response (default: each fixture's recorded latency)")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream calls answered 503")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of upstream calls dropped")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    zips = get_zip_index().zips
+    zipcodes = [f"{int(z):05d}" for z in random.Random(0).sample(list(zips), min(args.zipcodes, len(zips)))]
+
+    server = None
+    with tempfile.TemporaryDirectory() as workdir:
+        url = args.url
+        if url is None:
+            url = f"http://127.0.0.1:{args.port}"
+            server = start_server(args, args.port, workdir)
+        try:
+            try:
+                wait_until_ready(url)
+            except RuntimeError:
+                if server is not None:
+                    with open(os.path.join(workdir, "server.log")) as f:
+                        print(f.read()[-4000:])
+                raise
+            print(f"driving {url}: {', '.join(endpoints)} with {args.concurrency} clients for "
+                  f"{args.duration:g}s (+{args.warmup:g}s warmup), {len(zipcodes)} ZIP codes")
+            results = asyncio.run(drive(url, endpoints, zipcodes, args.concurrency, args.duration, args.warmup))
+        finally:
+            if server is not None:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+
+    summary = summarize(results, args.duration)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["endpoints"]
+    print_report(summary, baseline)
+    total = sum(s["requests"] for s in summary.values())
+    print(f"total: {total} requests, {total / args.duration:.1f} req/s")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k not in ("save", "baseline")},
+                       "endpoints": summary}, f, indent=2)
@@ -0,0 +1,85 @@
+'''
+Benchmark: streaming cycle segmentation over many machines
+Replays the washing-machine log as live telemetry from N machines, each starting at
+a random offset, in batches covering a few seconds of wall time across the whole
+fleet (as an ingest endpoint would hand them over). Reports samples per second, the
+engine's memory for the fleet, and checks that every machine's cycle matches the
+single-machine run of the same log.
+
+Usage (from backend/):
+    python -m benchmarks.bench_cycle_phases --machines 2000 --batch-seconds 5
+'''
+
+import argparse
+import time
+import numpy as np
+from data.pipelines.sensor_ingest import DEFAULT_SOURCE
+from models.cycle_phases import CycleSegmenter, sensor_batches
+
+WINDOW_MS = CycleSegmenter().window_ms
+
+
+def load_log() -> tuple:
+    parts = list(sensor_batches(DEFAULT_SOURCE))
+    _, timestamps, power, accel = (np.concatenate(p) for p in zip(*parts))
+    # Rebase onto a window boundary so windows cut the log where the single-machine run cuts it
+    return timestamps - timestamps[0] // WINDOW_MS * WINDOW_MS, power, accel
+
+
+def fleet_batches(machines: int, batch_seconds: float, seed: int = 0):
+    """
+    Interleaves one copy of the log per machine (shifted by up to 10 minutes) and
+    yields time-ordered fleet batches.
+    """
+    offsets_ms, power, accel = load_log()
+    rng = np.random.default_rng(seed)
+    # Whole-window offsets, so every machine sees the same windows as the single-machine run
+    starts = np.datetime64("2024-01-01T08:00", "ms").astype(np.int64) + rng.integers(0, 600_000 // WINDOW_MS, machines) * WINDOW_MS
+    batch_ms = int(batch_seconds * 1000)
+    # Each machine's log is sorted, so a batch is a slice of every machine's log
+    for t in range(0, int(offsets_ms[-1]) + 600_000 + batch_ms, batch_ms):
+        lo = np.searchsorted(offsets_ms, t - (starts - starts.min()), side="left")
+        hi = np.searchsorted(offsets_ms, t + batch_ms - (starts - starts.min()), side="left")
+        counts = hi - lo
+        if not counts.sum():
+            continue
+        machine = np.repeat(np.arange(machines), counts)
+        rows = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])
+        yield machine, starts[machine] + offsets_ms[rows], power[rows], accel[rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark streaming washing-machine cycle segmentation.")
+    parser.add_argument("--machines", type=int, default=2000)
+    parser.add_argument("--batch-seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    reference = CycleSegmenter()
+    expected = [e for batch in sensor_batches(DEFAULT_SOURCE) for e in reference.ingest(*batch)] + reference.flush()
+    expected_cycle = next(e for e in expected if e["event"] == "cycle_end")
+
+    print(f"preparing {args.machines} machines x {reference.samples} samples ...")
+    batches = list(fleet_batches(args.machines, args.batch_seconds))
+    samples = sum(len(b[0]) for b in batches)
+
+    segmenter = CycleSegmenter(capacity=args.machines)
+    events = []
+    latencies = []
+    started = time.perf_counter()
+    for batch in batches:
+        t = time.perf_counter()
+        events += segmenter.ingest(*batch)
+        latencies.append(time.perf_counter() - t)
+    events += segmenter.flush()
+    elapsed = time.perf_counter() - started
+
+    cycles = [e for e in events if e["event"] == "cycle_end"]
+    state_bytes = sum(v.nbytes for v in vars(segmenter).values() if isinstance(v, np.ndarray))
+    matching = sum(c["phases"] == expected_cycle["phases"] for c in cycles)
+    print(f"samples:              {samples} in {len(batches)} batches of {args.batch_seconds}s")
+    print(f"throughput:           {samples / elapsed / 1e6:.2f}M samples/s ({elapsed:.2f}s)")
+    print(f"batch latency:        p50 {np.percentile(latencies, 50) * 1000:.2f} ms, "
+          f"max {max(latencies) * 1000:.2f} ms")
+    print(f"live headroom:        {args.batch_seconds / np.mean(latencies):.0f}x real time")
+    print(f"engine state:         {state_bytes / 1024:.0f} KiB for {len(segmenter.machine_ids)} machines")
+    print(f"events:               {len(events)}, cycles {len(cycles)}, matching the single-machine run: {matching}")
@@ -0,0 +1,57 @@
+'''
+Benchmark: nightly load-shifting batch
+Generates N synthetic households spread over several state schedules, with random
+shiftable devices and preferred finish hours, and times LoadScheduler.run inline
+and across a process pool.
+
+Usage (from backend/):
+    python -m benchmarks.bench_scheduler --households 100000 --processes 8
+'''
+
+import argparse
+import numpy as np
+from data.api_wrappers.appliance_store import ApplianceStore
+from data.pipelines.sensor_ingest import DEFAULT_STORE
+from models.scheduler import LoadScheduler, appliance_loads
+from models.tou_cost import TouSchedule
+
+SCHEDULES = {
+    "FL": TouSchedule([("14:00", "21:00", 0.35)], 0.12, "FL"),
+    "CA": TouSchedule([("16:00", "21:00", 0.45), ("21:00", "00:00", 0.25)], 0.20, "CA"),
+    "TX": TouSchedule([("13:00", "19:00", 0.30), ("23:00", "05:00", 0.06)], 0.11, "TX"),
+    "NY": TouSchedule([("08:00", "12:00", 0.28), ("17:00", "22:00", 0.33)], 0.18, "NY"),
+}
+DEVICE_NAMES = ("Washing Machine", "Dishwasher", "Fridge", "TV", "Dryer")
+
+
+def make_households(n: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    states = list(SCHEDULES)
+    households = []
+    for household_id in range(1, n + 1):
+        devices = rng.choice(len(DEVICE_NAMES), size=rng.integers(1, 4), replace=False)
+        households.append({
+            "household_id": household_id,
+            "state": states[rng.integers(len(states))],
+            "preferred_hours": None if rng.random() < 0.3 else int(rng.integers(0, 24)),
+            "devices": [(household_id * 10 + int(d), DEVICE_NAMES[d]) for d in devices]
+        })
+    return households
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the appliance load-shifting scheduler.")
+    parser.add_argument("--households", type=int, default=100_000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    loads = appliance_loads(ApplianceStore.load(sensor_store=DEFAULT_STORE))
+    households = make_households(args.households)
+    print(f"households: {len(households)}, loads: {', '.join(loads)}")
+    for processes in (1, args.processes):
+        result = LoadScheduler(SCHEDULES, loads, processes, args.chunk_size).run(households)
+        stats = result["stats"]
+        print(f"processes={processes}: {stats['seconds']}s, {stats['decisions']} decisions, "
+              f"{len(result['execution_logs'])} execution log rows, "
+              f"{stats['households'] / stats['seconds']:.0f} households/s")
@@ -0,0 +1,100 @@
+'''
+Benchmark: columnar sensor ingest vs naive pd.read_csv
+Tiles the washing-machine log N times (shifting timestamps) into a larger CSV, then
+compares, each in a fresh process so peak RSS is meaningful:
+  - naive:    pd.read_csv of the whole file + resample to the grid
+  - pipeline: chunked ingest into the partitioned parquet store
+  - reload:   reading the finished store back (memory-mapped) vs re-reading the CSV
+
+Usage (from backend/):
+    python -m benchmarks.bench_sensor_ingest --scale 50
+'''
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import shutil
+import tempfile
+import time
+import pandas as pd
+from data.pipelines.sensor_ingest import CHANNELS, DEFAULT_SOURCE, TIMESTAMP_COLUMN, ingest, load_store
+
+
+def make_input(scale: int, out_path: str) -> int:
+    """
+    Writes the source log repeated `scale` times, each copy shifted past the previous one.
+    :return: Number of rows written.
+    """
+    df = pd.read_parquet(DEFAULT_SOURCE, columns=[TIMESTAMP_COLUMN] + CHANNELS)
+    span = df[TIMESTAMP_COLUMN].max() - df[TIMESTAMP_COLUMN].min() + pd.Timedelta(seconds=1)
+    for i in range(scale):
+        copy = df.copy()
+        copy[TIMESTAMP_COLUMN] += span * i
+        copy.to_csv(out_path, mode="a" if i else "w", header=not i, index=False)
+    return len(df) * scale
+
+
+def _naive(csv_path, freq_ms, _store):
+    df = pd.read_csv(csv_path, parse_dates=[TIMESTAMP_COLUMN])
+    return len(df.set_index(TIMESTAMP_COLUMN).resample(f"{freq_ms}ms").mean())
+
+
+def _pipeline(csv_path, freq_ms, store):
+    shutil.rmtree(store, ignore_errors=True)
+    return ingest(csv_path, store, freq_ms)["grid_rows"]
+
+
+def _reload_csv(csv_path, _freq_ms, _store):
+    return len(pd.read_csv(csv_path, parse_dates=[TIMESTAMP_COLUMN]))
+
+
+def _reload_store(_csv_path, _freq_ms, store):
+    return load_store(store).num_rows
+
+
+def _measure(target, args, results):
+    started = time.perf_counter()
+    rows = target(*args)
+    results.put((time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, rows))
+
+
+def run_isolated(target, *args) -> dict:
+    """
+    Runs one benchmark case in a spawned process and returns wall time and peak RSS.
+    """
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(target, args, results))
+    proc.start()
+    seconds, max_rss_kb, rows = results.get()
+    proc.join()
+    return {"seconds": round(seconds, 3), "peak_rss_mb": round(max_rss_kb / 1024, 1), "rows": rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="Copies of the source log to concatenate")
+    parser.add_argument("--freq-ms", type=int, default=1000)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="uems_bench_")
+    try:
+        csv_path = os.path.join(work_dir, "input.csv")
+        store = os.path.join(work_dir, "store")
+        rows = make_input(args.scale, csv_path)
+        print(f"Input: {rows:,} rows, {os.path.getsize(csv_path) / 1e6:.1f} MB CSV")
+
+        cases = [
+            ("naive read_csv + resample", _naive),
+            ("chunked columnar ingest", _pipeline),
+            ("re-read raw CSV", _reload_csv),
+            ("read store (memory-mapped)", _reload_store),
+        ]
+        for name, target in cases:
+            result = run_isolated(target, csv_path, args.freq_ms, store)
+            print(f"{name:<30} {result['seconds']:>8.3f}s  peak RSS {result['peak_rss_mb']:>8.1f} MB  rows {result['rows']:,}")
+        store_mb = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(store) for f in files) / 1e6
+        print(f"Store size on disk: {store_mb:.1f} MB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
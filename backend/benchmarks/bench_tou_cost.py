@@ -0,0 +1,63 @@
+'''
+Benchmark: vectorized time-of-use pricing vs a per-row Python loop
+Prices N hourly usage intervals (spread over a year and a fleet of households)
+against a schedule with a midnight-wrapping window, checks both give the same
+costs on a sample, and reports intervals per second.
+
+Usage (from backend/):
+    python -m benchmarks.bench_tou_cost --intervals 5000000
+'''
+
+import argparse
+import time
+import numpy as np
+from models.tou_cost import MINUTES_PER_DAY, TouSchedule, monthly_bills, price
+
+SCHEDULE = TouSchedule([("16:00", "21:00", 0.32), ("22:30", "06:00", 0.09)], base_rate=0.14, state_id="FL")
+
+
+def naive_price(schedule: TouSchedule, timestamps_ms: np.ndarray, kwh: np.ndarray, duration_minutes: int) -> list:
+    costs = []
+    for ts, energy in zip(timestamps_ms.tolist(), kwh.tolist()):
+        start = ts // 60_000 % MINUTES_PER_DAY
+        rate = sum(schedule.rates[(start + m) % MINUTES_PER_DAY] for m in range(duration_minutes)) / duration_minutes
+        costs.append(rate * energy)
+    return costs
+
+
+def make_usage(n: int, households: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-01-01T00:00", "ms").astype(np.int64)
+    # Hour-aligned with a random minute offset, so intervals straddle window edges
+    timestamps = start + rng.integers(0, 365 * 24, n) * 3_600_000 + rng.integers(0, 60, n) * 60_000
+    return rng.integers(1, households + 1, n), timestamps, rng.gamma(2.0, 0.4, n)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the time-of-use cost engine.")
+    parser.add_argument("--intervals", type=int, default=5_000_000)
+    parser.add_argument("--households", type=int, default=10_000)
+    parser.add_argument("--naive-sample", type=int, default=20_000)
+    args = parser.parse_args()
+
+    households, timestamps, kwh = make_usage(args.intervals, args.households)
+
+    started = time.perf_counter()
+    costs = price(SCHEDULE, timestamps, kwh, duration_minutes=60)
+    vectorized = time.perf_counter() - started
+
+    started = time.perf_counter()
+    bills = monthly_bills(households, timestamps, kwh, SCHEDULE, duration_minutes=60)
+    billing = time.perf_counter() - started
+
+    sample = slice(0, args.naive_sample)
+    started = time.perf_counter()
+    expected = naive_price(SCHEDULE, timestamps[sample], kwh[sample], 60)
+    naive = time.perf_counter() - started
+
+    print(f"intervals:            {args.intervals}")
+    print(f"vectorized price:     {vectorized:.3f}s ({args.intervals / vectorized / 1e6:.1f}M intervals/s)")
+    print(f"monthly bills:        {billing:.3f}s ({len(bills['cost'])} household-months)")
+    print(f"naive loop:           {args.naive_sample / naive / 1e6:.3f}M intervals/s (on {args.naive_sample} rows)")
+    print(f"max abs difference:   {np.max(np.abs(costs[sample] - np.array(expected))):.2e}")
+    print(f"bill total matches:   {np.isclose(bills['cost'].sum(), costs.sum())}")
@@ -0,0 +1,241 @@
+'''
+In-Memory Columnar Store for Per-Appliance Power Data
+Loads every appliance series once (Kaggle household-appliances CSVs, the washing-machine
+sensor store, or built-in reference profiles when neither is available), keeps each as
+NumPy columns, and precomputes the aggregates served by /api/appliances.
+'''
+
+import glob
+import hashlib
+import os
+import re
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.compute as pc
+from data.pipelines.sensor_ingest import DEFAULT_SOURCE, ingest, load_store
+
+# Reference hourly profiles used when no real data is available for an appliance
+REFERENCE_PROFILES = {
+    "refrigerator": {
+        "power_consumption": [120, 125, 118, 122, 119],
+        "temperature": [4.2, 4.0, 4.1, 4.3, 4.2],
+        "door_openings": [2, 0, 1, 3, 2]
+    },
+    "dishwasher": {
+        "power_consumption": [1200, 1250, 0, 0, 1300],
+        "cycle_stage": ["wash", "rinse", "off", "off", "dry"],
+        "water_usage": [3.2, 2.5, 0, 0, 1.0]
+    },
+    "washing_machine": {
+        "power_consumption": [500, 1800, 2000, 700, 0],
+        "cycle": ["fill", "wash", "spin", "rinse", "off"],
+        "load_size": ["medium", "medium", "medium", "medium", "medium"]
+    },
+    "oven": {
+        "power_consumption": [0, 2400, 1800, 1900, 0],
+        "temperature": [0, 350, 350, 350, 0],
+        "door_openings": [0, 1, 0, 2, 1]
+    },
+    "air_conditioner": {
+        "power_consumption": [1200, 1250, 0, 1100, 1300],
+        "temperature_setting": [72, 72, 78, 74, 72],
+        "outside_temp": [85, 87, 80, 83, 88]
+    }
+}
+# Reference profiles are repeated hourly over this many days
+REFERENCE_DAYS = 7
+REFERENCE_START = np.datetime64("2023-01-01T00:00", "ms")
+
+PERCENTILES = (50, 90, 99)
+
+
+class ApplianceSeries:
+    def __init__(self, name: str, timestamps: np.ndarray, columns: dict, source: str):
+        """
+        One appliance's time series as parallel NumPy columns, with aggregates computed once.
+        :param timestamps: datetime64[ms] array, sorted.
+        :param columns: Column name -> array; must include "power_consumption" in watts.
+        :param source: Where the data came from ("kaggle", "sensor_store" or "reference").
+        """
+        self.name = name
+        self.timestamps = timestamps
+        self.columns = columns
+        self.source = source
+        self.aggregates = self._compute_aggregates()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _compute_aggregates(self) -> dict:
+        power = self.columns["power_consumption"].astype(np.float64)
+        valid = ~np.isnan(power)
+        power, timestamps = power[valid], self.timestamps[valid]
+        if not len(power):
+            return {"samples": 0}
+
+        hours = (timestamps.astype("datetime64[h]").astype(np.int64) % 24)
+        hourly_sum = np.bincount(hours, weights=power, minlength=24)
+        hourly_count = np.bincount(hours, minlength=24)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            hourly = hourly_sum / hourly_count
+
+        # Energy by trapezoidal integration over the actual sample spacing
+        seconds = (timestamps - timestamps[0]).astype(np.int64) / 1000.0
+        energy_kwh = float(np.sum((power[1:] + power[:-1]) * np.diff(seconds)) / 2 / 3.6e6)
+
+        return {
+            "samples": int(len(power)),
+            "start": str(timestamps[0]),
+            "end": str(timestamps[-1]),
+            "mean": round(float(power.mean()), 3),
+            "min": round(float(power.min()), 3),
+            "max": round(float(power.max()), 3),
+            "percentiles": {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, np.percentile(power, PERCENTILES))},
+            "hourly_profile": [None if np.isnan(v) else round(float(v), 3) for v in hourly],
+            "energy_kWh": round(energy_kwh, 4)
+        }
+
+    def records(self, indices: np.ndarray) -> list:
+        """
+        Row-oriented records for the given row indices, built straight from the columns.
+        """
+        names = ["timestamp"] + list(self.columns)
+        values = [np.datetime_as_string(self.timestamps[indices], unit="s").tolist()]
+        values += [self.columns[c][indices].tolist() for c in self.columns]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    def column_slice(self, indices: np.ndarray) -> dict:
+        """
+        Column-oriented rows: {"timestamps": epoch ms, "values": {column: array}}. The
+        arrays are NumPy slices, left for the response encoder to write directly.
+        """
+        return {
+            "timestamps": self.timestamps[indices].astype(np.int64),
+            "values": {c: self.columns[c][indices] for c in self.columns}
+        }
+
+
+class ApplianceStore:
+    def __init__(self, series: dict = None):
+        """
+        Collection of appliance series keyed by lower-case appliance name.
+        """
+        self.series = series or {}
+        self._averages = None
+        # Identifies the loaded data, e.g. for response ETags; the store never changes after loading
+        self.version = hashlib.blake2b(repr(sorted(
+            (name, s.source, len(s), str(s.timestamps[0]) if len(s) else None, s.aggregates.get("mean"))
+            for name, s in self.series.items()
+        )).encode(), digest_size=8).hexdigest()
+
+    @classmethod
+    def load(cls, kaggle_dir: str = None, sensor_store: str = None) -> "ApplianceStore":
+        """
+        Loads all available appliance data once. Real data takes precedence over the
+        reference profiles for the same appliance.
+        :param kaggle_dir: Directory of Kaggle household-appliances CSV files (optional).
+        :param sensor_store: Washing-machine parquet store from data.pipelines.sensor_ingest (optional).
+        """
+        series = {name: _reference_series(name, profile) for name, profile in REFERENCE_PROFILES.items()}
+        if sensor_store:
+            washer = _load_sensor_store(sensor_store)
+            if washer is not None:
+                series[washer.name] = washer
+        if kaggle_dir and os.path.isdir(kaggle_dir):
+            series.update(_load_kaggle_dir(kaggle_dir))
+        return cls(series)
+
+    def names(self) -> list:
+        return list(self.series)
+
+    def get(self, name: str) -> ApplianceSeries:
+        return self.series.get(name.lower()) if name else None
+
+    def averages(self) -> dict:
+        """
+        Appliance -> mean power, computed once.
+        """
+        if self._averages is None:
+            self._averages = {name: s.aggregates.get("mean") for name, s in self.series.items()}
+        return self._averages
+
+    def slice(self, name: str, limit: int, offset: int = 0, sample: bool = False, seed: int = None,
+              orient: str = "records"):
+        """
+        Returns rows for one appliance without materializing a DataFrame.
+        :param limit: Number of rows to return (any size up to the series length).
+        :param offset: First row when paging.
+        :param sample: Return `limit` rows drawn uniformly at random (in time order) instead of a page.
+        :param seed: Random seed for reproducible samples.
+        :param orient: "records" for a list of row dictionaries, "columns" for ApplianceSeries.column_slice.
+        """
+        series = self.series[name]
+        n = len(series)
+        limit = max(0, min(limit, n))
+        if sample:
+            indices = np.sort(np.random.default_rng(seed).choice(n, size=limit, replace=False))
+        else:
+            offset = max(0, min(offset, n))
+            indices = np.arange(offset, min(offset + limit, n))
+        return series.column_slice(indices) if orient == "columns" else series.records(indices)
+
+
+def _reference_series(name: str, profile: dict) -> ApplianceSeries:
+    hours = 24 * REFERENCE_DAYS
+    timestamps = REFERENCE_START + np.arange(hours, dtype=np.int64) * np.timedelta64(1, "h")
+    columns = {}
+    for column, values in profile.items():
+        columns[column] = np.resize(np.asarray(values), hours)
+    return ApplianceSeries(name, timestamps, columns, source="reference")
+
+
+def _load_sensor_store(store_dir: str) -> ApplianceSeries:
+    if not os.path.isdir(store_dir):
+        if not os.path.exists(DEFAULT_SOURCE):
+            return None
+        ingest(DEFAULT_SOURCE, store_dir)
+    table = load_store(store_dir, columns=["timestamp", "power", "energy", "temperature"])
+    table = table.filter(pc.invert(pc.is_null(table.column("power"), nan_is_null=True)))
+    # The store holds float32 grid means; round so responses do not carry float32 noise
+    column = lambda name: np.round(table.column(name).to_numpy().astype(np.float64), 4)
+    return ApplianceSeries(
+        "washing_machine",
+        table.column("timestamp").to_numpy().astype("datetime64[ms]"),
+        {
+            "power_consumption": column("power"),
+            "energy": column("energy"),
+            "temperature": column("temperature")
+        },
+        source="sensor_store"
+    )
+
+
+def _load_kaggle_dir(kaggle_dir: str) -> dict:
+    """
+    Reads every CSV in the Kaggle dataset directory. Files are named like tv_290.csv;
+    the numeric suffix is dropped and files for the same appliance are concatenated.
+    The first timestamp column is the time axis and the first numeric column is power (W).
+    """
+    grouped = {}
+    for path in sorted(glob.glob(os.path.join(kaggle_dir, "**", "*.csv"), recursive=True)):
+        table = pv.read_csv(path)
+        time_col = next((f.name for f in table.schema if pa.types.is_timestamp(f.type)), None)
+        power_col = next((f.name for f in table.schema
+                          if f.name != time_col and (pa.types.is_floating(f.type) or pa.types.is_integer(f.type))), None)
+        if time_col is None or power_col is None:
+            print(f"Skipping {path}: no timestamp/power columns found")
+            continue
+        name = re.sub(r"_\d+$", "", os.path.splitext(os.path.basename(path))[0]).lower()
+        grouped.setdefault(name, []).append((
+            pc.cast(table.column(time_col), pa.timestamp("ms"), safe=False).to_numpy().astype("datetime64[ms]"),
+            table.column(power_col).to_numpy(zero_copy_only=False).astype(np.float64)
+        ))
+
+    series = {}
+    for name, parts in grouped.items():
+        timestamps = np.concatenate([p[0] for p in parts])
+        power = np.concatenate([p[1] for p in parts])
+        order = np.argsort(timestamps, kind="stable")
+        series[name] = ApplianceSeries(name, timestamps[order], {"power_consumption": power[order]}, source="kaggle")
+    return series
@@ -0,0 +1,345 @@
+'''
+Bounded In-Memory Cache for Upstream API Responses
+Used by the API wrappers to avoid repeating identical upstream round-trips.
+'''
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from data.instrumentation import bind, debug, record_cache
+
+
+def ttl_from_headers(headers, default_ttl=None):
+    """
+    Derives a cache lifetime in seconds from HTTP caching headers.
+    Honors Cache-Control (no-store/no-cache/max-age/s-maxage) first, then Expires.
+    :param headers: Mapping of response headers (case-insensitive mappings are fine).
+    :param default_ttl: Lifetime to use when the headers say nothing.
+    :return: TTL in seconds (0 means do not cache).
+    """
+    cache_control = headers.get("Cache-Control") or headers.get("cache-control") or ""
+    directives = {}
+    for part in cache_control.split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip().strip('"')
+
+    if "no-store" in directives or "no-cache" in directives:
+        return 0
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(0, int(directives[name]))
+            except ValueError:
+                pass
+
+    expires = headers.get("Expires") or headers.get("expires")
+    if expires:
+        try:
+            expires_at = parsedate_to_datetime(expires)
+            date_header = headers.get("Date") or headers.get("date")
+            now = parsedate_to_datetime(date_header) if date_header else datetime.now(timezone.utc)
+            return max(0, int((expires_at - now).total_seconds()))
+        except (TypeError, ValueError):
+            return 0
+
+    return default_ttl
+
+
+def estimate_size(value) -> int:
+    """
+    Rough memory footprint of a cached value, in bytes.
+    JSON payloads are sized by their serialized length, everything else by sys.getsizeof.
+    """
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    try:
+        return len(json.dumps(value, separators=(",", ":")))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class _Pending:
+    """
+    A load in progress for one key. Callers that miss on the same key wait on it
+    instead of issuing their own upstream request.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    def __init__(self, name: str, max_bytes: int = 8 * 1024 * 1024, default_ttl: float = None,
+                 stale_ttl: float = 0, negative_ttl: float = 0):
+        """
+        Thread-safe LRU cache with per-entry expiry and a memory cap.
+        :param name: Name reported with the stats.
+        :param max_bytes: Approximate memory cap; least recently used entries are evicted past it.
+        :param default_ttl: Lifetime in seconds for entries stored without one (None = never expires).
+        :param stale_ttl: Seconds past expiry during which get_or_revalidate_async still serves an
+            entry (marked stale) while refreshing it in the background. Covers upstream outages
+            of up to this length.
+        :param negative_ttl: Lifetime in seconds of None results from loaders (a location
+            upstream knows nothing about), so they are not requested again on every lookup.
+            0 leaves them uncached.
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._inflight = {}
+        self._inflight_async = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_served = 0
+        self.revalidations = 0
+        self.revalidation_failures = 0
+        self._tasks = set()
+
+    def _pop(self, key):
+        value, expires_at, size = self._entries.pop(key)
+        self._bytes -= size
+        return value
+
+    def _lookup(self, key, now, allow_stale=False):
+        """
+        Returns (found, value, stale) and refreshes the entry's LRU position. Expired
+        entries are kept for stale_ttl, but only returned when allow_stale is set.
+        Caller holds the lock.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None, False
+        value, expires_at, size = entry
+        stale = expires_at is not None and expires_at <= now
+        if stale:
+            if expires_at + self.stale_ttl <= now:
+                self._pop(key)
+                self.expirations += 1
+                return False, None, False
+            if not allow_stale:
+                return False, None, False
+        self._entries.move_to_end(key)
+        return True, value, stale
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for a key, or default when missing or expired.
+        """
+        with self._lock:
+            found, value, _ = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        record_cache(self.name, "hit" if found else "miss")
+        return value if found else default
+
+    def set(self, key, value, ttl: float = None, size: int = None):
+        """
+        Stores a value, evicting least recently used entries to stay under the memory cap.
+        :param ttl: Lifetime in seconds; falls back to default_ttl. A TTL of 0 skips caching.
+        :param size: Precomputed size in bytes (estimated when omitted).
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+        if ttl is not None and ttl <= 0:
+            return
+        if size is None:
+            size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+                self.evictions += 1
+
+    def _store(self, key, value, ttl):
+        """
+        Stores a loader's result; None results only for negative_ttl.
+        """
+        if value is None:
+            self.set(key, None, self.negative_ttl, size=64)
+        else:
+            self.set(key, value, ttl)
+
+    def invalidate(self, key):
+        """
+        Removes a key if present.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value, or calls loader() to produce it. Concurrent misses on
+        the same key share a single loader call.
+        :param loader: Callable returning (value, ttl). A None value is cached for negative_ttl.
+        :return: The cached or freshly loaded value.
+        """
+        with self._lock:
+            found, value, _ = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+            else:
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = _Pending()
+                    self._inflight[key] = pending
+                    leader = True
+                    self.misses += 1
+                else:
+                    leader = False
+                    self.coalesced += 1
+        record_cache(self.name, "hit" if found else "miss" if leader else "coalesced")
+        if found:
+            return value
+
+        if not leader:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            value, ttl = loader()
+            self._store(key, value, ttl)
+            pending.value = value
+            return value
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.event.set()
+
+    async def get_or_load_async(self, key, loader):
+        """
+        Async counterpart of get_or_load. Concurrent misses on the same key within an
+        event loop await one shared loader call.
+        :param loader: Coroutine function returning (value, ttl).
+        """
+        value, _ = await self.get_or_revalidate_async(key, loader)
+        return value
+
+    async def get_or_revalidate_async(self, key, loader) -> tuple:
+        """
+        Stale-while-revalidate lookup. A fresh entry is returned as is; an entry expired
+        less than stale_ttl ago is returned at once, marked stale, and reloaded in the
+        background (one reload per key; a failed reload keeps the stale entry). Anything
+        else is loaded as in get_or_load_async.
+        :param loader: Coroutine function returning (value, ttl).
+        :return: Tuple (value, stale).
+        """
+        loop = asyncio.get_running_loop()
+        inflight_key = (id(loop), key)
+        revalidate = None
+        with self._lock:
+            found, value, stale = self._lookup(key, time.monotonic(), allow_stale=True)
+            if found:
+                if stale:
+                    self.stale_served += 1
+                    if inflight_key not in self._inflight_async:
+                        revalidate = self._inflight_async[inflight_key] = loop.create_future()
+                else:
+                    self.hits += 1
+            else:
+                future = self._inflight_async.get(inflight_key)
+                if future is None:
+                    future = loop.create_future()
+                    self._inflight_async[inflight_key] = future
+                    leader = True
+                    self.misses += 1
+                else:
+                    leader = False
+                    self.coalesced += 1
+        record_cache(self.name, ("stale" if stale else "hit") if found else "miss" if leader else "coalesced")
+        if found:
+            if revalidate is not None:
+                # Detached from the request that noticed the entry was stale
+                task = loop.create_task(bind(self._revalidate(key, inflight_key, revalidate, loader), None))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value, stale
+
+        if not leader:
+            return await asyncio.shield(future), False
+
+        try:
+            value, ttl = await loader()
+            self._store(key, value, ttl)
+            future.set_result(value)
+            return value, False
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve the exception so an unobserved future does not log a warning
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._inflight_async.pop(inflight_key, None)
+
+    async def _revalidate(self, key, inflight_key, future, loader):
+        try:
+            value, ttl = await loader()
+            self._store(key, value, ttl)
+            future.set_result(value)
+            self.revalidations += 1
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            self.revalidation_failures += 1
+            debug(f"Revalidating {self.name} entry {key!r} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._inflight_async.pop(inflight_key, None)
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss/eviction counters and current occupancy.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_served": self.stale_served,
+                "revalidations": self.revalidations,
+                "revalidation_failures": self.revalidation_failures,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,113 @@
+'''
+Per-Upstream Circuit Breaker
+Stops sending requests to an upstream (NWS, NREL, EIA) that is failing, so a brownout
+costs callers milliseconds instead of timeouts and retries. After a cool-down a single
+probe request is let through; its outcome closes the breaker or opens it again.
+'''
+
+import threading
+import time
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate: float = 0.5, min_requests: int = 10, window: float = 30.0,
+                 open_seconds: float = 30.0):
+        """
+        :param name: Upstream the breaker guards (reported with the stats).
+        :param failure_rate: Fraction of failed attempts within the window that opens the breaker.
+        :param min_requests: Attempts needed in the window before the failure rate is acted on.
+        :param window: Seconds of attempt outcomes considered.
+        :param open_seconds: Seconds the breaker stays open before a half-open probe.
+        """
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque()  # (timestamp, failed)
+        self._failures = 0
+        self._opened_at = None
+        self._probing_since = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    def _trim(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def allow(self) -> bool:
+        """
+        :return: Whether a request may be sent now. In the half-open state only one
+            probe is allowed at a time.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probing_since = None
+            if self.state == CLOSED:
+                return True
+            # A probe that never reported back (e.g. cancelled) is replaced after a cool-down
+            if self.state == HALF_OPEN and (self._probing_since is None or
+                                            now - self._probing_since >= self.open_seconds):
+                self._probing_since = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, failed: bool):
+        """
+        Records the outcome of one attempt: a network failure, timeout or retryable
+        status counts as failed; other statuses (including 4xx) as healthy.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing_since = None
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                return
+            if self.state == OPEN:
+                # A request sent before the breaker opened
+                return
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            self._trim(now)
+            if len(self._outcomes) >= self.min_requests and self._failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self.opened += 1
+
+    def retry_in(self) -> float:
+        """
+        :return: Seconds until the next probe is allowed (0 when not open).
+        """
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "name": self.name,
+                "state": self.state,
+                "window_requests": len(self._outcomes),
+                "window_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected
+            }
@@ -4,43 +4,164 @@ API Information: https://developer.nrel.gov/docs/electricity/utility-rates-v3/
 
 '''
 
-import requests
+import asyncio
 import json
+import re
 from dotenv import load_dotenv
 import os
+from data.api_wrappers.cache import TTLCache
+from data.api_wrappers.http_client import UpstreamError, get_client
+from data.api_wrappers.rate_cache import DEFAULT_RATE_TTL
+from data.instrumentation import stage
+
+# "No rate data" answers are cached briefly in case NREL fills the gap
+NOT_FOUND_TTL = 24 * 3600
+# Upper bound on how long a worker serves a rate from memory before rechecking the shared store
+MEMORY_RATE_TTL = 3600
+# How long past expiry a rate is still served (marked stale) while NREL is unreachable
+DEFAULT_RATE_STALE_TTL = 7 * 24 * 3600
+# An expired rate served because NREL failed is retried after this long
+STALE_RATE_RETRY_TTL = 300
+
+def normalize_address(address: str) -> str:
+    """
+    Canonical form of an address for de-duplicating lookups: upper case, no
+    punctuation, single spaces. A bare ZIP (or ZIP+4) reduces to the 5-digit ZIP.
+    """
+    normalized = re.sub(r"[^\w\s-]", " ", address.upper())
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    if re.fullmatch(r"\d{5}(-\d{4})?", normalized):
+        return normalized[:5]
+    return normalized
+
+def rate_query(address: str) -> tuple:
+    """
+    Reduces an address to the geographic key its rate is cached under, and the NREL
+    query for that key. Rates are set per utility territory, so every street address
+    in a ZIP code shares one lookup (made for the ZIP itself); "lat,lon" input is
+    rounded to 0.01 degrees (about 1 km). Addresses without a ZIP fall back to their
+    normalized text.
+    :return: Tuple (cache key, NREL query params).
+    """
+    coordinates = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*", address)
+    if coordinates:
+        lat, lon = (round(float(v), 2) for v in coordinates.groups())
+        return f"coord:{lat:.2f},{lon:.2f}", {"lat": lat, "lon": lon}
+    normalized = normalize_address(address)
+    # Matched on the raw text: five digits after a "." or "," are a fraction, not a ZIP
+    zipcode = re.search(r"(?:^|[^\w.,-])(\d{5})(?:-\d{4})?(?:[\s,]+USA?)?[\s.]*$", address.upper())
+    if zipcode:
+        return f"zip:{zipcode.group(1)}", {"address": zipcode.group(1)}
+    return f"address:{normalized}", {"address": address}
 
 class UtilityRatesFetcher:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, client=None, on_fetch=None, rate_cache=None, memory_cache_bytes: int = None):
         """
         Initializes the UtilityRatesFetcher with an API key.
         :param api_key: API key for the NREL Utility Rates API.
+        :param client: AsyncHttpClient to use (defaults to the shared client).
+        :param on_fetch: Optional callback receiving each rate fetched from upstream (not cache hits).
+        :param rate_cache: RateCache shared across workers and restarts (optional).
+        :param memory_cache_bytes: Memory cap for the per-process rate cache in front of it.
         """
         self.api_key = api_key
+        self.client = client or get_client()
+        self.on_fetch = on_fetch
+        self.rate_cache = rate_cache
+        self.memory_cache = TTLCache(
+            "utility_rates",
+            max_bytes=memory_cache_bytes or int(os.getenv("RATE_MEMORY_CACHE_BYTES", 4 * 1024 * 1024)),
+            stale_ttl=float(os.getenv("RATE_STALE_TTL", DEFAULT_RATE_STALE_TTL))
+        )
         self.base_url = "https://developer.nrel.gov/api/utility_rates/v3.json"
 
-    def get_residential_rate(self, address: str) -> dict:
+    async def get_residential_rate_async(self, address: str) -> dict:
         """
-        Fetches the residential electricity rate for a given ZIP code.
-        :param address: ZIP code for the location.
+        Fetches the residential electricity rate for an address, ZIP code or "lat,lon".
+        Lookups are keyed geographically (see rate_query) and served from the memory
+        and persistent caches while fresh; concurrent misses share one NREL request.
+        Expired rates are served with "stale": True while they are refreshed, or while
+        NREL is failing.
+        :param address: Address, ZIP code or coordinates for the location.
         :return: Dictionary containing the utility name and residential rate.
         """
+        key, query = rate_query(address)
+        result, stale = await self.memory_cache.get_or_revalidate_async(key, lambda: self._load_rate(key, query))
+        return {**result, "stale": True} if stale else dict(result)
+
+    async def _load_rate(self, key: str, query: dict) -> tuple:
+        if self.rate_cache is not None:
+            with stage("rate_store"):
+                cached = await self._rate_store(self.rate_cache.get, key)
+            if cached is not None:
+                result, remaining = cached
+                return result, min(remaining, MEMORY_RATE_TTL)
+
+        result, ttl = await self._fetch_rate(query)
+        if ttl == 0 and self.rate_cache is not None:
+            # NREL failed: an expired rate beats no rate
+            expired = await self._rate_store(self.rate_cache.get, key, True)
+            if expired is not None:
+                return {**expired[0], "stale": True}, STALE_RATE_RETRY_TTL
+        if self.rate_cache is not None:
+            await self._rate_store(self.rate_cache.set, key, result, ttl)
+        return result, min(ttl, MEMORY_RATE_TTL)
+
+    @staticmethod
+    async def _rate_store(method, *args):
+        """
+        Runs a RateCache call on the default executor. RateCache is a SQLite file that
+        can block on another worker's write lock (up to its 5 s timeout), which must
+        not stall every other request sharing the event loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def _fetch_rate(self, query: dict) -> tuple:
+        """
+        :return: Tuple (result, ttl); failed requests get a TTL of 0 so they are not cached.
+        """
         params = {
             "api_key": self.api_key,
-            "address": address,
+            **query
         }
-        response = requests.get(self.base_url, params=params)
+        try:
+            with stage("rate_fetch"):
+                response = await self.client.get(self.base_url, params=params)
+        except UpstreamError as e:
+            return {"error": f"API request failed: {str(e)}"}, 0
         
         if response.status_code == 200:
             data = response.json()
             if "outputs" in data and "residential" in data["outputs"]:
-                return {
+                result = {
                     "utility_name": data["outputs"].get("utility_name", "Unknown"),
                     "residential_rate": data["outputs"]["residential"]
                 }
+                if self.on_fetch:
+                    try:
+                        self.on_fetch(result)
+                    except Exception as e:
+                        print(f"on_fetch callback failed: {str(e)}")
+                return result, DEFAULT_RATE_TTL
             else:
-                return {"error": "No residential rate data available."}
+                return {"error": "No residential rate data available."}, NOT_FOUND_TTL
         else:
-            return {"error": f"API request failed with status code {response.status_code}"}
+            return {"error": f"API request failed with status code {response.status_code}"}, 0
+
+    def get_cache_stats(self) -> dict:
+        """
+        Returns counters for the in-memory and persistent rate caches.
+        """
+        return {
+            "memory": self.memory_cache.stats(),
+            "persistent": self.rate_cache.stats() if self.rate_cache is not None else None
+        }
+
+    def get_residential_rate(self, address: str) -> dict:
+        """
+        Blocking wrapper around get_residential_rate_async.
+        """
+        return self.client.run(self.get_residential_rate_async(address))
 
 if __name__ == "__main__":
     # Load the NREL API key from the .env file
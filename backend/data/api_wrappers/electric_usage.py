@@ -3,73 +3,133 @@ Electricity Usage Data Fetcher
 API Information: https://www.eia.gov/opendata/qb.php?category=2251605
 '''
 
-import requests
+import asyncio
 import json
 from dotenv import load_dotenv
 import os
 from datetime import datetime, timedelta
+from data.api_wrappers.http_client import UpstreamError, get_client
+from data.instrumentation import stage
+
+# Facet values of the electricity/retail-sales dataset
+EIA_STATES = (
+    "AK", "AL", "AR", "AZ", "CA", "CO", "CT", "DC", "DE", "FL", "GA", "HI", "IA", "ID", "IL", "IN", "KS",
+    "KY", "LA", "MA", "MD", "ME", "MI", "MN", "MO", "MS", "MT", "NC", "ND", "NE", "NH", "NJ", "NM", "NV",
+    "NY", "OH", "OK", "OR", "PA", "RI", "SC", "SD", "TN", "TX", "UT", "VA", "VT", "WA", "WI", "WV", "WY", "US"
+)
+EIA_SECTORS = ("ALL", "RES", "COM", "IND", "TRA", "OTH")
+# Largest page the v2 API returns for JSON requests
+EIA_MAX_PAGE = 5000
 
 class EIADataFetcher:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, client=None, on_fetch=None):
         """
         Initializes the EIADataFetcher with the EIA API key.
         Uses the v2 API endpoints.
+        :param client: AsyncHttpClient to use (defaults to the shared client).
+        :param on_fetch: Optional callback receiving each successful result.
         """
         self.api_key = api_key
+        self.client = client or get_client()
+        self.on_fetch = on_fetch
         self.base_url = "https://api.eia.gov/v2"
-    
-    def get_historical_electricity_usage(self, location_data: dict) -> dict:
+
+    async def get_retail_sales_page_async(self, states, sectors, start: str = None, end: str = None,
+                                          offset: int = 0, length: int = EIA_MAX_PAGE) -> dict:
         """
-        Fetches historical electricity usage data using the EIA v2 API.
-        
-        :param location_data: Dictionary containing location details
-        :return: Dictionary containing historical electricity usage data
+        Fetches one page of monthly retail sales.
+        :param states: State ids to include (facet values, e.g. ["FL", "GA"]).
+        :param sectors: Sector ids to include (e.g. ["ALL", "RES"]).
+        :param start: First period ("YYYY-MM"), or None for the earliest available.
+        :param end: Last period ("YYYY-MM"), or None for the latest available.
+        :return: Dictionary with "data" (records) and "total" (records across all pages).
         """
-        # For Tampa, FL we'll use the state facet for Florida
         params = {
             "api_key": self.api_key,
             "frequency": "monthly",
-            "data[]": "sales",  # Get electricity sales data
-            "facets[stateid][]": "FL",  # Florida
-            "facets[sectorid][]": "ALL",  # All sectors
-            "start": "2023-01",
-            "end": "2023-12",
+            "data[]": "sales",
+            "facets[stateid][]": list(states),
+            "facets[sectorid][]": list(sectors),
+            "start": start,
+            "end": end,
+            # A total order keeps offset paging stable across concurrent page requests
             "sort[0][column]": "period",
-            "sort[0][direction]": "desc"
+            "sort[0][direction]": "asc",
+            "sort[1][column]": "stateid",
+            "sort[1][direction]": "asc",
+            "sort[2][column]": "sectorid",
+            "sort[2][direction]": "asc",
+            "offset": offset,
+            "length": length
         }
+        with stage("retail_sales_fetch"):
+            response = await self.client.get(f"{self.base_url}/electricity/retail-sales/data", params=params)
+        response.raise_for_status()
+        data = response.json()
+        if "response" not in data:
+            raise UpstreamError("Unexpected API response format", status_code=response.status_code, url=response.url)
+        return {
+            "data": data["response"].get("data", []),
+            "total": int(data["response"].get("total", 0))
+        }
+
+    async def get_retail_sales_async(self, states, sectors, start: str = None, end: str = None,
+                                     page_size: int = EIA_MAX_PAGE) -> list:
+        """
+        Fetches every page of monthly retail sales: the first page reports the total,
+        the remaining pages are requested concurrently.
+        :return: Records ordered by period, state and sector.
+        """
+        first = await self.get_retail_sales_page_async(states, sectors, start, end, 0, page_size)
+        pages = await asyncio.gather(*(
+            self.get_retail_sales_page_async(states, sectors, start, end, offset, page_size)
+            for offset in range(page_size, first["total"], page_size)
+        ))
+        return first["data"] + [record for page in pages for record in page["data"]]
+
+    async def get_historical_electricity_usage_async(self, location_data: dict, start: str = None,
+                                                     end: str = None, sector: str = "ALL") -> dict:
+        """
+        Fetches historical electricity usage data using the EIA v2 API.
         
+        :param location_data: Dictionary containing location details ("state" selects the state facet)
+        :param start: First period ("YYYY-MM"); defaults to twelve months ago
+        :param end: Last period ("YYYY-MM"); defaults to the latest available
+        :param sector: Sector id ("ALL", "RES", "COM", "IND", "TRA" or "OTH")
+        :return: Dictionary containing historical electricity usage data, newest period first
+        """
+        state = (location_data.get("state") or "FL").upper()
+        start = start or (datetime.now() - timedelta(days=365)).strftime("%Y-%m")
+
         try:
-            # Using the retail-sales endpoint as specified in the documentation
-            response = requests.get(
-                f"{self.base_url}/electricity/retail-sales/data",
-                params=params
-            )
-            
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if "response" in data:
-                return {
-                    "success": True,
-                    "data": data["response"].get("data", []),
-                    "total_records": data["response"].get("total", 0)
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": "Unexpected API response format",
-                    "raw_response": data
-                }
+            records = await self.get_retail_sales_async([state], [sector], start, end)
+            result = {
+                "success": True,
+                "data": records[::-1],
+                "total_records": len(records)
+            }
+            if self.on_fetch:
+                try:
+                    self.on_fetch(result)
+                except Exception as e:
+                    print(f"on_fetch callback failed: {str(e)}")
+            return result
                 
-        except requests.exceptions.RequestException as e:
+        except UpstreamError as e:
             return {
                 "success": False,
                 "error": f"API request failed: {str(e)}",
-                "status_code": getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None,
-                "url": e.response.url if hasattr(e, 'response') else None
+                "status_code": e.status_code,
+                "url": e.url
             }
 
+    def get_historical_electricity_usage(self, location_data: dict, start: str = None, end: str = None,
+                                         sector: str = "ALL") -> dict:
+        """
+        Blocking wrapper around get_historical_electricity_usage_async.
+        """
+        return self.client.run(self.get_historical_electricity_usage_async(location_data, start, end, sector))
+
 if __name__ == "__main__":
     load_dotenv()
     eia_api_key = os.getenv("eia_api_key")
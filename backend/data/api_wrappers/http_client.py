@@ -0,0 +1,315 @@
+'''
+Shared Upstream HTTP Client
+One pooled aiohttp session (keep-alive, per-host connection limits) running on a
+background event loop. Async callers await it directly; the sync fetcher methods
+submit coroutines to the loop and wait for the result.
+'''
+
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import aiohttp
+from data.api_wrappers.circuit_breaker import CircuitBreaker
+from data.instrumentation import bind, current_trace, record_upstream
+
+# Statuses worth retrying: throttling and transient server-side failures
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class UpstreamError(Exception):
+    def __init__(self, message: str, status_code: int = None, url: str = None):
+        """
+        Raised when an upstream request fails after all retries.
+        :param status_code: HTTP status of the last response, or None for network errors.
+        :param url: URL of the failed request.
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.url = url
+
+
+class CircuitOpenError(UpstreamError):
+    """
+    Raised without contacting the upstream while its circuit breaker is open.
+    """
+
+
+class HttpResponse:
+    def __init__(self, status_code: int, headers: dict, url: str, content: bytes, attempts: int = 1):
+        """
+        Fully-read upstream response, safe to use after the connection is released.
+        """
+        self.status_code = status_code
+        self.headers = headers
+        self.url = url
+        self.content = content
+        self.attempts = attempts
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise UpstreamError(
+                f"{self.status_code} error for url: {self.url}",
+                status_code=self.status_code,
+                url=self.url
+            )
+
+
+class AsyncHttpClient:
+    def __init__(self, max_connections: int = 100, per_host_limit: int = 20, timeout: float = 10,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0, transport=None,
+                 breaker_options: dict = None):
+        """
+        Pooled HTTP client with non-blocking retries.
+        :param max_connections: Total open connections across all hosts.
+        :param per_host_limit: Concurrent connections allowed to any single host.
+        :param timeout: Default total timeout per attempt, in seconds.
+        :param max_retries: Attempts per request, including the first.
+        :param backoff_base: Base delay for exponential backoff, in seconds.
+        :param backoff_max: Upper bound on a single backoff delay, in seconds.
+        :param transport: Optional stand-in for the network (see data.api_wrappers.replay): an object
+            with async send(method, url, params, headers, timeout, upstream) -> HttpResponse, where
+            upstream is the coroutine function that performs the real request.
+        :param breaker_options: Keyword arguments for each upstream host's CircuitBreaker.
+        """
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.transport = transport
+        self.breaker_options = breaker_options or {}
+        self.breakers = {}
+        self._loop = None
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Starts the background event loop thread. Restarted after a fork, since the
+        thread and its sockets do not survive into child processes.
+        """
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._session = None
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name="upstream-http", daemon=True)
+                thread.start()
+            return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Only called on the client loop, so no locking is needed
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host_limit)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _backoff(self, attempt: int, retry_after: str = None) -> float:
+        """
+        Exponential backoff with full jitter, or the server's Retry-After when given.
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def breaker_for(self, url: str) -> CircuitBreaker:
+        """
+        Returns the circuit breaker of the URL's host, one per upstream.
+        """
+        host = urlsplit(url).hostname or "unknown"
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers.setdefault(host, CircuitBreaker(host, **self.breaker_options))
+        return breaker
+
+    def breaker_stats(self) -> dict:
+        return {host: breaker.stats() for host, breaker in list(self.breakers.items())}
+
+    async def _send(self, method: str, url: str, params: list, headers: dict, timeout: float) -> HttpResponse:
+        """
+        One attempt over the network.
+        """
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with self._get_session().request(method, url, params=params, headers=headers,
+                                               timeout=client_timeout) as resp:
+            content = await resp.read()
+            return HttpResponse(resp.status, dict(resp.headers), str(resp.url), content)
+
+    async def _request(self, method: str, url: str, params: dict, headers: dict, timeout: float,
+                       retries: int) -> HttpResponse:
+        # List values repeat the key (e.g. EIA facets: facets[stateid][]=FL&facets[stateid][]=GA)
+        params = [(k, str(item)) for k, v in (params or {}).items() if v is not None
+                  for item in (v if isinstance(v, (list, tuple)) else [v])]
+        timeout = timeout or self.timeout
+        retries = retries or self.max_retries
+        breaker = self.breaker_for(url)
+        started = time.perf_counter()
+        response = None
+
+        for attempt in range(retries):
+            if not breaker.allow():
+                # Fail fast; a retry that finds the breaker open returns what the upstream last said
+                if response is not None:
+                    record_upstream(url, response.status_code, attempt, time.perf_counter() - started)
+                    return response
+                record_upstream(url, "circuit_open", attempt, time.perf_counter() - started)
+                raise CircuitOpenError(
+                    f"{breaker.name} is unavailable (circuit open, next probe in {breaker.retry_in():.0f}s)",
+                    url=url
+                )
+            try:
+                if self.transport is not None:
+                    response = await self.transport.send(method, url, params, headers, timeout, self._send)
+                else:
+                    response = await self._send(method, url, params, headers, timeout)
+                response.attempts = attempt + 1
+                breaker.record(response.status_code in RETRYABLE_STATUSES)
+                if response.status_code not in RETRYABLE_STATUSES or attempt == retries - 1:
+                    record_upstream(url, response.status_code, attempt + 1, time.perf_counter() - started)
+                    return response
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                breaker.record(True)
+                if attempt == retries - 1:
+                    record_upstream(url, "error", retries, time.perf_counter() - started)
+                    raise UpstreamError(
+                        f"Request to {url} failed after {retries} attempts: {str(e) or type(e).__name__}",
+                        url=url
+                    ) from e
+                delay = self._backoff(attempt)
+            await asyncio.sleep(delay)
+
+    async def request(self, method: str, url: str, params: dict = None, headers: dict = None,
+                      timeout: float = None, retries: int = None) -> HttpResponse:
+        """
+        Sends a request with retries and returns the fully-read response.
+        Network failures raise UpstreamError once retries are exhausted; HTTP error
+        statuses are returned, so callers decide via raise_for_status().
+        Can be awaited from any event loop; the work always runs on the client loop.
+        """
+        loop = self._ensure_loop()
+        coro = self._request(method, url, params, headers, timeout, retries)
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(bind(coro, current_trace()), loop))
+
+    async def get(self, url: str, params: dict = None, headers: dict = None,
+                  timeout: float = None, retries: int = None) -> HttpResponse:
+        return await self.request("GET", url, params=params, headers=headers, timeout=timeout, retries=retries)
+
+    def run(self, coro):
+        """
+        Runs a coroutine on the client loop and blocks until it finishes.
+        This is how the sync fetcher methods wrap their async counterparts. Stage and
+        upstream timings are recorded against the calling request.
+        """
+        loop = self._ensure_loop()
+        if _running_loop() is loop:
+            coro.close()
+            raise RuntimeError("AsyncHttpClient.run() cannot be called from the client event loop")
+        return asyncio.run_coroutine_threadsafe(bind(coro, current_trace()), loop).result()
+
+    def spawn(self, coro):
+        """
+        Starts a coroutine on the client loop without waiting for it (e.g. a long-lived
+        background refresher).
+        :return: concurrent.futures.Future; cancelling it cancels the task.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def call_later(self, delay: float, callback):
+        """
+        Runs a plain callback on the client loop after delay seconds.
+        """
+        loop = self._ensure_loop()
+        loop.call_soon_threadsafe(loop.call_later, delay, callback)
+
+    def run_as_completed(self, coros):
+        """
+        Runs coroutines concurrently on the client loop and yields their futures in
+        completion order, so sync callers (e.g. streaming responses) can emit each
+        result as soon as it is ready. Unfinished work is cancelled if the caller stops early.
+        :param coros: Iterable of coroutines.
+        :return: Generator of concurrent.futures.Future objects; call .result() on each.
+        """
+        loop = self._ensure_loop()
+        done = queue.Queue()
+        trace = current_trace()
+        futures = [asyncio.run_coroutine_threadsafe(bind(coro, trace), loop) for coro in coros]
+        for future in futures:
+            future.add_done_callback(done.put)
+        try:
+            for _ in futures:
+                yield done.get()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        """
+        Closes the pooled session and stops the background loop.
+        """
+        with self._lock:
+            loop, session = self._loop, self._session
+            self._loop = self._session = None
+        if loop is None:
+            return
+        if session is not None and self._pid == os.getpid():
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> AsyncHttpClient:
+    """
+    Returns the process-wide client shared by all API wrappers.
+    Pool sizes come from UPSTREAM_MAX_CONNECTIONS and UPSTREAM_PER_HOST_LIMIT.
+    UPSTREAM_RECORD_DIR records every upstream response as a fixture; UPSTREAM_REPLAY_DIR
+    serves recorded fixtures instead of the network (see data.api_wrappers.replay).
+    Per-host circuit breakers are tuned with UPSTREAM_BREAKER_FAILURE_RATE, _MIN_REQUESTS,
+    _WINDOW and _OPEN_SECONDS.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Imported here: replay builds on this module
+            from data.api_wrappers.replay import transport_from_env
+            _client = AsyncHttpClient(
+                max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 100)),
+                per_host_limit=int(os.getenv("UPSTREAM_PER_HOST_LIMIT", 20)),
+                transport=transport_from_env(),
+                breaker_options={
+                    "failure_rate": float(os.getenv("UPSTREAM_BREAKER_FAILURE_RATE", 0.5)),
+                    "min_requests": int(os.getenv("UPSTREAM_BREAKER_MIN_REQUESTS", 10)),
+                    "window": float(os.getenv("UPSTREAM_BREAKER_WINDOW", 30)),
+                    "open_seconds": float(os.getenv("UPSTREAM_BREAKER_OPEN_SECONDS", 30))
+                }
+            )
+        return _client
@@ -3,24 +3,46 @@ Kaggle API Wrapper for Household Appliances Power Consumption
 Dataset: ecoco2/household-appliances-power-consumption
 '''
 
+import glob
 import os
-import pandas as pd
 import kagglehub
 from dotenv import load_dotenv
+from data.api_wrappers.appliance_store import ApplianceStore
+from data.instrumentation import stage
+from data.pipelines.sensor_ingest import DEFAULT_STORE
 
 class KaggleAppliancesAPI:
-    def __init__(self):
+    def __init__(self, data_dir: str = None, sensor_store: str = DEFAULT_STORE):
         """
         Initialize the Kaggle API wrapper for household appliances power consumption data.
         Requires KAGGLE_USERNAME and KAGGLE_KEY environment variables to be set.
+        All appliance data is loaded into memory once, here, and served from there.
+        :param data_dir: Directory with the downloaded dataset CSVs (defaults to KAGGLE_APPLIANCES_DIR,
+                         then the kagglehub download cache).
+        :param sensor_store: Washing-machine parquet store built by data.pipelines.sensor_ingest.
         """
         load_dotenv()
         self.dataset_name = "ecoco2/household-appliances-power-consumption"
-        self.dataset_path = None
+        self.dataset_path = data_dir or os.environ.get("KAGGLE_APPLIANCES_DIR") or self._find_downloaded_dataset()
         
         # Verify that Kaggle credentials are set
         self._verify_credentials()
+
+        self.store = ApplianceStore.load(kaggle_dir=self.dataset_path, sensor_store=sensor_store)
+        self._average_response = {
+            "appliances": self.store.averages(),
+            "unit": "watts"
+        }
     
+    def _find_downloaded_dataset(self):
+        """
+        Returns the newest kagglehub download of the dataset, if one exists locally
+        """
+        pattern = os.path.join(os.path.expanduser("~"), ".cache", "kagglehub", "datasets",
+                               *self.dataset_name.split("/"), "versions", "*")
+        versions = sorted(glob.glob(pattern), key=lambda p: int(os.path.basename(p)) if os.path.basename(p).isdigit() else -1)
+        return versions[-1] if versions else None
+
     def _verify_credentials(self):
         """
         Verify that Kaggle credentials are properly set
@@ -44,100 +66,64 @@ class KaggleAppliancesAPI:
         
         return "Dataset path not available (download not performed)"
 
-    def get_appliance_data(self, appliance_name=None, sample_size=5):
+    def get_appliance_data(self, appliance_name=None, sample_size=5, offset=0, sample=False, orient="records"):
         """
         Get power consumption data for a specific appliance or all appliances.
-        Returns a sample of the data rather than downloading the full dataset.
+        Rows are sliced from the preloaded columnar store; no frames are built per request.
         
         :param appliance_name: Name of the appliance to get data for (optional)
-        :param sample_size: Number of sample rows to return
+        :param sample_size: Number of rows to return per appliance
+        :param offset: First row to return, for paging
+        :param sample: Return a random sample of rows (in time order) instead of a page
+        :param orient: "records" (list of rows) or "columns" ({"timestamps": [...], "values": {...}}
+                       with NumPy arrays, for data.responses.json_response)
         :return: Dictionary with appliance data information
         """
-        # Since we don't want to download the actual data, return mock data
-        # This mimics what we would do with real data but uses mock data instead
+        series = self.store.get(appliance_name)
         
-        # Define mock data for common appliances
-        mock_data = {
-            "refrigerator": pd.DataFrame({
-                "timestamp": pd.date_range(start="2023-01-01", periods=sample_size, freq="H"),
-                "power_consumption": [120, 125, 118, 122, 119],
-                "temperature": [4.2, 4.0, 4.1, 4.3, 4.2],
-                "door_openings": [2, 0, 1, 3, 2]
-            }),
-            "dishwasher": pd.DataFrame({
-                "timestamp": pd.date_range(start="2023-01-01", periods=sample_size, freq="H"),
-                "power_consumption": [1200, 1250, 0, 0, 1300],
-                "cycle_stage": ["wash", "rinse", "off", "off", "dry"],
-                "water_usage": [3.2, 2.5, 0, 0, 1.0]
-            }),
-            "washing_machine": pd.DataFrame({
-                "timestamp": pd.date_range(start="2023-01-01", periods=sample_size, freq="H"),
-                "power_consumption": [500, 1800, 2000, 700, 0],
-                "cycle": ["fill", "wash", "spin", "rinse", "off"],
-                "load_size": ["medium", "medium", "medium", "medium", "medium"]
-            }),
-            "oven": pd.DataFrame({
-                "timestamp": pd.date_range(start="2023-01-01", periods=sample_size, freq="H"),
-                "power_consumption": [0, 2400, 1800, 1900, 0],
-                "temperature": [0, 350, 350, 350, 0],
-                "door_openings": [0, 1, 0, 2, 1]
-            }),
-            "air_conditioner": pd.DataFrame({
-                "timestamp": pd.date_range(start="2023-01-01", periods=sample_size, freq="H"),
-                "power_consumption": [1200, 1250, 0, 1100, 1300],
-                "temperature_setting": [72, 72, 78, 74, 72],
-                "outside_temp": [85, 87, 80, 83, 88]
-            })
-        }
-        
-        # If a specific appliance is requested, return its data
-        if appliance_name and appliance_name.lower() in mock_data:
-            return {
-                "appliance": appliance_name,
-                "data": mock_data[appliance_name.lower()].to_dict(orient="records"),
-                "sample_size": sample_size,
-                "note": "This is mock data simulating the Kaggle dataset structure"
-            }
-        # Otherwise return data for all appliances
-        else:
-            all_appliances = {}
-            for appliance, data in mock_data.items():
-                all_appliances[appliance] = data.head(sample_size).to_dict(orient="records")
-            
-            return {
-                "appliances": list(mock_data.keys()),
-                "data": all_appliances,
-                "sample_size": sample_size,
-                "note": "This is mock data simulating the Kaggle dataset structure"
-            }
+        with stage("appliance_query"):
+            # If a specific appliance is requested, return its data
+            if series is not None:
+                return {
+                    "appliance": appliance_name,
+                    "data": self.store.slice(series.name, sample_size, offset, sample, orient=orient),
+                    "format": orient,
+                    "sample_size": sample_size,
+                    "offset": offset,
+                    "total_rows": len(series),
+                    "source": series.source
+                }
+            # Otherwise return data for all appliances
+            else:
+                return {
+                    "appliances": self.store.names(),
+                    "data": {name: self.store.slice(name, sample_size, offset, sample, orient=orient)
+                             for name in self.store.names()},
+                    "format": orient,
+                    "sample_size": sample_size,
+                    "offset": offset,
+                    "sources": {name: s.source for name, s in self.store.series.items()}
+                }
     
     def get_average_consumption(self, appliance_name=None):
         """
         Get the average power consumption for an appliance or all appliances.
+        Served from aggregates precomputed when the data was loaded.
         
         :param appliance_name: Name of the appliance (optional)
         :return: Dictionary with average consumption values
         """
-        # Define mock average consumption values
-        avg_consumption = {
-            "refrigerator": 120.8,
-            "dishwasher": 750.0,
-            "washing_machine": 1000.0,
-            "oven": 1525.0,
-            "air_conditioner": 1170.0
-        }
+        series = self.store.get(appliance_name)
         
-        if appliance_name and appliance_name.lower() in avg_consumption:
+        if series is not None:
             return {
                 "appliance": appliance_name,
-                "average_consumption": avg_consumption[appliance_name.lower()],
-                "unit": "watts"
+                "average_consumption": series.aggregates.get("mean"),
+                "unit": "watts",
+                "statistics": series.aggregates
             }
         else:
-            return {
-                "appliances": avg_consumption,
-                "unit": "watts"
-            }
+            return self._average_response
 
 # Example usage
 if __name__ == "__main__":
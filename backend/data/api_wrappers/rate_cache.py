@@ -0,0 +1,107 @@
+'''
+Persistent Utility-Rate Cache
+SQLite file shared by every worker process and kept across restarts. Utility rates
+change a few times a year, so entries live for weeks instead of the minutes an
+in-memory cache would hold them.
+'''
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from data.instrumentation import record_cache
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "uems", "utility_rates.sqlite")
+# Rates are republished a few times a year; 30 days bounds how stale a tariff can get
+DEFAULT_RATE_TTL = 30 * 24 * 3600
+
+
+class RateCache:
+    def __init__(self, path: str = None, default_ttl: float = DEFAULT_RATE_TTL):
+        """
+        :param path: SQLite file; defaults to RATE_CACHE_PATH or ~/.cache/uems/utility_rates.sqlite.
+        :param default_ttl: Lifetime in seconds for entries stored without one.
+        """
+        self.path = path or os.getenv("RATE_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS utility_rates ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, fetched_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        One connection per thread and process; connections are not carried across a fork.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            # WAL lets workers read while another one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str, allow_stale: bool = False) -> tuple:
+        """
+        :param allow_stale: Also return an expired entry (its remaining ttl is then negative).
+        :return: (value, remaining ttl in seconds), or None when missing or expired.
+        """
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM utility_rates WHERE key = ? AND expires_at > ?",
+            (key, float("-inf") if allow_stale else now)
+        ).fetchone()
+        record_cache("rate_store", "miss" if row is None else "hit")
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0]), row[1] - now
+
+    def set(self, key: str, value, ttl: float = None):
+        """
+        Stores a JSON-serializable value. A TTL of 0 skips caching.
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO utility_rates (key, value, fetched_at, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, fetched_at = excluded.fetched_at, "
+                "expires_at = excluded.expires_at",
+                (key, json.dumps(value), now, now + ttl)
+            )
+        self.writes += 1
+
+    def invalidate(self, key: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM utility_rates WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        """
+        Deletes expired entries.
+        :return: Number of entries removed.
+        """
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM utility_rates WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self) -> dict:
+        entries = self._connection().execute("SELECT COUNT(*) FROM utility_rates").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
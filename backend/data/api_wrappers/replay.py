@@ -0,0 +1,206 @@
+'''
+Record/Replay Transport for Upstream APIs
+Captures real NWS, NREL and EIA responses as fixture files and serves them back in
+place of the network, with configurable latency and injected failures, so the API
+can be load-tested and benchmarked offline.
+
+Record (hits the real APIs once):
+    UPSTREAM_RECORD_DIR=benchmarks/fixtures python app.py
+Replay:
+    UPSTREAM_REPLAY_DIR=benchmarks/fixtures UPSTREAM_REPLAY_LATENCY=0.05 gunicorn ...
+
+One fixture per distinct request: <dir>/<host>/<key>.json. Query parameters that carry
+credentials are left out of both the key and the file.
+'''
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+import aiohttp
+from data.api_wrappers.http_client import HttpResponse
+
+SECRET_PARAMS = {"api_key", "apikey", "key", "token"}
+# Not meaningful once the body has been read (and decompressed) by the client
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+
+
+def fixture_key(method: str, url: str, params) -> str:
+    """
+    Identifies a request independent of parameter order and credentials.
+    """
+    params = sorted((k, str(v)) for k, v in (params or []) if k.lower() not in SECRET_PARAMS)
+    return hashlib.sha1(json.dumps([method.upper(), url, params]).encode()).hexdigest()[:20]
+
+
+def fixture_shape(method: str, url: str) -> str:
+    """
+    The request with numbers in its path masked, e.g. GET api.weather.gov/points/#,#. Used
+    to answer requests that were never recorded (another ZIP code's gridpoint) with a
+    recorded response of the same kind.
+    """
+    parts = urlsplit(url)
+    return f"{method.upper()} {parts.hostname}{re.sub(r'-?[0-9]+(?:[.][0-9]+)?', '#', parts.path)}"
+
+
+def save_fixture(directory: str, method: str, url: str, params, response: HttpResponse, elapsed: float) -> str:
+    """
+    Writes one response as a fixture file.
+    :return: Path of the fixture.
+    """
+    params = [(k, str(v)) for k, v in (params or []) if k.lower() not in SECRET_PARAMS]
+    fixture = {
+        "method": method.upper(),
+        "url": url,
+        "params": params,
+        "status": response.status_code,
+        "headers": {k: v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS},
+        "elapsed": round(elapsed, 4),
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+    try:
+        fixture["body"] = response.content.decode("utf-8")
+    except UnicodeDecodeError:
+        fixture["body_base64"] = base64.b64encode(response.content).decode("ascii")
+
+    host_dir = os.path.join(directory, urlsplit(url).hostname or "unknown")
+    os.makedirs(host_dir, exist_ok=True)
+    path = os.path.join(host_dir, f"{fixture_key(method, url, params)}.json")
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(fixture, f, indent=1)
+    os.replace(temporary, path)
+    return path
+
+
+class RecordingTransport:
+    def __init__(self, directory: str):
+        """
+        Sends every request to the real upstream and saves the response as a fixture.
+        Network failures are not recorded.
+        """
+        self.directory = directory
+        self.recorded = 0
+
+    async def send(self, method: str, url: str, params: list, headers: dict, timeout: float, upstream) -> HttpResponse:
+        started = time.perf_counter()
+        response = await upstream(method, url, params, headers, timeout)
+        save_fixture(self.directory, method, url, params, response, time.perf_counter() - started)
+        self.recorded += 1
+        return response
+
+
+class ReplayTransport:
+    def __init__(self, directory: str, latency: float = None, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, failure_rate: float = 0.0, fallback: bool = True, seed: int = None):
+        """
+        Serves recorded fixtures instead of the network.
+        :param directory: Fixture directory written by RecordingTransport.
+        :param latency: Seconds each response takes; None replays each fixture's recorded latency.
+        :param jitter: Random +/- fraction applied to the latency (0.2 = +/-20%).
+        :param error_rate: Fraction of requests answered with error_status (retried by the client
+            if retryable).
+        :param failure_rate: Fraction of requests that fail like a dropped connection.
+        :param fallback: Answer unrecorded requests with a fixture of the same shape (see fixture_shape);
+            otherwise they get a 404.
+        :param seed: Seed for latency jitter and injected failures.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.failure_rate = failure_rate
+        self.fallback = fallback
+        self._random = random.Random(seed)
+        self._fixtures = {}
+        self._shapes = {}
+        self._lock = threading.Lock()
+        self.counts = {"exact": 0, "fallback": 0, "unmatched": 0, "injected_errors": 0, "injected_failures": 0}
+
+        for host in sorted(os.listdir(directory)):
+            host_dir = os.path.join(directory, host)
+            if not os.path.isdir(host_dir):
+                continue
+            for name in sorted(os.listdir(host_dir)):
+                if name.endswith(".json"):
+                    with open(os.path.join(host_dir, name)) as f:
+                        fixture = json.load(f)
+                    self._fixtures[fixture_key(fixture["method"], fixture["url"], fixture["params"])] = fixture
+                    self._shapes.setdefault(fixture_shape(fixture["method"], fixture["url"]), fixture)
+        if not self._fixtures:
+            print(f"Warning: no upstream fixtures found in {directory}")
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    async def send(self, method: str, url: str, params: list, headers: dict, timeout: float, upstream) -> HttpResponse:
+        fixture = self._fixtures.get(fixture_key(method, url, params))
+        outcome = "exact"
+        if fixture is None and self.fallback:
+            fixture = self._shapes.get(fixture_shape(method, url))
+            outcome = "fallback"
+
+        delay = self.latency if self.latency is not None else (fixture or {}).get("elapsed", 0.0)
+        with self._lock:
+            delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+            roll = self._random.random()
+        if delay > timeout:
+            await asyncio.sleep(timeout)
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(max(delay, 0.0))
+
+        if roll < self.failure_rate:
+            self._count("injected_failures")
+            raise aiohttp.ClientConnectionError("Injected connection failure")
+        if roll < self.failure_rate + self.error_rate:
+            self._count("injected_errors")
+            return HttpResponse(self.error_status, {"Content-Type": "application/json"}, url,
+                                b'{"error": "Injected upstream error"}')
+        if fixture is None:
+            self._count("unmatched")
+            return HttpResponse(404, {"Content-Type": "application/json"}, url,
+                                json.dumps({"error": f"No recorded fixture for {method} {url}"}).encode())
+
+        self._count(outcome)
+        if "body_base64" in fixture:
+            content = base64.b64decode(fixture["body_base64"])
+        else:
+            content = fixture["body"].encode("utf-8")
+        return HttpResponse(fixture["status"], dict(fixture["headers"]), fixture["url"], content)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"fixtures": len(self._fixtures), **self.counts}
+
+
+def transport_from_env():
+    """
+    Builds the transport configured by the environment, or None to use the network:
+    UPSTREAM_REPLAY_DIR (with UPSTREAM_REPLAY_LATENCY, _JITTER, _ERROR_RATE, _ERROR_STATUS,
+    _FAILURE_RATE, _FALLBACK and _SEED), or UPSTREAM_RECORD_DIR.
+    """
+    replay_dir = os.getenv("UPSTREAM_REPLAY_DIR")
+    if replay_dir:
+        latency = os.getenv("UPSTREAM_REPLAY_LATENCY")
+        seed = os.getenv("UPSTREAM_REPLAY_SEED")
+        return ReplayTransport(
+            replay_dir,
+            latency=float(latency) if latency else None,
+            jitter=float(os.getenv("UPSTREAM_REPLAY_JITTER", 0)),
+            error_rate=float(os.getenv("UPSTREAM_REPLAY_ERROR_RATE", 0)),
+            error_status=int(os.getenv("UPSTREAM_REPLAY_ERROR_STATUS", 503)),
+            failure_rate=float(os.getenv("UPSTREAM_REPLAY_FAILURE_RATE", 0)),
+            fallback=os.getenv("UPSTREAM_REPLAY_FALLBACK", "1") == "1",
+            seed=int(seed) if seed else None
+        )
+    record_dir = os.getenv("UPSTREAM_RECORD_DIR")
+    if record_dir:
+        return RecordingTransport(record_dir)
+    return None
@@ -3,116 +3,236 @@ Weather Data Fetcher
 API Information: https://www.weather.gov/documentation/services-web-api
 '''
 
-import requests
-import json
-import pgeocode
-import pandas as pd  # Added pandas import
 from dotenv import load_dotenv
+import asyncio
 import os
-import time
+from data.api_wrappers.cache import TTLCache, ttl_from_headers
+from data.api_wrappers.http_client import UpstreamError, get_client
+from data.api_wrappers.zip_index import get_zip_index
+from data.instrumentation import debug, stage
+
+# Forecasts are regenerated roughly hourly; used when NWS sends no caching headers
+DEFAULT_FORECAST_TTL = 3600
+# How long past expiry a forecast is still served (marked stale) while NWS is unreachable
+DEFAULT_FORECAST_STALE_TTL = 6 * 3600
+# How long a location NWS has no gridpoint or forecast for is remembered as such
+DEFAULT_NEGATIVE_TTL = 900
 
 class WeatherFetcher:
-    def __init__(self):
+    def __init__(self, gridpoint_cache_bytes: int = None, forecast_cache_bytes: int = None, client=None,
+                 on_fetch=None):
         """
         Initializes the WeatherFetcher with the National Weather Service API.
+        :param gridpoint_cache_bytes: Memory cap for the lat/lon -> gridpoint cache.
+        :param forecast_cache_bytes: Memory cap for the gridpoint -> forecast cache.
+        :param client: AsyncHttpClient to use (defaults to the shared client).
+        :param on_fetch: Optional callback receiving each forecast fetched from upstream (not cache hits)
+            and the gridpoint it belongs to.
         """
+        self.client = client or get_client()
+        self.on_fetch = on_fetch
         self.weather_url = "https://api.weather.gov/points/"
         self.headers = {
             'User-Agent': '(Universal Energy Management System, contact@example.com)',
             'Accept': 'application/json'
         }
+        negative_ttl = float(os.getenv("NWS_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL))
+        # Gridpoint assignments essentially never change, so they are kept until evicted
+        self.gridpoint_cache = TTLCache(
+            "nws_gridpoints",
+            max_bytes=gridpoint_cache_bytes or int(os.getenv("NWS_GRIDPOINT_CACHE_BYTES", 4 * 1024 * 1024)),
+            negative_ttl=negative_ttl
+        )
+        # Many ZIP codes share a gridpoint, so forecasts are cached per gridpoint
+        self.forecast_cache = TTLCache(
+            "nws_forecasts",
+            max_bytes=forecast_cache_bytes or int(os.getenv("NWS_FORECAST_CACHE_BYTES", 64 * 1024 * 1024)),
+            default_ttl=DEFAULT_FORECAST_TTL,
+            stale_ttl=float(os.getenv("NWS_FORECAST_STALE_TTL", DEFAULT_FORECAST_STALE_TTL)),
+            negative_ttl=negative_ttl
+        )
     
     def get_coordinates(self, zipcode: str) -> tuple:
         """
-        Converts ZIP code to latitude and longitude using pgeocode.
+        Converts ZIP code to latitude and longitude using the preloaded ZIP index.
         :param zipcode: ZIP code
         :return: Tuple (latitude, longitude)
         """
         try:
-            print(f"Attempting to get coordinates for ZIP code: {zipcode}")
-            nomi = pgeocode.Nominatim('us')
-            location = nomi.query_postal_code(zipcode)
-            print(f"Raw location data from pgeocode: {location}")
-            
-            # Only check if latitude and longitude are valid
-            if location is not None and not pd.isna(location['latitude']) and not pd.isna(location['longitude']):
-                lat, lon = location['latitude'], location['longitude']
-                print(f"Successfully retrieved coordinates: {lat}, {lon}")
-                return lat, lon
-            else:
-                print("Invalid or missing coordinates in location data")
-                return None, None
+            with stage("geocode"):
+                lat, lon = get_zip_index().get_coordinates(zipcode)
+            if lat is None:
+                debug(f"No coordinates found for ZIP code: {zipcode}")
+            return lat, lon
         except Exception as e:
             print(f"Error getting coordinates: {str(e)}")
             return None, None
 
-    def get_weather(self, location_data: dict) -> dict:
+    def get_coordinates_batch(self, zipcodes: list) -> dict:
+        """
+        Resolves many ZIP codes to coordinates in one vectorized lookup.
+        :param zipcodes: List of ZIP codes
+        :return: Dictionary mapping each ZIP code to (latitude, longitude), or (None, None) if unknown
+        """
+        with stage("geocode"):
+            result = get_zip_index().lookup(zipcodes)
+        return {
+            zipcode: (float(lat), float(lon)) if found else (None, None)
+            for zipcode, lat, lon, found in zip(zipcodes, result["latitude"], result["longitude"], result["found"])
+        }
+
+    async def get_gridpoint_async(self, lat: float, lon: float) -> dict:
+        """
+        Resolves coordinates to their NWS gridpoint, using the long-lived gridpoint cache.
+        :return: Dictionary with the gridpoint "key", "forecast_url" and the "latitude"/"longitude"
+            it was looked up for, or None if NWS has no gridpoint or forecast link for the
+            coordinates (remembered for NWS_NEGATIVE_TTL).
+        """
+        # The points endpoint only honors four decimal places
+        key = (round(float(lat), 4), round(float(lon), 4))
+        return await self.gridpoint_cache.get_or_load_async(key, lambda: self._fetch_gridpoint(*key))
+
+    async def _fetch_gridpoint(self, lat: float, lon: float) -> tuple:
+        weather_url = f"{self.weather_url}{lat},{lon}"
+        with stage("points_lookup"):
+            response = await self.client.get(weather_url, headers=self.headers)
+        debug(f"NWS points {weather_url}: {response.status_code} after {response.attempts} attempt(s)")
+        if response.status_code == 404:
+            # Outside NWS coverage; cached as a negative result
+            return None, None
+        response.raise_for_status()
+        
+        grid_data = response.json()
+        
+        properties = grid_data.get("properties", {})
+        if "forecast" not in properties:
+            return None, None
+        return {
+            "key": f"{properties.get('gridId')}/{properties.get('gridX')},{properties.get('gridY')}",
+            "forecast_url": properties["forecast"],
+            "latitude": lat,
+            "longitude": lon
+        }, None
+
+    async def get_forecast_async(self, gridpoint: dict) -> dict:
+        """
+        Fetches the forecast for a gridpoint, served from the forecast cache while fresh.
+        Entry lifetimes follow the Cache-Control/Expires headers NWS sends. An expired
+        forecast is returned at once with "stale": True and refreshed in the background.
+        :param gridpoint: Dictionary returned by get_gridpoint_async.
+        :return: Forecast JSON from the weather service, or None if NWS has no forecast for the gridpoint.
+        """
+        forecast, stale = await self.forecast_cache.get_or_revalidate_async(
+            gridpoint["key"], lambda: self._fetch_forecast(gridpoint)
+        )
+        if forecast is None:
+            return None
+        return {**forecast, "stale": True} if stale else forecast
+
+    async def _fetch_forecast(self, gridpoint: dict) -> tuple:
+        forecast_url = gridpoint["forecast_url"]
+        with stage("forecast_fetch"):
+            forecast_response = await self.client.get(forecast_url, headers=self.headers)
+        debug(f"NWS forecast {forecast_url}: {forecast_response.status_code} "
+              f"after {forecast_response.attempts} attempt(s)")
+        if forecast_response.status_code == 404:
+            return None, None
+        forecast_response.raise_for_status()
+        
+        forecast = forecast_response.json()
+        if self.on_fetch:
+            try:
+                self.on_fetch(forecast, gridpoint)
+            except Exception as e:
+                print(f"on_fetch callback failed: {str(e)}")
+        return forecast, ttl_from_headers(forecast_response.headers, DEFAULT_FORECAST_TTL)
+
+    def get_cache_stats(self) -> dict:
+        """
+        Returns hit/miss/eviction counters for the gridpoint and forecast caches.
+        """
+        return {
+            "gridpoints": self.gridpoint_cache.stats(),
+            "forecasts": self.forecast_cache.stats()
+        }
+
+    async def get_weather_for_coordinates_async(self, lat: float, lon: float) -> dict:
+        """
+        Fetches the forecast for coordinates. Coordinates on the same gridpoint share
+        one cached forecast, and concurrent calls for it share one upstream request.
+        :return: Forecast JSON, or a dictionary with an "error" key.
+        """
+        try:
+            gridpoint = await self.get_gridpoint_async(lat, lon)
+            if gridpoint is None:
+                return {"error": "Invalid response format from weather service."}
+            
+            forecast = await self.get_forecast_async(gridpoint)
+            if forecast is None:
+                return {"error": "No forecast is available for this location."}
+            return forecast
+        
+        except UpstreamError as e:
+            print(f"Weather request failed: {str(e)}")
+            return {"error": f"Failed to fetch weather data: {str(e)}"}
+
+    async def get_weather_for_locations_async(self, coordinates: list) -> tuple:
+        """
+        Fetches forecasts for many locations, one per distinct NWS gridpoint.
+        :param coordinates: List of (lat, lon).
+        :return: Tuple (gridpoint key per location, None when unresolved; gridpoint key ->
+            forecast JSON for the gridpoints that have one).
+        """
+        async def resolve(lat, lon):
+            try:
+                return await self.get_gridpoint_async(lat, lon)
+            except UpstreamError as e:
+                print(f"Gridpoint lookup failed: {str(e)}")
+                return None
+
+        async def fetch(gridpoint):
+            try:
+                return await self.get_forecast_async(gridpoint)
+            except UpstreamError as e:
+                print(f"Weather request failed: {str(e)}")
+                return None
+
+        gridpoints = await asyncio.gather(*(resolve(lat, lon) for lat, lon in coordinates))
+        distinct = {gridpoint["key"]: gridpoint for gridpoint in gridpoints if gridpoint}
+        forecasts = await asyncio.gather(*(fetch(gridpoint) for gridpoint in distinct.values()))
+        return ([gridpoint["key"] if gridpoint else None for gridpoint in gridpoints],
+                {key: forecast for key, forecast in zip(distinct, forecasts) if forecast is not None})
+
+    async def get_weather_async(self, location_data: dict) -> dict:
         """
         Fetches weather forecast for a given ZIP code in the provided location data hashmap.
+        Retries with backoff happen inside the shared client without blocking a thread.
         :param location_data: Dictionary containing location details, including a "zipcode" key.
         :return: Dictionary containing weather information.
         """
         try:
-            print(f"\nProcessing location data: {location_data}")
             zipcode = location_data.get("zipcode")
             if not zipcode:
                 return {"error": "ZIP code not found in provided location data."}
             
-            print(f"Getting coordinates for ZIP code: {zipcode}")
             lat, lon = self.get_coordinates(zipcode)
             if not lat or not lon:
                 return {"error": "Invalid ZIP code or unable to fetch coordinates."}
             
-            print(f"Attempting to fetch weather data for coordinates: {lat}, {lon}")
-            max_retries = 3
-            retry_delay = 1
-            
-            for attempt in range(max_retries):
-                try:
-                    weather_url = f"{self.weather_url}{lat},{lon}"
-                    print(f"Making request to: {weather_url}")
-                    
-                    response = requests.get(
-                        weather_url,
-                        headers=self.headers,
-                        timeout=10
-                    )
-                    print(f"Initial API response status code: {response.status_code}")
-                    response.raise_for_status()
-                    
-                    grid_data = response.json()
-                    print(f"Grid data received: {json.dumps(grid_data, indent=2)}")
-                    
-                    if "properties" in grid_data and "forecast" in grid_data["properties"]:
-                        forecast_url = grid_data["properties"]["forecast"]
-                        print(f"Fetching forecast from: {forecast_url}")
-                        
-                        forecast_response = requests.get(
-                            forecast_url,
-                            headers=self.headers,
-                            timeout=10
-                        )
-                        print(f"Forecast API response status code: {forecast_response.status_code}")
-                        forecast_response.raise_for_status()
-                        
-                        return forecast_response.json()
-                    else:
-                        return {"error": "Invalid response format from weather service."}
-                
-                except requests.exceptions.RequestException as e:
-                    print(f"Request attempt {attempt + 1} failed: {str(e)}")
-                    if attempt == max_retries - 1:
-                        return {"error": f"Failed to fetch weather data after {max_retries} attempts: {str(e)}"}
-                    print(f"Waiting {retry_delay} seconds before retrying...")
-                    time.sleep(retry_delay)
-                    continue
-            
-            return {"error": "Unable to fetch weather data."}
+            return await self.get_weather_for_coordinates_async(lat, lon)
         
         except Exception as e:
             print(f"Unexpected error: {str(e)}")
             return {"error": f"An unexpected error occurred: {str(e)}"}
 
+    def get_weather(self, location_data: dict) -> dict:
+        """
+        Blocking wrapper around get_weather_async.
+        :param location_data: Dictionary containing location details, including a "zipcode" key.
+        :return: Dictionary containing weather information.
+        """
+        return self.client.run(self.get_weather_async(location_data))
+
 def format_weather_data(weather_data: dict) -> None:
     """
     Formats and prints weather data in a more readable way.
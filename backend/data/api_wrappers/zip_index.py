@@ -0,0 +1,152 @@
+'''
+Preloaded ZIP Code -> Coordinate Index
+Built once from the pgeocode US postal table and stored as flat NumPy arrays on disk.
+Arrays are memory-mapped read-only, so every gunicorn worker on a host shares the
+same pages through the OS page cache instead of holding its own copy of the table.
+'''
+
+import os
+import threading
+import numpy as np
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "uems", "zip_index")
+INDEX_FILES = ("zips", "lat", "lon", "state")
+
+
+class ZipIndex:
+    def __init__(self, zips: np.ndarray, lat: np.ndarray, lon: np.ndarray, state: np.ndarray):
+        """
+        Sorted ZIP code index with parallel coordinate arrays.
+        :param zips: Sorted uint32 array of 5-digit ZIP codes.
+        :param lat: float32 latitudes aligned with zips.
+        :param lon: float32 longitudes aligned with zips.
+        :param state: Two-letter state codes (S2) aligned with zips.
+        """
+        self.zips = zips
+        self.lat = lat
+        self.lon = lon
+        self.state = state
+
+    def __len__(self):
+        return len(self.zips)
+
+    @classmethod
+    def build(cls, country: str = "us") -> "ZipIndex":
+        """
+        Builds the index from the pgeocode postal table (downloaded on first use).
+        """
+        import pgeocode
+
+        table = pgeocode.Nominatim(country)._data_frame
+        table = table.dropna(subset=["latitude", "longitude"])
+        codes = table["postal_code"].astype(str).str.zfill(5)
+        valid = codes.str.fullmatch(r"\d{5}")
+        table = table[valid.values]
+        codes = codes[valid].astype(np.uint32).to_numpy()
+
+        order = np.argsort(codes, kind="stable")
+        return cls(
+            zips=codes[order],
+            lat=table["latitude"].to_numpy(dtype=np.float32)[order],
+            lon=table["longitude"].to_numpy(dtype=np.float32)[order],
+            state=table["state_code"].fillna("").astype("S2").to_numpy()[order]
+        )
+
+    def save(self, index_dir: str):
+        """
+        Writes the arrays as .npy files. Files are written to a temporary directory and
+        swapped in, so readers never see a half-written index.
+        """
+        parent = os.path.dirname(os.path.abspath(index_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = f"{index_dir}.tmp{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name in INDEX_FILES:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), getattr(self, name))
+        if not os.path.isdir(index_dir):
+            try:
+                os.replace(tmp_dir, index_dir)
+                return
+            except OSError:
+                pass  # another process created it first
+        for name in INDEX_FILES:
+            os.replace(os.path.join(tmp_dir, f"{name}.npy"), os.path.join(index_dir, f"{name}.npy"))
+        os.rmdir(tmp_dir)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "ZipIndex":
+        """
+        Loads a saved index, memory-mapped by default.
+        """
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode=mode) for name in INDEX_FILES}
+        return cls(**arrays)
+
+    @staticmethod
+    def _parse(zipcodes) -> tuple:
+        """
+        Vectorized conversion of ZIP strings (or ZIP+4) to integers. Anything but exactly
+        five digits before an optional "-" is invalid (a truncated "336" is not ZIP 00336).
+        :return: Tuple (codes, valid_mask).
+        """
+        raw = np.char.strip(np.asarray(zipcodes, dtype=str))
+        if raw.size == 0:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=bool)
+        five = np.char.partition(raw, "-")[:, 0]
+        valid = (np.char.str_len(five) == 5) & np.char.isdigit(five)
+        codes = np.zeros(len(raw), dtype=np.uint32)
+        codes[valid] = five[valid].astype(np.uint32)
+        return codes, valid
+
+    def lookup(self, zipcodes) -> dict:
+        """
+        Resolves many ZIP codes in one vectorized pass.
+        :param zipcodes: Iterable of ZIP code strings.
+        :return: Dictionary of arrays: "latitude", "longitude" (NaN when unknown), "state", and "found".
+        """
+        codes, valid = self._parse(list(zipcodes))
+        if not len(self.zips):
+            # Nothing to search; every position below would be out of range
+            return {"latitude": np.full(len(codes), np.nan), "longitude": np.full(len(codes), np.nan),
+                    "state": np.full(len(codes), b"", dtype="S2"), "found": np.zeros(len(codes), dtype=bool)}
+        pos = np.searchsorted(self.zips, codes)
+        pos = np.minimum(pos, len(self.zips) - 1)
+        found = valid & (self.zips[pos] == codes)
+
+        lat = np.where(found, self.lat[pos], np.nan)
+        lon = np.where(found, self.lon[pos], np.nan)
+        state = np.where(found, self.state[pos], b"")
+        return {"latitude": lat, "longitude": lon, "state": state, "found": found}
+
+    def get_coordinates(self, zipcode: str) -> tuple:
+        """
+        Single-ZIP convenience wrapper around lookup.
+        :return: Tuple (latitude, longitude), or (None, None) if the ZIP is unknown.
+        """
+        result = self.lookup([zipcode])
+        if not result["found"][0]:
+            return None, None
+        return float(result["latitude"][0]), float(result["longitude"][0])
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_zip_index(index_dir: str = None) -> ZipIndex:
+    """
+    Returns the process-wide ZIP index, loading it from disk (or building and saving it
+    on first run). Call at startup so the first request does not pay the load cost.
+    :param index_dir: Directory holding the .npy files; defaults to ZIP_INDEX_DIR or ~/.cache/uems/zip_index.
+    """
+    global _index
+    if _index is not None:
+        return _index
+    with _index_lock:
+        if _index is None:
+            index_dir = index_dir or os.getenv("ZIP_INDEX_DIR", DEFAULT_INDEX_DIR)
+            if not os.path.exists(os.path.join(index_dir, "zips.npy")):
+                print(f"Building ZIP index in {index_dir}")
+                ZipIndex.build().save(index_dir)
+            _index = ZipIndex.load(index_dir)
+    return _index
@@ -0,0 +1,395 @@
+'''
+Request Instrumentation
+Per-request stage timings, upstream call outcomes and cache results, exported as one
+structured JSON log line per request and as Prometheus text metrics (/metrics).
+
+Stages are timed with `with stage("forecast_fetch"):` anywhere below a request,
+including coroutines on the shared upstream client loop (see bind()). Debug output
+goes through debug(), which is silent unless LOG_LEVEL=DEBUG.
+
+Under gunicorn every worker keeps its own counters. With METRICS_DIR set, workers
+write snapshots there and /metrics on any worker reports the sum across all of them.
+'''
+
+import bisect
+import contextvars
+import fcntl
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Prometheus client defaults, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger("uems")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"type": "counter", "help": self.help, "labelnames": self.labelnames,
+                    "series": [[list(k), v] for k, v in self._values.items()]}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Cumulative histogram in the Prometheus sense: bucket counts, sum and count per label set.
+        :param buckets: Upper bounds in ascending order; +Inf is implicit.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labelvalues -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"type": "histogram", "help": self.help, "labelnames": self.labelnames,
+                    "buckets": self.buckets,
+                    "series": [[list(k), [list(v[0]), v[1]]] for k, v in self._values.items()]}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+def merge_snapshots(snapshots: list) -> dict:
+    """
+    Sums metric snapshots from several processes (counters, bucket counts and sums).
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "series": {}})
+            for labelvalues, value in metric["series"]:
+                key = tuple(labelvalues)
+                current = target["series"].get(key)
+                if current is None:
+                    target["series"][key] = value if metric["type"] == "counter" else [list(value[0]), value[1]]
+                elif metric["type"] == "counter":
+                    target["series"][key] = current + value
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+    for metric in merged.values():
+        metric["series"] = [[list(k), v] for k, v in metric["series"].items()]
+    return merged
+
+
+def render(snapshot: dict) -> str:
+    """
+    Prometheus text exposition format (version 0.0.4) for a snapshot.
+    """
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        names = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labelvalues, value in sorted(metric["series"]):
+            if metric["type"] == "counter":
+                lines.append(f"{name}{_labels(names, labelvalues)} {value:g}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + ["+Inf"], counts):
+                cumulative += count
+                le = 'le="' + (bound if bound == "+Inf" else f"{bound:g}") + '"'
+                lines.append(f"{name}_bucket{_labels(names, labelvalues, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labelvalues)} {total:.6g}")
+            lines.append(f"{name}_count{_labels(names, labelvalues)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._directory = None
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._save_lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def _path(self) -> str:
+        return os.path.join(self._directory, f"{os.getpid()}.json")
+
+    def save(self, directory: str = None):
+        """
+        Writes this process's snapshot to <directory>/<pid>.json (atomically).
+        """
+        self._directory = directory or self._directory
+        if not self._directory:
+            return
+        os.makedirs(self._directory, exist_ok=True)
+        with self._save_lock:
+            temporary = self._path() + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temporary, self._path())
+
+    def share(self, directory: str, interval: float = 5.0):
+        """
+        Starts writing this process's snapshot to directory every interval seconds, so
+        render_text() on any process reports the sum. Values inherited across a fork are
+        dropped first: they were already saved by the parent.
+        """
+        if os.getpid() != self._pid:
+            for metric in self._metrics.values():
+                metric.reset()
+            self._pid = os.getpid()
+        self._directory = directory
+        self._stop.clear()
+        self.save()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.save()
+                except OSError as e:
+                    print(f"Saving metrics failed: {str(e)}")
+
+        threading.Thread(target=run, name="metrics-export", daemon=True).start()
+
+    def retire(self):
+        """
+        Folds this process's counters into <directory>/retired.json and removes its own
+        file, so a recycled worker's totals are kept without leaving a file behind per pid.
+        """
+        self._stop.set()
+        if not self._directory:
+            return
+        retired = os.path.join(self._directory, "retired.json")
+        with open(os.path.join(self._directory, "retired.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            previous = {}
+            if os.path.exists(retired):
+                with open(retired) as f:
+                    previous = json.load(f)
+            temporary = retired + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump(merge_snapshots([previous, self.snapshot()]), f)
+            os.replace(temporary, retired)
+        try:
+            os.remove(self._path())
+        except FileNotFoundError:
+            pass
+
+    def render_text(self) -> str:
+        """
+        :return: Prometheus text for this process, or for every process sharing the metrics directory.
+        """
+        if not self._directory:
+            return render(self.snapshot())
+        self.save()
+        snapshots = []
+        for path in glob.glob(os.path.join(self._directory, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # A worker exiting or mid-replace; its counts show up on the next scrape
+                continue
+        return render(merge_snapshots(snapshots))
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram("uems_http_request_duration_seconds",
+                                     "Time to serve a request, including streaming the body", ("route", "method"))
+REQUESTS = REGISTRY.counter("uems_http_requests_total", "Requests served", ("route", "method", "status"))
+STAGE_SECONDS = REGISTRY.histogram("uems_stage_duration_seconds",
+                                   "Time spent in each request stage", ("route", "stage"))
+UPSTREAM_SECONDS = REGISTRY.histogram("uems_upstream_request_duration_seconds",
+                                      "Upstream request time including retries and backoff", ("host",))
+UPSTREAM_REQUESTS = REGISTRY.counter("uems_upstream_requests_total",
+                                     "Upstream requests by final status ('error' for network failures)",
+                                     ("host", "status"))
+UPSTREAM_RETRIES = REGISTRY.counter("uems_upstream_retries_total", "Upstream attempts beyond the first", ("host",))
+CACHE_LOOKUPS = REGISTRY.counter("uems_cache_lookups_total",
+                                 "Cache lookups by outcome (hit, miss, coalesced)", ("cache", "outcome"))
+ANOMALY_ALERTS = REGISTRY.counter("uems_anomaly_alerts_total", "Device anomaly alerts raised by kind", ("kind",))
+
+
+class RequestTrace:
+    def __init__(self, route: str, method: str):
+        """
+        What one request spent its time on. Stages that run more than once (e.g. one
+        forecast fetch per ZIP in a batch) are summed.
+        """
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.upstream = {}
+        self.cache = {}
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_upstream(self, host: str, status, attempts: int, seconds: float):
+        entry = self.upstream.setdefault(host, {"requests": 0, "retries": 0, "seconds": 0.0, "status": {}})
+        entry["requests"] += 1
+        entry["retries"] += max(attempts - 1, 0)
+        entry["seconds"] += seconds
+        entry["status"][str(status)] = entry["status"].get(str(status), 0) + 1
+
+    def add_cache(self, cache: str, outcome: str):
+        outcomes = self.cache.setdefault(cache, {})
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def to_log(self, status: int, seconds: float) -> dict:
+        return {
+            "event": "request",
+            "route": self.route,
+            "method": self.method,
+            "status": status,
+            "duration_ms": round(seconds * 1000, 2),
+            "stages_ms": {name: round(s * 1000, 2) for name, s in self.stages.items()},
+            "upstream": {host: {**u, "seconds": round(u["seconds"], 4)} for host, u in self.upstream.items()},
+            "cache": self.cache
+        }
+
+
+_current = contextvars.ContextVar("uems_request_trace", default=None)
+
+
+def current_trace() -> RequestTrace:
+    return _current.get()
+
+
+def begin_request(route: str, method: str) -> RequestTrace:
+    """
+    Starts tracing the current request. :return: The trace, to pass to end_request.
+    """
+    trace = RequestTrace(route, method)
+    _current.set(trace)
+    return trace
+
+
+def end_request(trace: RequestTrace, status: int):
+    """
+    Records the request's latency and status and writes its structured log line.
+    """
+    if _current.get() is trace:
+        _current.set(None)
+    seconds = time.perf_counter() - trace.started
+    REQUEST_SECONDS.observe(seconds, trace.route, trace.method)
+    REQUESTS.inc(1, trace.route, trace.method, str(status))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(trace.to_log(status, seconds)))
+
+
+async def bind(coro, trace: RequestTrace):
+    """
+    Runs a coroutine under the given request trace (see current_trace()). Context
+    variables do not follow coroutines handed to another thread's event loop, so
+    AsyncHttpClient wraps work submitted from request threads with this.
+    """
+    _current.set(trace)
+    return await coro
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a block as a named stage of the current request (or of "background" work).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        trace = _current.get()
+        STAGE_SECONDS.observe(seconds, trace.route if trace else "background", name)
+        if trace is not None:
+            trace.add_stage(name, seconds)
+
+
+def record_upstream(url: str, status, attempts: int, seconds: float):
+    host = urlsplit(url).hostname or "unknown"
+    UPSTREAM_SECONDS.observe(seconds, host)
+    UPSTREAM_REQUESTS.inc(1, host, str(status))
+    if attempts > 1:
+        UPSTREAM_RETRIES.inc(attempts - 1, host)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_upstream(host, status, attempts, seconds)
+
+
+def record_cache(cache: str, outcome: str):
+    CACHE_LOOKUPS.inc(1, cache, outcome)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_cache(cache, outcome)
+
+
+def debug(message: str):
+    """
+    Diagnostic output, dropped unless LOG_LEVEL=DEBUG. Build expensive messages only
+    behind logger.isEnabledFor(logging.DEBUG).
+    """
+    logger.debug(message)
+
+
+def log_event(event: str, **fields):
+    """
+    Writes one structured (JSON) log line.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": event, **fields}, default=str))
@@ -0,0 +1,44 @@
+'''
+Cross-Process Leader Lock
+Elects the one process (e.g. among gunicorn workers) that runs a job which must not run
+in every worker, such as refitting baselines or scoring telemetry. The leader holds an
+exclusive flock on a lock file; the kernel releases it when the leader closes it or dies,
+and the next process to try takes over. No coordination service is needed, only a file
+system shared by the processes.
+'''
+
+import fcntl
+import os
+
+
+class LeaderLock:
+    def __init__(self, path: str):
+        """
+        :param path: Lock file; created if missing.
+        """
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """
+        Takes the lock without waiting, or keeps it if this process already holds it.
+        :return: True when this process is the leader.
+        """
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            lock_file = open(self.path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._file = lock_file
+            except OSError:
+                lock_file.close()
+        return self._file is not None
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,161 @@
+'''
+Incremental EIA Retail Sales Sync
+Loads monthly electricity sales for any set of states and sectors into
+energy_usage.HistoricalElectricityUsage. The last period loaded per (state, sector)
+is kept in energy_usage.EIASyncWatermark, so a run only asks EIA for months after it;
+an empty table means a full backfill. Pairs sharing a start month are fetched with
+faceted queries whose states x sectors are exactly those pairs, every query is paged
+concurrently, and rows are upserted on (period, state_id, sector_id) together with the
+new watermarks of that query's pairs.
+
+Usage:
+    python -m data.pipelines.eia_sync --states FL GA --sectors ALL RES
+    python -m data.pipelines.eia_sync            # every state and sector
+'''
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from data.api_wrappers.electric_usage import EIA_MAX_PAGE, EIA_SECTORS, EIA_STATES, EIADataFetcher
+from database.db import Database
+from database.persistence import HISTORICAL_USAGE_COLUMNS, HISTORICAL_USAGE_KEY, historical_usage_rows
+
+HISTORICAL_USAGE_TABLE = "energy_usage.HistoricalElectricityUsage"
+WATERMARK_TABLE = "energy_usage.EIASyncWatermark"
+WATERMARK_COLUMNS = ("state_id", "sector_id", "last_period", "synced_at")
+# First month of the EIA monthly retail sales series
+BACKFILL_START = "2001-01"
+
+
+def next_month(period: str) -> str:
+    """
+    "2023-07" or "2023-07-01" -> "2023-08".
+    """
+    year, month = int(period[:4]), int(period[5:7])
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+class EIASync:
+    def __init__(self, db, fetcher: EIADataFetcher, states=EIA_STATES, sectors=EIA_SECTORS,
+                 backfill_start: str = BACKFILL_START, page_size: int = EIA_MAX_PAGE):
+        """
+        :param db: Database holding HistoricalElectricityUsage and EIASyncWatermark.
+        :param fetcher: EIADataFetcher used for the requests.
+        :param states: State ids to keep in sync.
+        :param sectors: Sector ids to keep in sync.
+        :param backfill_start: First period ("YYYY-MM") for pairs that were never loaded.
+        :param page_size: Records per EIA request (at most EIA_MAX_PAGE).
+        """
+        self.db = db
+        self.fetcher = fetcher
+        self.states = [s.upper() for s in states]
+        self.sectors = [s.upper() for s in sectors]
+        self.backfill_start = backfill_start
+        self.page_size = page_size
+
+    def watermarks(self) -> dict:
+        """
+        (state_id, sector_id) -> last loaded period ("YYYY-MM").
+        """
+        rows = self.db.query(f"SELECT state_id, sector_id, last_period FROM {WATERMARK_TABLE}")
+        return {(state, sector): str(period)[:7] for state, sector, period in rows}
+
+    def plan(self, watermarks: dict) -> list:
+        """
+        Groups the configured pairs into queries: pairs share a query when they need the
+        same first month and their states x sectors product covers no other pair, so a
+        query only returns (and only advances) the pairs planned for it.
+        :return: List of (start period, states, sectors).
+        """
+        by_start = {}
+        for state in self.states:
+            for sector in self.sectors:
+                last = watermarks.get((state, sector))
+                start = next_month(last) if last else self.backfill_start
+                by_start.setdefault(start, {}).setdefault(state, set()).add(sector)
+        queries = []
+        for start, sectors_by_state in sorted(by_start.items()):
+            # States needing the same sectors from this month form one exact product
+            states_by_sectors = {}
+            for state, sectors in sectors_by_state.items():
+                states_by_sectors.setdefault(frozenset(sectors), []).append(state)
+            for sectors, states in states_by_sectors.items():
+                queries.append((start, sorted(states), sorted(sectors)))
+        return queries
+
+    async def fetch_async(self, plan: list) -> list:
+        """
+        Runs every planned query concurrently.
+        :return: List of ((start, states, sectors), records or the exception that query raised).
+        """
+        results = await asyncio.gather(*(
+            self.fetcher.get_retail_sales_async(states, sectors, start, page_size=self.page_size)
+            for start, states, sectors in plan
+        ), return_exceptions=True)
+        return list(zip(plan, results))
+
+    def store(self, records: list, watermarks: dict, pairs: set) -> int:
+        """
+        Upserts records and advances the watermarks of the planned pairs they cover, in
+        one transaction. Records for other pairs are ignored: their months may not have
+        been fetched completely.
+        :param pairs: (state_id, sector_id) pairs the query was planned for.
+        :return: Number of usage rows written.
+        """
+        rows = [row for row in historical_usage_rows({"success": True, "data": records})
+                if (row[1], row[3]) in pairs]
+        latest = {}
+        for period, state, _, sector, *_ in rows:
+            if period > latest.get((state, sector), ""):
+                latest[(state, sector)] = period
+        synced_at = datetime.now().isoformat(sep=" ")
+        advanced = [(state, sector, period, synced_at) for (state, sector), period in latest.items()
+                    if period[:7] > watermarks.get((state, sector), "")]
+        with self.db.connection() as conn:
+            written = self.db.upsert_rows(HISTORICAL_USAGE_TABLE, HISTORICAL_USAGE_COLUMNS, rows,
+                                          HISTORICAL_USAGE_KEY, conn=conn)
+            self.db.upsert_rows(WATERMARK_TABLE, WATERMARK_COLUMNS, advanced, ("state_id", "sector_id"), conn=conn)
+        return written
+
+    def sync(self) -> dict:
+        """
+        Fetches and stores everything newer than the watermarks.
+        :return: Run statistics; failed queries are listed under "errors" and retried next run.
+        """
+        started = time.perf_counter()
+        watermarks = self.watermarks()
+        plan = self.plan(watermarks)
+        results = self.fetcher.client.run(self.fetch_async(plan))
+
+        stats = {"queries": len(plan), "records": 0, "rows_written": 0, "errors": []}
+        for (start, states, sectors), result in results:
+            if isinstance(result, Exception):
+                stats["errors"].append({"start": start, "states": states, "sectors": sectors, "error": str(result)})
+                continue
+            stats["records"] += len(result)
+            pairs = {(state, sector) for state in states for sector in sectors}
+            stats["rows_written"] += self.store(result, watermarks, pairs)
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stats
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Sync EIA monthly retail sales into HistoricalElectricityUsage.")
+    parser.add_argument("--states", nargs="+", default=list(EIA_STATES))
+    parser.add_argument("--sectors", nargs="+", default=list(EIA_SECTORS))
+    parser.add_argument("--backfill-start", default=BACKFILL_START)
+    parser.add_argument("--page-size", type=int, default=EIA_MAX_PAGE)
+    args = parser.parse_args()
+
+    database = Database.from_env()
+    if database is None:
+        print("Error: DATABASE_URL is not set")
+        exit(1)
+    sync = EIASync(database, EIADataFetcher(os.getenv("eia_api_key")), args.states, args.sectors,
+                   args.backfill_start, args.page_size)
+    for key, value in sync.sync().items():
+        print(f"{key}: {value}")
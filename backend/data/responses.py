@@ -0,0 +1,139 @@
+'''
+Fast JSON Responses
+Serializes payloads holding NumPy columns straight to JSON bytes (orjson when installed,
+which writes numeric arrays without building Python objects per value), compresses
+them for clients that accept br or gzip, and answers conditional requests with 304
+using ETags. Compressed bodies are cached per ETag, so a repeated payload is not
+compressed twice.
+'''
+
+import gzip
+import hashlib
+import json
+import numpy as np
+from flask import Response, request
+from data.api_wrappers.cache import TTLCache
+from data.instrumentation import stage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies gain too little from compression to pay for it
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+_compressed = TTLCache("compressed_responses", max_bytes=32 * 1024 * 1024, default_ttl=600)
+
+
+def _to_builtin(value):
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f" and np.isnan(value).any():
+            # JSON has no NaN
+            return np.where(np.isnan(value), None, value).tolist()
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(payload) -> bytes:
+    """
+    JSON bytes for a payload that may contain NumPy arrays and scalars (NaN becomes null).
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+                            default=_to_builtin)
+    return json.dumps(payload, default=_to_builtin, separators=(",", ":")).encode()
+
+
+def make_etag(*parts) -> str:
+    """
+    Strong ETag for bytes, or for anything whose repr identifies the content (e.g. a
+    data version plus the request arguments), so it can be checked before the payload
+    is built.
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else repr(part).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def _matches(etag: str) -> bool:
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Compressed representations carry a suffixed ETag; any of them validates the content
+    base = etag.strip('"')
+    return any(candidate.strip().removeprefix("W/").strip('"').split("-")[0] == base
+               for candidate in header.split(","))
+
+
+def not_modified(etag: str, max_age: int = 0) -> Response:
+    """
+    :return: A 304 response if the request's If-None-Match already covers etag, else None.
+    """
+    if not _matches(etag):
+        return None
+    response = Response(status=304)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = f"private, max-age={max_age}"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _negotiate() -> str:
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def json_response(payload, status: int = 200, etag: str = None, max_age: int = 0) -> Response:
+    """
+    Serializes payload and builds the response, compressed when the client accepts it.
+    :param etag: ETag for the content (see make_etag); computed from the body when omitted.
+        Only successful responses carry one.
+    :param max_age: Seconds clients may reuse the response without revalidating.
+    """
+    with stage("serialize"):
+        body = encode_json(payload)
+    headers = {}
+    if status == 200:
+        etag = etag or make_etag(body)
+        if _matches(etag):
+            return not_modified(etag, max_age)
+        headers["Cache-Control"] = f"private, max-age={max_age}"
+
+    encoding = _negotiate() if len(body) >= MIN_COMPRESS_BYTES else None
+    if encoding:
+        with stage("compress"):
+            key = (etag or make_etag(body), encoding)
+            compressed = _compressed.get(key)
+            if compressed is None:
+                if encoding == "br":
+                    compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+                else:
+                    compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+                _compressed.set(key, compressed)
+        body = compressed
+        headers["Content-Encoding"] = encoding
+        if etag:
+            etag = f'{etag[:-1]}-{encoding}"'
+    if status == 200:
+        headers["ETag"] = etag
+
+    response = Response(body, status=status, mimetype="application/json", headers=headers)
+    response.vary.add("Accept-Encoding")
+    return response
@@ -0,0 +1,151 @@
+'''
+Live Topic Hub
+Fans live data out to any number of subscribers (e.g. Server-Sent Events connections).
+Each topic, such as "weather:33620", has a single background refresher on the shared
+upstream client loop, however many clients follow it. Refreshers start with the first
+subscriber, push only changed values, and stop a short while after the last subscriber
+leaves, so upstream and database load grows with distinct topics, not open tabs.
+'''
+
+import asyncio
+import queue
+import threading
+import time
+
+
+class Subscription:
+    def __init__(self, topics: list, max_pending: int = 16):
+        """
+        One subscriber's mailbox. A slow reader loses its oldest pending updates, never the newest.
+        :param topics: Canonical topic names followed.
+        :param max_pending: Updates held before the oldest is dropped.
+        """
+        self.topics = topics
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+
+    def put(self, message: dict):
+        while True:
+            try:
+                self._queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None) -> dict:
+        """
+        :return: The next update, or None if none arrived within timeout seconds.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class TopicHub:
+    def __init__(self, client, linger: float = 30.0, max_pending: int = 16):
+        """
+        :param client: AsyncHttpClient whose loop runs the refreshers.
+        :param linger: Seconds a topic keeps refreshing after its last subscriber leaves,
+            so a page reload does not restart it.
+        :param max_pending: Per-subscriber queue length.
+        """
+        self.client = client
+        self.linger = linger
+        self.max_pending = max_pending
+        self._kinds = {}
+        self._topics = {}
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, loader, interval: float, canonical=None):
+        """
+        Declares a topic kind, e.g. "weather" for topics "weather:<zip>".
+        :param loader: async function(argument) -> JSON-serializable value.
+        :param interval: Seconds between refreshes.
+        :param canonical: Optional function(argument) -> argument that maps equivalent
+            arguments (e.g. addresses in one ZIP code) onto one topic; raises ValueError if invalid.
+        """
+        self._kinds[kind] = (loader, interval, canonical)
+
+    def canonical_topic(self, topic: str) -> str:
+        kind, _, argument = topic.partition(":")
+        if kind not in self._kinds or not argument:
+            raise ValueError(f"Unknown topic {topic!r}; expected one of {', '.join(k + ':<id>' for k in self._kinds)}")
+        canonical = self._kinds[kind][2]
+        return f"{kind}:{canonical(argument) if canonical else argument}"
+
+    def subscribe(self, topics: list) -> Subscription:
+        """
+        Follows one or more topics. The latest value of an already-running topic is
+        delivered immediately.
+        :raises ValueError: For unknown topic kinds.
+        """
+        names = list(dict.fromkeys(self.canonical_topic(t) for t in topics))
+        subscription = Subscription(names, self.max_pending)
+        with self._lock:
+            for name in names:
+                state = self._topics.get(name)
+                if state is None:
+                    state = self._topics[name] = {"subscribers": set(), "latest": None, "sequence": 0,
+                                                  "refreshes": 0, "updated_at": None}
+                    kind, _, argument = name.partition(":")
+                    loader, interval, _ = self._kinds[kind]
+                    state["future"] = self.client.spawn(self._refresh(name, loader, argument, interval))
+                state["subscribers"].add(subscription)
+                if state["latest"] is not None:
+                    subscription.put(state["latest"])
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for name in subscription.topics:
+                state = self._topics.get(name)
+                if state is not None:
+                    state["subscribers"].discard(subscription)
+                    if not state["subscribers"]:
+                        self.client.call_later(self.linger, lambda n=name: self._stop_if_idle(n))
+
+    def _stop_if_idle(self, name: str):
+        with self._lock:
+            state = self._topics.get(name)
+            if state is not None and not state["subscribers"]:
+                state["future"].cancel()
+                del self._topics[name]
+
+    async def _refresh(self, name: str, loader, argument: str, interval: float):
+        while True:
+            try:
+                data = await loader(argument)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Refreshing {name} failed: {str(e)}")
+                data = {"error": f"Failed to refresh {name}: {str(e)}"}
+            self._publish(name, data)
+            await asyncio.sleep(interval)
+
+    def _publish(self, name: str, data):
+        with self._lock:
+            state = self._topics.get(name)
+            if state is None:
+                return
+            state["refreshes"] += 1
+            if state["latest"] is not None and state["latest"]["data"] == data:
+                return
+            state["sequence"] += 1
+            state["updated_at"] = time.time()
+            state["latest"] = {"topic": name, "sequence": state["sequence"], "data": data}
+            for subscription in state["subscribers"]:
+                subscription.put(state["latest"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {"subscribers": len(s["subscribers"]), "refreshes": s["refreshes"],
+                       "updates": s["sequence"], "updated_at": s["updated_at"]}
+                for name, s in self._topics.items()
+            }
@@ -0,0 +1,20 @@
+-- PostgreSQL-only partition management for energy_usage.EnergyConsumptionLog
+
+-- Creates the monthly partition containing the given timestamp, if it does not exist yet
+CREATE OR REPLACE FUNCTION energy_usage.create_consumption_log_partition(month_start DATE)
+RETURNS VOID AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::DATE;
+    partition_name TEXT := 'energyconsumptionlog_' || to_char(first_day, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS energy_usage.%I PARTITION OF energy_usage.EnergyConsumptionLog
+         FOR VALUES FROM (%L) TO (%L)',
+        partition_name, first_day, (first_day + INTERVAL '1 month')::DATE
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Current and next month exist up front; the ingest path creates others on demand
+SELECT energy_usage.create_consumption_log_partition(CURRENT_DATE);
+SELECT energy_usage.create_consumption_log_partition((CURRENT_DATE + INTERVAL '1 month')::DATE);
@@ -2,12 +2,17 @@ CREATE SCHEMA energy_usage;
 
 -- Energy Consumption Log Table (log of energy consumption for each device)
 -- Note: This will use a 3rd Party API to log energy consumption (unless product is IoT)
+-- Range-partitioned by month on timestamp (partitions: energy_usage_partitions.sql)
 CREATE TABLE energy_usage.EnergyConsumptionLog (
-    log_id SERIAL PRIMARY KEY,
+    log_id BIGSERIAL,
     device_id INT REFERENCES household.Devices(device_id) ON DELETE CASCADE,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    energy_used_kWh DECIMAL(10, 4) NOT NULL
-);
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    energy_used_kWh DECIMAL(10, 4) NOT NULL,
+    PRIMARY KEY (log_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Per-device range queries (one device over a time window)
+CREATE INDEX idx_consumption_log_device_time ON energy_usage.EnergyConsumptionLog (device_id, timestamp);
 
 -- Historical Electricity Usage Table (from the API Wrapper "electric_usage.py")
 CREATE TABLE energy_usage.HistoricalElectricityUsage (
@@ -18,7 +23,17 @@ CREATE TABLE energy_usage.HistoricalElectricityUsage (
     sector_id VARCHAR(10) NOT NULL,
     sector_name VARCHAR(50) NOT NULL,
     sales DECIMAL(15, 5) NOT NULL,
-    sales_units VARCHAR(50) NOT NULL
+    sales_units VARCHAR(50) NOT NULL,
+    UNIQUE (period, state_id, sector_id)
+);
+
+-- EIA Sync Watermarks (last monthly period loaded per state and sector, see data/pipelines/eia_sync.py)
+CREATE TABLE energy_usage.EIASyncWatermark (
+    state_id VARCHAR(10) NOT NULL,
+    sector_id VARCHAR(10) NOT NULL,
+    last_period DATE NOT NULL,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (state_id, sector_id)
 );
 
 -- Electricity Cost Table (from the API Wrapper "electric_cost.py")
@@ -28,3 +43,38 @@ CREATE TABLE energy_usage.ElectricityCost (
     residential_rate DECIMAL(10, 4) NOT NULL,
     log_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Usage Rollups (kWh per device, room and household at hour/day/month grain)
+-- Maintained incrementally from EnergyConsumptionLog by database/rollups.py
+CREATE TABLE energy_usage.UsageRollup (
+    grain VARCHAR(10) NOT NULL, -- 'hour', 'day', 'month'
+    level VARCHAR(10) NOT NULL, -- 'device', 'room', 'household'
+    entity_id INT NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    energy_kWh DECIMAL(14, 4) NOT NULL,
+    readings INT NOT NULL,
+    PRIMARY KEY (grain, level, entity_id, bucket_start)
+);
+
+-- Log Watermarks (last EnergyConsumptionLog.log_id processed by each consumer:
+-- 'usage_rollup' for database/rollups.py, 'anomaly_scoring' for models/anomalies.py)
+CREATE TABLE energy_usage.RollupWatermark (
+    name VARCHAR(50) PRIMARY KEY,
+    last_log_id BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Device Anomaly Alerts (raised while scoring EnergyConsumptionLog, see models/anomalies.py)
+CREATE TABLE energy_usage.DeviceAnomalyAlerts (
+    alert_id SERIAL PRIMARY KEY,
+    device_id INT NOT NULL,
+    timestamp TIMESTAMP NOT NULL, -- Time of the alerting reading
+    kind VARCHAR(10) NOT NULL, -- 'spike' or 'shift'
+    energy_kWh DECIMAL(10, 6) NOT NULL,
+    expected_kWh DECIMAL(10, 6) NOT NULL,
+    score REAL NOT NULL,
+    raised_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One device's most recent alerts
+CREATE INDEX idx_anomaly_alerts_device ON energy_usage.DeviceAnomalyAlerts (device_id, alert_id);
@@ -24,6 +24,6 @@ CREATE TABLE model_results.ModelExecutionLogs (
     log_id SERIAL PRIMARY KEY,
     model_name VARCHAR(100) NOT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    execution_time_seconds DECIMAL(10, 3) NOT NULL,
+    execution_time_seconds DECIMAL(13, 6) NOT NULL, -- microseconds: per-household timings are sub-millisecond
     parameters JSONB NOT NULL -- Stores model hyperparameters
 );
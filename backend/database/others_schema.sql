@@ -1,10 +1,15 @@
 CREATE SCHEMA others;
 
+-- One row per NWS gridpoint, day and half-day, upserted on every forecast fetch
 CREATE TABLE others.WeatherForecast (
     forecast_id SERIAL PRIMARY KEY,
+    gridpoint VARCHAR(50) NOT NULL, -- NWS office/x,y, e.g. 'TBW/71,98'
+    latitude DECIMAL(8, 4) NOT NULL, -- Point the gridpoint was looked up for
+    longitude DECIMAL(9, 4) NOT NULL,
     date DATE NOT NULL,
-    time_period VARCHAR(50) NOT NULL, -- e.g., 'Afternoon', 'Night'
+    time_period VARCHAR(50) NOT NULL, -- 'Day' or 'Night'
     temperature_f INT NOT NULL,
     forecast_description TEXT NOT NULL,
-    wind_speed_mph DECIMAL(5, 2) NOT NULL
+    wind_speed_mph DECIMAL(5, 2) NOT NULL,
+    UNIQUE (gridpoint, date, time_period)
 );
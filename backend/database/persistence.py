@@ -0,0 +1,107 @@
+'''
+Persistence of Fetched Upstream Data
+Maps API wrapper results onto the energy_usage and others tables and hands them to
+the write-behind queue, so request handlers never wait on the database.
+'''
+
+import json
+import re
+from datetime import datetime
+
+ELECTRICITY_COST_COLUMNS = ("utility_name", "residential_rate", "log_date")
+HISTORICAL_USAGE_COLUMNS = ("period", "state_id", "state_description", "sector_id", "sector_name", "sales", "sales_units")
+# EIA revises recent months, so a re-fetched period replaces the stored one
+HISTORICAL_USAGE_KEY = ("period", "state_id", "sector_id")
+WEATHER_FORECAST_COLUMNS = ("gridpoint", "latitude", "longitude", "date", "time_period", "temperature_f",
+                            "forecast_description", "wind_speed_mph")
+# A newer forecast for the same gridpoint and half-day replaces the stored one
+WEATHER_FORECAST_KEY = ("gridpoint", "date", "time_period")
+MODEL_EXECUTION_COLUMNS = ("model_name", "execution_time_seconds", "parameters")
+
+
+def electricity_cost_rows(result: dict) -> list:
+    """
+    Rows for energy_usage.ElectricityCost from UtilityRatesFetcher.get_residential_rate.
+    """
+    rate = result.get("residential_rate")
+    if "error" in result or not isinstance(rate, (int, float)):
+        return []
+    return [(result.get("utility_name", "Unknown"), rate, datetime.now().isoformat(sep=" "))]
+
+
+def historical_usage_rows(result: dict) -> list:
+    """
+    Rows for energy_usage.HistoricalElectricityUsage from EIADataFetcher.get_historical_electricity_usage.
+    EIA monthly periods ("2023-07") are stored as the first day of the month.
+    """
+    rows = []
+    for record in result.get("data", []) if result.get("success") else []:
+        if record.get("sales") is None:
+            continue
+        period = record["period"]
+        rows.append((
+            period if len(period) == 10 else f"{period[:7]}-01",
+            record.get("stateid"),
+            record.get("stateDescription"),
+            record.get("sectorid"),
+            record.get("sectorName"),
+            float(record["sales"]),
+            record.get("sales-units", "")
+        ))
+    return rows
+
+
+def _wind_speed_mph(wind_speed: str) -> float:
+    # NWS reports e.g. "10 mph" or "5 to 15 mph"; store the upper bound
+    numbers = re.findall(r"\d+(?:\.\d+)?", wind_speed or "")
+    return float(numbers[-1]) if numbers else 0.0
+
+
+def weather_forecast_rows(forecast: dict, gridpoint: dict) -> list:
+    """
+    Rows for others.WeatherForecast from a NWS forecast payload, one per forecast period.
+    Periods are keyed by their local start date and "Day"/"Night", so forecasts fetched
+    on different days ("Friday" one day, "Today" the next) land on the same row.
+    :param gridpoint: Gridpoint the forecast belongs to, from WeatherFetcher.get_gridpoint_async.
+    """
+    rows = []
+    for period in forecast.get("properties", {}).get("periods", []):
+        if period.get("temperature") is None or not period.get("startTime"):
+            continue
+        temperature = period["temperature"]
+        if period.get("temperatureUnit") == "C":
+            temperature = temperature * 9 / 5 + 32
+        rows.append((
+            gridpoint["key"],
+            round(float(gridpoint["latitude"]), 4),
+            round(float(gridpoint["longitude"]), 4),
+            period["startTime"][:10],
+            "Day" if period.get("isDaytime", True) else "Night",
+            int(round(temperature)),
+            period.get("detailedForecast") or period.get("shortForecast") or "",
+            _wind_speed_mph(period.get("windSpeed"))
+        ))
+    return rows
+
+
+class Persistence:
+    def __init__(self, writer):
+        """
+        :param writer: WriteBehindQueue the rows are submitted to.
+        """
+        self.writer = writer
+
+    def record_electricity_cost(self, result: dict):
+        self.writer.submit_many("energy_usage.ElectricityCost", ELECTRICITY_COST_COLUMNS, electricity_cost_rows(result))
+
+    def record_historical_usage(self, result: dict):
+        self.writer.submit_many("energy_usage.HistoricalElectricityUsage", HISTORICAL_USAGE_COLUMNS,
+                                historical_usage_rows(result), key_columns=HISTORICAL_USAGE_KEY)
+
+    def record_weather_forecast(self, forecast: dict, gridpoint: dict):
+        self.writer.submit_many("others.WeatherForecast", WEATHER_FORECAST_COLUMNS,
+                                weather_forecast_rows(forecast, gridpoint), key_columns=WEATHER_FORECAST_KEY)
+
+    def record_model_execution(self, model_name: str, seconds: float, parameters: dict):
+        self.writer.submit("model_results.ModelExecutionLogs", MODEL_EXECUTION_COLUMNS,
+                           (model_name, round(seconds, 6), json.dumps(parameters)))
@@ -0,0 +1,339 @@
+'''
+Incremental Usage Rollups
+Keeps hourly, daily and monthly kWh totals per device, room and household in
+energy_usage.UsageRollup. Each refresh folds in only the EnergyConsumptionLog rows
+past the stored log_id watermark and adds them onto the existing buckets, so
+late-arriving readings (old timestamps, new log_id) land in the right bucket without
+recomputing anything. Queries are answered from the coarsest buckets that fit the range.
+
+On PostgreSQL concurrent COPYs commit out of log_id order, so the highest visible id
+does not prove that every lower id is visible. The watermark therefore only advances to
+a max log_id once every transaction that was running when it was read has finished
+(the snapshot xmin has passed that moment's xmax): after that, no lower id can still
+appear. A long-running writer delays the rollups instead of having its rows skipped.
+'''
+
+import threading
+import time
+from collections import deque
+import numpy as np
+
+ROLLUP_TABLE = "energy_usage.UsageRollup"
+WATERMARK_TABLE = "energy_usage.RollupWatermark"
+WATERMARK_NAME = "usage_rollup"
+LEVELS = ("device", "room", "household")
+# Coarsest first; values are the numpy datetime64 units of each grain
+GRAINS = {"month": "M", "day": "D", "hour": "h"}
+
+DELTA_QUERY = """
+SELECT l.log_id, l.device_id, d.room_id, r.household_id, l.timestamp, l.energy_used_kWh
+FROM energy_usage.EnergyConsumptionLog l
+LEFT JOIN household.Devices d ON d.device_id = l.device_id
+LEFT JOIN household.Rooms r ON r.room_id = d.room_id
+WHERE l.log_id > %s AND l.log_id <= %s
+ORDER BY l.log_id
+LIMIT %s
+"""
+
+UPSERT_ROLLUP = f"""
+INSERT INTO {ROLLUP_TABLE} AS r (grain, level, entity_id, bucket_start, energy_kWh, readings)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON CONFLICT (grain, level, entity_id, bucket_start) DO UPDATE
+SET energy_kWh = r.energy_kWh + excluded.energy_kWh, readings = r.readings + excluded.readings
+"""
+
+# Oldest transaction still running, and the next transaction id to be assigned
+SNAPSHOT_QUERY = "SELECT pg_snapshot_xmin(s)::text, pg_snapshot_xmax(s)::text FROM pg_current_snapshot() s"
+
+
+def aggregate(entity_ids: np.ndarray, timestamps_ms: np.ndarray, energy: np.ndarray, unit: str) -> tuple:
+    """
+    Sums readings per (entity, bucket). Entities < 0 (unknown room/household) are skipped.
+    :param unit: numpy datetime64 unit of the bucket ("h", "D" or "M").
+    :return: Tuple (entity_ids, bucket_starts datetime64[s], kwh sums, reading counts).
+    """
+    keep = entity_ids >= 0
+    entity_ids, energy = entity_ids[keep], energy[keep]
+    buckets = timestamps_ms[keep].astype("datetime64[ms]").astype(f"datetime64[{unit}]")
+    if not len(entity_ids):
+        return entity_ids, buckets.astype("datetime64[s]"), energy, np.zeros(0, dtype=np.int64)
+
+    order = np.lexsort((buckets, entity_ids))
+    entity_ids, buckets, energy = entity_ids[order], buckets[order], energy[order]
+    starts = np.flatnonzero(np.r_[True, (entity_ids[1:] != entity_ids[:-1]) | (buckets[1:] != buckets[:-1])])
+    counts = np.diff(np.r_[starts, len(entity_ids)])
+    return entity_ids[starts], buckets[starts].astype("datetime64[s]"), np.add.reduceat(energy, starts), counts
+
+
+def _floor(value: np.datetime64, unit: str) -> np.datetime64:
+    return value.astype(f"datetime64[{unit}]").astype("datetime64[s]")
+
+
+def _ceil(value: np.datetime64, unit: str) -> np.datetime64:
+    floored = _floor(value, unit)
+    if floored == value:
+        return floored
+    return (value.astype(f"datetime64[{unit}]") + 1).astype("datetime64[s]")
+
+
+def plan_ranges(start: np.datetime64, end: np.datetime64, grains: tuple = tuple(GRAINS)) -> list:
+    """
+    Splits [start, end) into the fewest aligned spans, coarsest grain first: whole
+    months in the middle, whole days at the edges, and hours for what is left.
+    :return: List of (grain, span_start, span_end) with datetime64[s] bounds.
+    """
+    if start >= end:
+        return []
+    grain, finer = grains[0], grains[1:]
+    if not finer:
+        return [(grain, start, end)]
+    unit = GRAINS[grain]
+    lo, hi = _ceil(start, unit), _floor(end, unit)
+    if lo >= hi:
+        return plan_ranges(start, end, finer)
+    return plan_ranges(start, lo, finer) + [(grain, lo, hi)] + plan_ranges(hi, end, finer)
+
+
+def _iso(value) -> str:
+    # PostgreSQL returns datetimes, SQLite the stored ISO string
+    return value.isoformat() if hasattr(value, "isoformat") else str(value).replace(" ", "T")
+
+
+class CommittedCutoff:
+    def __init__(self, db):
+        """
+        Tracks how far a consumer of EnergyConsumptionLog may read by log_id without
+        skipping rows that are still being written (see the module docstring).
+        """
+        self.db = db
+        # (max log_id, snapshot xmax when it was read), waiting for their writers to finish
+        self._observed = deque()
+
+    def advance(self, max_log_id: int) -> int:
+        """
+        Highest log_id that is safe to read: every id up to it is either visible or
+        will never be (rolled back). SQLite has a single writer, so ids commit in order.
+        On PostgreSQL the snapshot is read after max_log_id, so every transaction that
+        took an id up to max_log_id has an xid below this xmax; once the oldest running
+        transaction is past it, all of them have finished.
+        """
+        if self.db.dialect != "postgresql":
+            return max_log_id
+        xmin, xmax = (int(v) for v in self.db.query(SNAPSHOT_QUERY)[0])
+        self._observed.append((max_log_id, xmax))
+        cutoff = 0
+        while self._observed and self._observed[0][1] <= xmin:
+            cutoff = self._observed.popleft()[0]
+        if cutoff:
+            # Still safe on the next call, which may see no newly finished sample
+            self._observed.appendleft((cutoff, 0))
+        return cutoff
+
+    def reset(self):
+        self._observed.clear()
+
+
+class RollupEngine:
+    def __init__(self, db, interval: float = 30.0, batch_rows: int = 100_000):
+        """
+        :param db: Database holding EnergyConsumptionLog and the rollup tables.
+        :param interval: Seconds between background refreshes; 0 disables the background thread.
+        :param batch_rows: Log rows folded per transaction.
+        """
+        self.db = db
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self._committed = CommittedCutoff(db)
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.rows_folded = 0
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self.last_refresh_seconds = None
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(target=self._run, name="usage-rollups", daemon=True)
+            self._thread.start()
+
+    def _cutoff(self, max_log_id: int) -> int:
+        """
+        Highest log_id that is safe to fold (see CommittedCutoff.advance).
+        """
+        return self._committed.advance(max_log_id)
+
+    def _fold_batch(self, cutoff: int) -> int:
+        """
+        Folds one batch of log rows past the watermark; the upserts and the new
+        watermark commit together, so every row is counted exactly once.
+        """
+        with self.db.connection() as conn:
+            cur = conn.cursor()
+            # Creating/locking the watermark row first serializes concurrent refreshers
+            cur.execute(self.db.sql(f"INSERT INTO {WATERMARK_TABLE} (name, last_log_id) VALUES (%s, 0) "
+                                    "ON CONFLICT (name) DO NOTHING"), (WATERMARK_NAME,))
+            lock = " FOR UPDATE" if self.db.dialect == "postgresql" else ""
+            cur.execute(self.db.sql(f"SELECT last_log_id FROM {WATERMARK_TABLE} WHERE name = %s{lock}"),
+                        (WATERMARK_NAME,))
+            watermark = cur.fetchone()[0]
+            if watermark >= cutoff:
+                return 0
+
+            cur.execute(self.db.sql(DELTA_QUERY), (watermark, cutoff, self.batch_rows))
+            rows = cur.fetchall()
+            if not rows:
+                return 0
+
+            log_id, device_id, room_id, household_id, timestamp, energy = zip(*rows)
+            timestamps_ms = np.array(timestamp, dtype="datetime64[ms]").astype(np.int64)
+            kwh = np.array(energy, dtype=np.float64)
+            entities = {
+                "device": np.array(device_id, dtype=np.int64),
+                "room": np.array([-1 if v is None else v for v in room_id], dtype=np.int64),
+                "household": np.array([-1 if v is None else v for v in household_id], dtype=np.int64),
+            }
+            upserts = []
+            for level, ids in entities.items():
+                for grain, unit in GRAINS.items():
+                    keys, buckets, sums, counts = aggregate(ids, timestamps_ms, kwh, unit)
+                    upserts.extend(zip(
+                        [grain] * len(keys), [level] * len(keys), keys.tolist(),
+                        np.datetime_as_string(buckets, unit="s").tolist(),
+                        np.round(sums, 4).tolist(), counts.tolist()
+                    ))
+            cur.executemany(self.db.sql(UPSERT_ROLLUP), upserts)
+            cur.execute(self.db.sql(f"UPDATE {WATERMARK_TABLE} SET last_log_id = %s, updated_at = CURRENT_TIMESTAMP "
+                                    "WHERE name = %s"), (max(log_id), WATERMARK_NAME))
+            return len(rows)
+
+    def refresh(self) -> int:
+        """
+        Folds every settled log row past the watermark into the rollups.
+        :return: Number of log rows folded.
+        """
+        with self._refresh_lock:
+            started = time.perf_counter()
+            max_log_id = self.db.query("SELECT MAX(log_id) FROM energy_usage.EnergyConsumptionLog")[0][0] or 0
+            cutoff = self._cutoff(max_log_id)
+            folded = 0
+            while True:
+                n = self._fold_batch(cutoff)
+                folded += n
+                if n < self.batch_rows:
+                    break
+            self.rows_folded += folded
+            self.refreshes += 1
+            self.last_refresh_seconds = round(time.perf_counter() - started, 4)
+            return folded
+
+    def rebuild(self) -> int:
+        """
+        Drops all rollups and refolds the whole log, e.g. after devices moved between rooms
+        (rollups attribute readings to the room/household a device belonged to when folded).
+        """
+        with self._refresh_lock:
+            with self.db.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(f"DELETE FROM {ROLLUP_TABLE}")
+                cur.execute(self.db.sql(f"DELETE FROM {WATERMARK_TABLE} WHERE name = %s"), (WATERMARK_NAME,))
+            self._committed.reset()
+        return self.refresh()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.failed_refreshes += 1
+                print(f"Usage rollup refresh failed: {str(e)}")
+
+    def total(self, level: str, entity_id: int, start: str, end: str) -> dict:
+        """
+        Total kWh for one device, room or household over [start, end), read from
+        monthly buckets where whole months fit, then daily, then hourly buckets.
+        Bounds are rounded outward to whole hours.
+        """
+        self._check_level(level)
+        start = _floor(np.datetime64(start, "s"), "h")
+        end = _ceil(np.datetime64(end, "s"), "h")
+        spans = plan_ranges(start, end)
+        energy, readings = 0.0, 0
+        with self.db.connection() as conn:
+            cur = conn.cursor()
+            for grain, lo, hi in spans:
+                cur.execute(self.db.sql(
+                    f"SELECT COALESCE(SUM(energy_kWh), 0), COALESCE(SUM(readings), 0) FROM {ROLLUP_TABLE} "
+                    "WHERE grain = %s AND level = %s AND entity_id = %s AND bucket_start >= %s AND bucket_start < %s"
+                ), (grain, level, entity_id, str(lo), str(hi)))
+                span_energy, span_readings = cur.fetchone()
+                energy += float(span_energy)
+                readings += int(span_readings)
+        return {
+            "level": level,
+            "id": entity_id,
+            "start": str(start),
+            "end": str(end),
+            "energy_kWh": round(energy, 4),
+            "readings": readings,
+            "spans": [{"grain": grain, "start": str(lo), "end": str(hi)} for grain, lo, hi in spans]
+        }
+
+    def series(self, level: str, entity_id: int, start: str, end: str, grain: str) -> list:
+        """
+        Per-bucket kWh for one device, room or household at the given grain.
+        Bounds are rounded outward to whole buckets.
+        """
+        self._check_level(level)
+        if grain not in GRAINS:
+            raise ValueError(f"grain must be one of {', '.join(GRAINS)}")
+        start = _floor(np.datetime64(start, "s"), GRAINS[grain])
+        end = _ceil(np.datetime64(end, "s"), GRAINS[grain])
+        rows = self.db.query(
+            f"SELECT bucket_start, energy_kWh, readings FROM {ROLLUP_TABLE} "
+            "WHERE grain = %s AND level = %s AND entity_id = %s AND bucket_start >= %s AND bucket_start < %s "
+            "ORDER BY bucket_start",
+            (grain, level, entity_id, str(start), str(end))
+        )
+        return [{"start": _iso(b), "energy_kWh": round(float(e), 4), "readings": int(r)} for b, e, r in rows]
+
+    def series_all(self, level: str, start: str, end: str, grain: str, entity_id: int = None) -> tuple:
+        """
+        Per-bucket kWh for every entity at a level, as arrays (for fleet-wide pricing).
+        :param entity_id: Only this entity; the lookup then stays on its primary-key range
+            instead of scanning the whole level.
+        :return: Tuple (entity_ids int64, bucket_starts datetime64[s], kwh float64).
+        """
+        self._check_level(level)
+        if grain not in GRAINS:
+            raise ValueError(f"grain must be one of {', '.join(GRAINS)}")
+        start = _floor(np.datetime64(start, "s"), GRAINS[grain])
+        end = _ceil(np.datetime64(end, "s"), GRAINS[grain])
+        statement = (f"SELECT entity_id, bucket_start, energy_kWh FROM {ROLLUP_TABLE} "
+                     "WHERE grain = %s AND level = %s AND bucket_start >= %s AND bucket_start < %s")
+        params = (grain, level, str(start), str(end))
+        if entity_id is not None:
+            statement += " AND entity_id = %s"
+            params += (int(entity_id),)
+        rows = self.db.query(statement, params)
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype="datetime64[s]"), np.zeros(0)
+        entity_ids, buckets, energy = zip(*rows)
+        return (np.array(entity_ids, dtype=np.int64), np.array(buckets, dtype="datetime64[s]"),
+                np.array(energy, dtype=np.float64))
+
+    @staticmethod
+    def _check_level(level: str):
+        if level not in LEVELS:
+            raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+
+    def stats(self) -> dict:
+        return {
+            "rows_folded": self.rows_folded,
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+            "last_refresh_seconds": self.last_refresh_seconds
+        }
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
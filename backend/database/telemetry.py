@@ -0,0 +1,318 @@
+'''
+High-Throughput Device Telemetry Ingest
+Readings are appended to preallocated column arrays and bulk-loaded into
+energy_usage.EnergyConsumptionLog by a background flusher, on a row-count or time
+threshold. Ingest never waits on the database: while one buffer is being copied out
+the other keeps accepting readings, and a full buffer rejects new batches so the
+caller can back off (backpressure) instead of growing memory without bound.
+Readings for devices missing from household.Devices are rejected at ingest, since one
+of them would fail the whole COPY; a flush that fails anyway keeps its readings and
+retries with exponential backoff, while they count against the buffer's capacity.
+'''
+
+import threading
+import time
+import numpy as np
+
+CONSUMPTION_LOG_TABLE = "energy_usage.EnergyConsumptionLog"
+CONSUMPTION_LOG_COLUMNS = ["device_id", "timestamp", "energy_used_kWh"]
+# Longest wait between attempts to write readings whose flush failed
+MAX_RETRY_SECONDS = 60.0
+
+
+class TelemetryError(ValueError):
+    """
+    Raised for malformed telemetry payloads.
+    """
+
+
+def parse_timestamps(values) -> np.ndarray:
+    """
+    Converts epoch seconds (numbers) or ISO-8601 strings to epoch milliseconds.
+    Both forms may be mixed within one payload.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind in "iuf":
+        return np.round(array.astype(np.float64) * 1000).astype(np.int64)
+
+    array = np.asarray(values, dtype=object)
+    numeric = np.fromiter((isinstance(v, (int, float)) and not isinstance(v, bool) for v in array),
+                          dtype=bool, count=len(array))
+    result = np.empty(len(array), dtype=np.int64)
+    try:
+        if numeric.any():
+            result[numeric] = np.round(array[numeric].astype(np.float64) * 1000).astype(np.int64)
+        if not numeric.all():
+            # numpy rejects timezone suffixes; readings are expected in UTC
+            strings = np.char.rstrip(array[~numeric].astype(str), "Z")
+            result[~numeric] = strings.astype("datetime64[ms]").astype(np.int64)
+    except (TypeError, ValueError) as e:
+        raise TelemetryError(f"Invalid timestamp: {str(e)}")
+    return result
+
+
+def parse_readings(payload) -> tuple:
+    """
+    Normalizes a telemetry payload into column arrays. Accepts either a columnar body
+        {"device_id": [...], "timestamp": [...], "energy_used_kWh": [...]}
+    or row records
+        {"readings": [{"device_id": 1, "timestamp": ..., "energy_used_kWh": 0.01}, ...]}
+    :return: Tuple (device_ids int64, timestamps_ms int64, energy_kwh float64).
+    """
+    if not isinstance(payload, dict):
+        raise TelemetryError("Payload must be an object")
+    if "readings" in payload:
+        readings = payload["readings"]
+        if not isinstance(readings, list):
+            raise TelemetryError('"readings" must be a list')
+        try:
+            columns = {c: [r[c] for r in readings] for c in CONSUMPTION_LOG_COLUMNS}
+        except (KeyError, TypeError) as e:
+            raise TelemetryError(f"Each reading needs device_id, timestamp and energy_used_kWh ({str(e)})")
+    else:
+        columns = {c: payload.get(c) for c in CONSUMPTION_LOG_COLUMNS}
+        if any(not isinstance(v, list) for v in columns.values()):
+            raise TelemetryError("Expected a \"readings\" list or device_id/timestamp/energy_used_kWh arrays")
+
+    lengths = {len(v) for v in columns.values()}
+    if len(lengths) != 1:
+        raise TelemetryError("Column arrays must have equal length")
+    try:
+        device_ids = np.asarray(columns["device_id"], dtype=np.int64)
+        energy = np.asarray(columns["energy_used_kWh"], dtype=np.float64)
+    except (TypeError, ValueError) as e:
+        raise TelemetryError(f"Invalid device_id or energy_used_kWh: {str(e)}")
+    if not np.isfinite(energy).all():
+        raise TelemetryError("energy_used_kWh must be finite")
+    return device_ids, parse_timestamps(columns["timestamp"]), energy
+
+
+class KnownDevices:
+    def __init__(self, db, max_age: float = 60.0, min_refresh_interval: float = 5.0):
+        """
+        Sorted snapshot of household.Devices ids, used to reject readings the foreign key
+        on EnergyConsumptionLog.device_id would refuse.
+        :param max_age: Seconds after which the snapshot is reloaded on the next check.
+        :param min_refresh_interval: Shortest gap between reloads triggered by unknown ids,
+            so a newly registered device is picked up quickly but unknown ids cannot
+            make every request query the table.
+        """
+        self.db = db
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        rows = self.db.query("SELECT device_id FROM household.Devices")
+        ids = np.sort(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+
+    def _missing(self, device_ids: np.ndarray) -> np.ndarray:
+        ids = self._ids
+        if not len(ids):
+            return np.ones(len(device_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(ids, device_ids), len(ids) - 1)
+        return ids[pos] != device_ids
+
+    def unknown(self, device_ids: np.ndarray) -> np.ndarray:
+        """
+        :return: Sorted unique ids among device_ids that are not in household.Devices.
+        """
+        age = None if self._loaded_at is None else time.monotonic() - self._loaded_at
+        if age is None or age >= self.max_age:
+            self.refresh()
+            age = 0.0
+        missing = self._missing(device_ids)
+        if missing.any() and age >= self.min_refresh_interval:
+            self.refresh()
+            missing = self._missing(device_ids)
+        return np.unique(device_ids[missing])
+
+
+class _ColumnBuffer:
+    def __init__(self, capacity: int):
+        self.device_id = np.empty(capacity, dtype=np.int64)
+        self.timestamp = np.empty(capacity, dtype=np.int64)
+        self.energy = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+
+class TelemetryBuffer:
+    def __init__(self, db, capacity: int = 1_000_000, flush_rows: int = 50_000, flush_interval: float = 2.0,
+                 devices: KnownDevices = None):
+        """
+        :param db: Database to flush into.
+        :param capacity: Readings held (buffered or awaiting a retried flush) before new
+            batches are rejected.
+        :param flush_rows: Flush as soon as this many readings are buffered.
+        :param flush_interval: Flush at least this often (seconds) while readings are buffered.
+        :param devices: Known device ids; after a failed flush, readings of devices that
+            no longer exist are discarded instead of being retried forever.
+        """
+        self.db = db
+        self.devices = devices
+        self.capacity = capacity
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._active = _ColumnBuffer(capacity)
+        self._spare = _ColumnBuffer(capacity)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._known_partitions = set()
+        # Readings of failed flushes (device_id, timestamp, energy), written before newer ones
+        self._retained = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+        self._retry_delay = 0.0
+        self._retry_at = 0.0
+        self.readings_accepted = 0
+        self.readings_written = 0
+        self.readings_discarded = 0
+        self.batches_rejected = 0
+        self.failed_flushes = 0
+        self._thread = threading.Thread(target=self._run, name="telemetry-flush", daemon=True)
+        self._thread.start()
+
+    def add(self, device_ids: np.ndarray, timestamps_ms: np.ndarray, energy_kwh: np.ndarray) -> bool:
+        """
+        Appends a batch of readings.
+        :return: False if the buffer lacks room for the whole batch (nothing is buffered then).
+        """
+        n = len(device_ids)
+        with self._lock:
+            buf = self._active
+            if buf.size + len(self._retained[0]) + n > self.capacity:
+                self.batches_rejected += 1
+                self._wakeup.notify()
+                return False
+            buf.device_id[buf.size:buf.size + n] = device_ids
+            buf.timestamp[buf.size:buf.size + n] = timestamps_ms
+            buf.energy[buf.size:buf.size + n] = energy_kwh
+            buf.size += n
+            self.readings_accepted += n
+            if buf.size >= self.flush_rows:
+                self._wakeup.notify()
+        return True
+
+    def fill_ratio(self) -> float:
+        return (self._active.size + len(self._retained[0])) / self.capacity
+
+    def _take(self) -> tuple:
+        """
+        Swaps in the spare buffer and moves the full one's readings behind those awaiting
+        retry, in one step under the lock add() checks capacity with, so they are counted
+        against capacity throughout.
+        :return: (device_id, timestamp, energy) of every unwritten reading.
+        """
+        with self._lock:
+            buf, self._active = self._active, self._spare
+            self._spare = buf
+            n = buf.size
+            # Copied out, so the buffer can take readings again after the next swap
+            self._retained = tuple(np.concatenate((kept, column[:n])) for kept, column in
+                                   zip(self._retained, (buf.device_id, buf.timestamp, buf.energy)))
+            buf.size = 0
+            return self._retained
+
+    def _ensure_partitions(self, timestamps_ms: np.ndarray):
+        if self.db.dialect != "postgresql":
+            return
+        months = np.unique(timestamps_ms.astype("datetime64[ms]").astype("datetime64[M]"))
+        for month in months:
+            key = str(month)
+            if key not in self._known_partitions:
+                self.db.execute("SELECT energy_usage.create_consumption_log_partition(%s)", (f"{key}-01",))
+                self._known_partitions.add(key)
+
+    def flush(self) -> int:
+        """
+        Writes all buffered readings, and those of earlier failed flushes, with one bulk
+        COPY grouped by device and time. On failure the readings are kept and retried
+        after a backoff of up to MAX_RETRY_SECONDS.
+        :return: Number of readings written.
+        """
+        with self._flush_lock:
+            device_id, timestamp, energy = self._take()
+            if not len(device_id):
+                return 0
+            # Rows for one device land next to each other, which keeps the index insert local
+            order = np.lexsort((timestamp, device_id))
+            device_id, timestamp, energy = device_id[order], timestamp[order], energy[order]
+            rows = list(zip(
+                device_id.tolist(),
+                np.datetime_as_string(timestamp.astype("datetime64[ms]"), unit="ms").tolist(),
+                np.round(energy, 4).tolist()
+            ))
+            try:
+                self._ensure_partitions(timestamp)
+                self.db.copy_rows(CONSUMPTION_LOG_TABLE, CONSUMPTION_LOG_COLUMNS, rows)
+            except Exception as e:
+                self._retain(device_id, timestamp, energy, e)
+                return 0
+            with self._lock:
+                self._retained = tuple(column[:0] for column in self._retained)
+            self._retry_delay = self._retry_at = 0.0
+            self.readings_written += len(rows)
+            return len(rows)
+
+    def _retain(self, device_id: np.ndarray, timestamp: np.ndarray, energy: np.ndarray, error: Exception):
+        self.failed_flushes += 1
+        if self.devices is not None:
+            # A device deleted since its readings were accepted fails every retry; drop those
+            try:
+                self.devices.refresh()
+                keep = ~np.isin(device_id, self.devices.unknown(device_id))
+                self.readings_discarded += int((~keep).sum())
+                device_id, timestamp, energy = device_id[keep], timestamp[keep], energy[keep]
+            except Exception:
+                pass
+        self._retry_delay = min(max(self._retry_delay * 2, 1.0), MAX_RETRY_SECONDS)
+        self._retry_at = time.monotonic() + self._retry_delay
+        with self._lock:
+            self._retained = (device_id, timestamp, energy)
+        print(f"Telemetry flush failed ({len(device_id)} readings kept, retrying in "
+              f"{self._retry_delay:.0f}s): {str(error)}")
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            with self._lock:
+                self._wakeup.wait(timeout=min(self.flush_interval, 0.5))
+                size = self._active.size + len(self._retained[0])
+            if time.monotonic() < self._retry_at:
+                continue
+            if size and (size >= self.flush_rows or time.monotonic() - last_flush >= self.flush_interval
+                         or size >= self.capacity * 0.9):
+                self.flush()
+                last_flush = time.monotonic()
+            elif not size:
+                last_flush = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "buffered": self._active.size,
+            "awaiting_retry": len(self._retained[0]),
+            "capacity": self.capacity,
+            "readings_accepted": self.readings_accepted,
+            "readings_written": self.readings_written,
+            "readings_discarded": self.readings_discarded,
+            "batches_rejected": self.batches_rejected,
+            "failed_flushes": self.failed_flushes
+        }
+
+    def close(self):
+        """
+        Stops the flusher and writes out anything still buffered.
+        """
+        if not self._stop.is_set():
+            self._stop.set()
+            with self._lock:
+                self._wakeup.notify()
+            self._thread.join(timeout=10)
+            self.flush()
+            if len(self._retained[0]):
+                print(f"Telemetry buffer closed with {len(self._retained[0])} unwritten readings")
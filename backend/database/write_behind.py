@@ -0,0 +1,124 @@
+'''
+Write-Behind Queue
+Request handlers hand rows to an in-memory queue and return immediately; a background
+thread groups them per table and bulk-loads each group with Database.copy_rows.
+'''
+
+import atexit
+import queue
+import threading
+import time
+
+
+class WriteBehindQueue:
+    def __init__(self, db, batch_size: int = 500, flush_interval: float = 1.0, max_pending: int = 100_000):
+        """
+        :param db: Database to write to.
+        :param batch_size: Flush once this many rows are pending.
+        :param flush_interval: Flush at least this often (seconds) while rows are pending.
+        :param max_pending: Rows held in memory before new rows are dropped (and counted).
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._flush_requests = queue.Queue()
+        self._stop = threading.Event()
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.failed_batches = 0
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, table: str, columns: tuple, row: tuple, key_columns: tuple = None) -> bool:
+        """
+        Queues one row without blocking.
+        :param table: Schema-qualified table name.
+        :param columns: Column names for the row values.
+        :param row: Row values.
+        :param key_columns: Unique key to upsert on; rows are plain-inserted when omitted.
+        :return: False if the queue was full and the row was dropped.
+        """
+        try:
+            self._queue.put_nowait((table, tuple(columns), tuple(row), key_columns and tuple(key_columns)))
+            return True
+        except queue.Full:
+            self.rows_dropped += 1
+            return False
+
+    def submit_many(self, table: str, columns: tuple, rows: list, key_columns: tuple = None) -> int:
+        """
+        Queues several rows for the same table.
+        :return: Number of rows accepted.
+        """
+        return sum(self.submit(table, columns, row, key_columns) for row in rows)
+
+    def flush(self, timeout: float = None):
+        """
+        Blocks until everything queued before this call has been written.
+        """
+        done = threading.Event()
+        self._flush_requests.put(done)
+        done.wait(timeout)
+
+    def _drain(self, limit: int) -> list:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _write(self, items: list):
+        groups = {}
+        for table, columns, row, key_columns in items:
+            groups.setdefault((table, columns, key_columns), []).append(row)
+        for (table, columns, key_columns), rows in groups.items():
+            try:
+                if key_columns:
+                    self.rows_written += self.db.upsert_rows(table, list(columns), rows, list(key_columns))
+                else:
+                    self.rows_written += self.db.copy_rows(table, list(columns), rows)
+            except Exception as e:
+                self.failed_batches += 1
+                print(f"Write-behind flush to {table} failed ({len(rows)} rows): {str(e)}")
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                done = self._flush_requests.get(timeout=min(self.flush_interval, 0.1))
+            except queue.Empty:
+                done = None
+
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if done is not None or due or self._queue.qsize() >= self.batch_size:
+                while True:
+                    items = self._drain(self.batch_size)
+                    if items:
+                        self._write(items)
+                    if len(items) < self.batch_size:
+                        break
+                last_flush = time.monotonic()
+            if done is not None:
+                done.set()
+
+        self._write(self._drain(self._queue.qsize() + 1))
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "failed_batches": self.failed_batches
+        }
+
+    def close(self):
+        """
+        Writes out whatever is still queued and stops the background thread.
+        """
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join(timeout=10)
@@ -0,0 +1,58 @@
+'''
+Gunicorn Production Configuration
+Run from backend/:
+    gunicorn -c gunicorn.conf.py "app:create_app(preload=True)"
+
+The app is imported and warmed once in the master (preload_app), so fetchers, caches,
+the ZIP index, appliance data and forecasting models are shared copy-on-write by every
+worker, and no request pays for a cold start. Database pools and background threads
+cannot cross a fork, so each worker opens its own in post_fork.
+'''
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+preload_app = True
+
+# Threaded workers: upstream calls already run on each worker's asyncio loop, and
+# /api/stream connections each hold a thread that mostly sleeps on its mailbox.
+# STREAM_MAX_CONNECTIONS (default: half the threads) caps those per worker so streams
+# cannot starve ordinary requests; past it clients get a 503 and retry.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.getenv("GUNICORN_THREADS", 32))
+# Each worker also starts its own /api/simulate process pool (SIMULATION_PROCESSES, default:
+# the CPUs split between workers) and fleet cache (SIMULATION_FLEET_CACHE_BYTES)
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+# Time for a stopping worker to finish requests and flush telemetry and queued writes
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Recycle workers now and then to bound memory growth; jitter avoids restarting them all at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 50_000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 5_000))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Metric snapshots from a previous run would be summed into this one's. The app was
+    # already preloaded, so the master's own snapshot (warmup requests) is kept.
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.endswith((".json", ".tmp")) and name != f"{os.getpid()}.json":
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):
+    import app
+    app.init_worker_state()
+
+
+def worker_exit(server, worker):
+    import app
+    app.close_worker_state()
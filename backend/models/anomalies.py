@@ -0,0 +1,571 @@
+'''
+Streaming Device Anomaly Detection
+Scores telemetry readings against each device's normal profile as they are ingested:
+an exponentially weighted mean and variance of kWh per reading for each hour of the
+day (UTC). Two kinds of alert are raised:
+  - spike: a single reading many standard deviations from its hour's profile
+  - shift: a sustained departure, tracked with an EWMA control chart over the
+    standardized residuals (e.g. a fridge stuck at compressor-on, or a heating element
+    that stopped drawing power), which single readings inside the normal spread miss
+
+State lives in flat arrays indexed by device_id (24 means, variances and counts plus
+the chart value and last alert time per device, about 250 bytes), so 1M devices fit in
+about 250 MB and a batch is scored with array operations instead of per-device objects.
+Profiles assume a device reports at a fixed interval.
+
+Scoring needs every reading of a device in one place, so it does not happen in the
+request path (each gunicorn worker only sees a share of the stream). AnomalyScorer reads
+EnergyConsumptionLog past a log_id watermark, like the usage rollups, in the one worker
+holding the lock on "<state path>.lock". Alerts go to energy_usage.DeviceAnomalyAlerts,
+which every worker reads; the other workers reload the saved profiles for display.
+
+Profiles can be seeded from the EnergyConsumptionLog history (from backend/):
+    python -m models.anomalies --seed-days 14
+'''
+
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from data.instrumentation import ANOMALY_ALERTS, log_event
+from data.leader_lock import LeaderLock
+from database.rollups import WATERMARK_TABLE, CommittedCutoff
+
+DEFAULT_STATE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "uems", "anomaly_state.npz")
+HOURS = 24
+HOUR_MS = 3_600_000
+KINDS = ("spike", "shift")
+ALERT_DTYPE = np.dtype([("device_id", np.int64), ("timestamp", np.int64), ("kind", np.uint8),
+                        ("energy_kWh", np.float64), ("expected_kWh", np.float64), ("score", np.float32)])
+# last_alert of devices that never alerted (far enough from int64 min not to overflow)
+NEVER = -2 ** 62
+STATE_ARRAYS = ("mean", "var", "count", "shift", "last_alert")
+
+HISTORY_QUERY = """
+SELECT log_id, device_id, timestamp, energy_used_kWh FROM energy_usage.EnergyConsumptionLog
+WHERE log_id > %s AND timestamp >= %s
+ORDER BY log_id
+LIMIT %s
+"""
+
+DELTA_QUERY = """
+SELECT log_id, device_id, timestamp, energy_used_kWh FROM energy_usage.EnergyConsumptionLog
+WHERE log_id > %s AND log_id <= %s
+ORDER BY log_id
+LIMIT %s
+"""
+
+ALERT_TABLE = "energy_usage.DeviceAnomalyAlerts"
+ALERT_COLUMNS = ("device_id", "timestamp", "kind", "energy_kWh", "expected_kWh", "score")
+WATERMARK_NAME = "anomaly_scoring"
+
+
+class AnomalyDetector:
+    def __init__(self, alpha: float = 0.02, warmup: int = 24, spike_threshold: float = 6.0,
+                 shift_weight: float = 0.05, shift_threshold: float = 5.0, min_std: float = 0.001,
+                 relative_std: float = 0.05, cooldown_seconds: float = 21600.0, max_device_id: int = 10_000_000,
+                 alert_capacity: int = 10_000, path: str = None):
+        """
+        :param alpha: EWMA weight of each new reading in its hour's profile (after warm-up,
+            profiles start as plain running means).
+        :param warmup: Readings an hour bucket needs before readings in it are scored.
+        :param spike_threshold: Standard deviations from the profile that make a reading a spike.
+        :param shift_weight: EWMA weight of the control chart (smaller reacts to smaller,
+            longer shifts).
+        :param shift_threshold: Control limit of the chart, in standard deviations of the
+            chart statistic.
+        :param min_std, relative_std: Floor on the profile's standard deviation (kWh, and as
+            a fraction of its mean), so near-constant devices do not alert on noise.
+        :param cooldown_seconds: Minimum time between alerts for one device (reading time).
+        :param max_device_id: Readings for larger ids are ignored; bounds the state arrays.
+        :param alert_capacity: Recent alerts kept for recent().
+        :param path: State file loaded on start and written by save(); defaults to
+            ANOMALY_STATE_PATH or ~/.cache/uems/anomaly_state.npz. Empty string disables it.
+        """
+        self.alpha = alpha
+        self.warmup = warmup
+        self.spike_threshold = spike_threshold
+        self.shift_weight = shift_weight
+        # Steady-state standard deviation of an EWMA of unit-variance residuals
+        self.shift_limit = shift_threshold * np.sqrt(shift_weight / (2 - shift_weight))
+        self.min_std = min_std
+        self.relative_std = relative_std
+        self.cooldown_ms = int(cooldown_seconds * 1000)
+        self.max_device_id = max_device_id
+        self.path = os.getenv("ANOMALY_STATE_PATH", DEFAULT_STATE_PATH) if path is None else path
+        self._alerts = np.zeros(alert_capacity, dtype=ALERT_DTYPE)
+        self._alerts_written = 0
+        self._lock = threading.Lock()
+        self.readings_seen = 0
+        self.readings_scored = 0
+        self.readings_ignored = 0
+        self.alert_counts = dict.fromkeys(KINDS, 0)
+        self.last_batch_seconds = None
+        self._allocate(0)
+        if self.path and os.path.exists(self.path):
+            try:
+                self.load(self.path)
+            except Exception as e:
+                print(f"Ignoring unreadable anomaly state {self.path}: {str(e)}")
+                self._allocate(0)
+
+    def _allocate(self, capacity: int):
+        self.mean = np.zeros((capacity, HOURS), dtype=np.float32)
+        self.var = np.zeros((capacity, HOURS), dtype=np.float32)
+        self.count = np.zeros((capacity, HOURS), dtype=np.uint16)
+        self.shift = np.zeros(capacity, dtype=np.float32)
+        self.last_alert = np.full(capacity, NEVER, dtype=np.int64)
+
+    def _ensure_capacity(self, device_id: int):
+        capacity = len(self.shift)
+        if device_id < capacity:
+            return
+        # Grow geometrically so a stream of new devices costs amortized O(1) copies
+        grown = min(max(device_id + 1, capacity * 2, 1024), self.max_device_id + 1)
+        old = {name: getattr(self, name) for name in STATE_ARRAYS}
+        self._allocate(grown)
+        for name, values in old.items():
+            getattr(self, name)[:capacity] = values
+
+    def observe(self, device_ids: np.ndarray, timestamps_ms: np.ndarray, energy_kwh: np.ndarray,
+                alert: bool = True, record: bool = True) -> np.ndarray:
+        """
+        Scores a batch of readings in time order per device, then folds them into the profiles.
+        :param alert: False to only learn (e.g. when seeding from history).
+        :param record: False to leave the alerts out of recent() and the counters until the
+            caller passes them to record() (e.g. once they are stored).
+        :return: Alerts raised, as an ALERT_DTYPE array (at most one per device per batch).
+        """
+        started = time.perf_counter()
+        device_ids = np.asarray(device_ids, dtype=np.int64)
+        timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+        energy_kwh = np.asarray(energy_kwh, dtype=np.float64)
+        valid = (device_ids >= 0) & (device_ids <= self.max_device_id) & np.isfinite(energy_kwh)
+        if not valid.all():
+            device_ids, timestamps_ms, energy_kwh = device_ids[valid], timestamps_ms[valid], energy_kwh[valid]
+        n = len(device_ids)
+        if not n:
+            return np.zeros(0, dtype=ALERT_DTYPE)
+
+        order = np.lexsort((timestamps_ms, device_ids))
+        devices, timestamps, energy = device_ids[order], timestamps_ms[order], energy_kwh[order]
+        hours = (timestamps // HOUR_MS) % HOURS
+        # Position of each reading among its device's readings in this batch. Readings with
+        # the same position belong to distinct devices, so each round of the loop below is
+        # one vectorized update; a device's readings are applied in time order.
+        starts = np.flatnonzero(np.diff(devices, prepend=-1))
+        rank = np.arange(n) - np.repeat(starts, np.diff(np.append(starts, n)))
+        by_rank = np.argsort(rank, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(rank))])
+
+        expected = np.zeros(n)
+        residual = np.zeros(n, dtype=np.float32)
+        chart = np.zeros(n, dtype=np.float32)
+        scored = np.zeros(n, dtype=bool)
+        with self._lock:
+            self._ensure_capacity(int(devices[-1]))
+            for k in range(len(bounds) - 1):
+                rows = by_rank[bounds[k]:bounds[k + 1]]
+                d, h, x = devices[rows], hours[rows], energy[rows]
+                mean, var, count = self.mean[d, h], self.var[d, h], self.count[d, h]
+                std = np.maximum(np.sqrt(var), self.min_std + self.relative_std * np.abs(mean))
+                r = (x - mean) / std
+                ready = count >= self.warmup
+                # Clipped so one extreme reading cannot push the chart past its limit alone
+                shift = np.where(ready, (1 - self.shift_weight) * self.shift[d] +
+                                 self.shift_weight * np.clip(r, -self.spike_threshold, self.spike_threshold),
+                                 self.shift[d])
+                self.shift[d] = shift
+                expected[rows], residual[rows], chart[rows], scored[rows] = mean, r, shift, ready
+
+                # Outliers are winsorized before they update the profile, so a spike barely
+                # moves it while a lasting change is still learned, slowly
+                x = np.where(ready, np.clip(x, mean - self.spike_threshold * std, mean + self.spike_threshold * std), x)
+                weight = np.maximum(self.alpha, 1.0 / (count.astype(np.float32) + 1))
+                diff = x - mean
+                increment = weight * diff
+                self.mean[d, h] = mean + increment
+                self.var[d, h] = (1 - weight) * (var + diff * increment)
+                self.count[d, h] = np.minimum(count.astype(np.int64) + 1, np.iinfo(np.uint16).max)
+
+            alerts = np.zeros(0, dtype=ALERT_DTYPE)
+            if alert:
+                spike = scored & (np.abs(residual) >= self.spike_threshold)
+                candidates = np.flatnonzero(spike | (scored & (np.abs(chart) >= self.shift_limit)))
+                # The first alerting reading of each device, unless the device alerted recently
+                _, first = np.unique(devices[candidates], return_index=True)
+                candidates = candidates[first]
+                candidates = candidates[timestamps[candidates] - self.last_alert[devices[candidates]] >= self.cooldown_ms]
+                alerts = np.zeros(len(candidates), dtype=ALERT_DTYPE)
+                alerts["device_id"] = devices[candidates]
+                alerts["timestamp"] = timestamps[candidates]
+                alerts["kind"] = np.where(spike[candidates], KINDS.index("spike"), KINDS.index("shift"))
+                alerts["energy_kWh"] = energy[candidates]
+                alerts["expected_kWh"] = expected[candidates]
+                alerts["score"] = np.where(spike[candidates], residual[candidates],
+                                           chart[candidates] / self.shift_limit * self.spike_threshold)
+                self.last_alert[alerts["device_id"]] = alerts["timestamp"]
+                if record:
+                    self._record(alerts)
+            self.readings_seen += n
+            self.readings_scored += int(scored.sum())
+            self.readings_ignored += int((~valid).sum())
+            self.last_batch_seconds = round(time.perf_counter() - started, 6)
+        return alerts
+
+    def record(self, alerts: np.ndarray):
+        """
+        Adds alerts returned by observe(record=False) to recent() and the counters.
+        """
+        with self._lock:
+            self._record(alerts)
+
+    def snapshot(self, device_ids: np.ndarray) -> tuple:
+        """
+        Copies the state of the given devices, so observing a batch of their readings can be
+        undone with restore().
+        """
+        device_ids = np.asarray(device_ids, dtype=np.int64)
+        with self._lock:
+            devices = np.unique(device_ids[(device_ids >= 0) & (device_ids <= self.max_device_id)])
+            known = devices[devices < len(self.shift)]
+            rows = {name: getattr(self, name)[known].copy() for name in STATE_ARRAYS}
+            return devices, known, rows, (self.readings_seen, self.readings_scored, self.readings_ignored)
+
+    def restore(self, snapshot: tuple):
+        """
+        Puts back the state saved by snapshot(), dropping what was learned since.
+        """
+        devices, known, rows, counters = snapshot
+        with self._lock:
+            for name, values in rows.items():
+                getattr(self, name)[known] = values
+            # Devices first seen since the snapshot return to the empty state
+            new = np.setdiff1d(devices, known)
+            new = new[new < len(self.shift)]
+            self.mean[new], self.var[new], self.count[new], self.shift[new] = 0, 0, 0, 0
+            self.last_alert[new] = NEVER
+            self.readings_seen, self.readings_scored, self.readings_ignored = counters
+
+    def _record(self, alerts: np.ndarray):
+        capacity = len(self._alerts)
+        positions = (self._alerts_written + np.arange(len(alerts))) % capacity
+        # Only the newest alerts survive when a batch holds more than the ring
+        self._alerts[positions[-capacity:]] = alerts[-capacity:]
+        self._alerts_written += len(alerts)
+        for code, kind in enumerate(KINDS):
+            raised = int((alerts["kind"] == code).sum())
+            if raised:
+                self.alert_counts[kind] += raised
+                ANOMALY_ALERTS.inc(raised, kind)
+        if len(alerts):
+            log_event("anomaly_alerts", alerts=len(alerts), devices=alerts["device_id"][:20].tolist())
+
+    def recent(self, device_id: int = None, since_ms: int = None, limit: int = 100) -> list:
+        """
+        Most recent alerts first, optionally for one device or after a reading time.
+        """
+        with self._lock:
+            capacity = len(self._alerts)
+            count = min(self._alerts_written, capacity)
+            positions = (self._alerts_written - 1 - np.arange(count)) % capacity
+            alerts = self._alerts[positions]
+        if device_id is not None:
+            alerts = alerts[alerts["device_id"] == device_id]
+        if since_ms is not None:
+            alerts = alerts[alerts["timestamp"] > since_ms]
+        alerts = alerts[:limit]
+        return [{
+            "device_id": int(a["device_id"]),
+            "timestamp": str(np.datetime64(int(a["timestamp"]), "ms")),
+            "kind": KINDS[a["kind"]],
+            "energy_kWh": round(float(a["energy_kWh"]), 6),
+            "expected_kWh": round(float(a["expected_kWh"]), 6),
+            "score": round(float(a["score"]), 2)
+        } for a in alerts]
+
+    def profile(self, device_id: int) -> dict:
+        """
+        :return: The device's hourly profile (UTC hours), or None for an unknown device.
+        """
+        with self._lock:
+            if not 0 <= device_id < len(self.shift) or not self.count[device_id].any():
+                return None
+            return {
+                "device_id": device_id,
+                "mean_kWh": np.round(self.mean[device_id].astype(np.float64), 6).tolist(),
+                "std_kWh": np.round(np.sqrt(self.var[device_id].astype(np.float64)), 6).tolist(),
+                "readings": self.count[device_id].tolist(),
+                "shift": round(float(self.shift[device_id] / self.shift_limit * self.spike_threshold), 2)
+            }
+
+    def seed(self, db, days: int = 14, batch_rows: int = 500_000) -> int:
+        """
+        Learns profiles from the last days of EnergyConsumptionLog without raising alerts.
+        :return: Readings read.
+        """
+        since = str(np.datetime64("now", "s") - np.timedelta64(days, "D"))
+        last_id, total = 0, 0
+        while True:
+            rows = db.query(HISTORY_QUERY, (last_id, since, batch_rows))
+            if not rows:
+                return total
+            log_ids, device_ids, timestamps, energy = zip(*rows)
+            self.observe(np.array(device_ids, dtype=np.int64),
+                         np.array(timestamps, dtype="datetime64[ms]").astype(np.int64),
+                         np.array(energy, dtype=np.float64), alert=False)
+            last_id, total = max(log_ids), total + len(rows)
+
+    def save(self, path: str = None):
+        path = path or self.path
+        with self._lock:
+            arrays = {name: getattr(self, name) for name in STATE_ARRAYS}
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                np.savez(f, **arrays)
+        os.replace(temporary, path)
+
+    def load(self, path: str):
+        with np.load(path) as saved:
+            with self._lock:
+                for name in STATE_ARRAYS:
+                    setattr(self, name, saved[name][:self.max_device_id + 1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            state_bytes = sum(getattr(self, name).nbytes for name in STATE_ARRAYS)
+            return {
+                "devices": int(self.count.any(axis=1).sum()),
+                "capacity": len(self.shift),
+                "state_MB": round(state_bytes / 1e6, 1),
+                "readings_seen": self.readings_seen,
+                "readings_scored": self.readings_scored,
+                "readings_ignored": self.readings_ignored,
+                "alerts": dict(self.alert_counts),
+                "last_batch_seconds": self.last_batch_seconds
+            }
+
+    def close(self):
+        """
+        Writes the profiles to the state file, so a restart does not start cold.
+        """
+        if self.path:
+            self.save(self.path)
+
+
+class AnomalyScorer:
+    def __init__(self, db, detector: AnomalyDetector, interval: float = 5.0, batch_rows: int = 100_000,
+                 save_interval: float = 60.0):
+        """
+        Scores stored telemetry with one detector per deployment (see the module docstring).
+        :param db: Database holding EnergyConsumptionLog and the alert table.
+        :param detector: This process's detector; scores only while this process holds the lock.
+        :param interval: Seconds between scoring runs; 0 disables the background thread.
+        :param batch_rows: Log rows scored per transaction.
+        :param save_interval: Seconds between saves of the leader's profiles, which the other
+            processes reload (so /api/anomalies profiles lag by up to about this long).
+        """
+        self.db = db
+        self.detector = detector
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self.save_interval = save_interval
+        self.leader = False
+        self._leader_lock = LeaderLock(f"{detector.path}.lock") if detector.path else None
+        self._committed = CommittedCutoff(db)
+        self._state_mtime = self._mtime()
+        self._saved_at = time.time()
+        self._score_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.rows_scored = 0
+        self.runs = 0
+        self.failed_runs = 0
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(target=self._run, name="anomaly-scoring", daemon=True)
+            self._thread.start()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.detector.path).st_mtime_ns if self.detector.path else None
+        except FileNotFoundError:
+            return None
+
+    def _lead(self) -> bool:
+        was_leader = self.leader
+        self.leader = self._leader_lock is None or self._leader_lock.acquire()
+        if self.leader and not was_leader:
+            # Continue from the previous leader's last saved profiles
+            self.reload()
+        return self.leader
+
+    def reload(self) -> bool:
+        """
+        Loads the detector's state file if another process saved it since this one last did.
+        """
+        mtime = self._mtime()
+        if mtime is None or mtime == self._state_mtime:
+            return False
+        self.detector.load(self.detector.path)
+        self._state_mtime = mtime
+        return True
+
+    def _score_batch(self, cutoff: int) -> int:
+        """
+        Scores one batch of log rows past the watermark; the alerts and the new watermark
+        commit together. If they do not, the detector is rolled back to its state before the
+        batch, which is then scored again on the next run.
+        """
+        snapshot = alerts = None
+        try:
+            with self.db.connection() as conn:
+                cur = conn.cursor()
+                # Starts at the current end of the log: history is learned with seed(), not alerted on
+                cur.execute(self.db.sql(
+                    f"INSERT INTO {WATERMARK_TABLE} (name, last_log_id) "
+                    "SELECT %s, COALESCE(MAX(log_id), 0) FROM energy_usage.EnergyConsumptionLog WHERE TRUE "
+                    "ON CONFLICT (name) DO NOTHING"
+                ), (WATERMARK_NAME,))
+                lock = " FOR UPDATE" if self.db.dialect == "postgresql" else ""
+                cur.execute(self.db.sql(f"SELECT last_log_id FROM {WATERMARK_TABLE} WHERE name = %s{lock}"),
+                            (WATERMARK_NAME,))
+                watermark = cur.fetchone()[0]
+                if watermark >= cutoff:
+                    return 0
+                cur.execute(self.db.sql(DELTA_QUERY), (watermark, cutoff, self.batch_rows))
+                rows = cur.fetchall()
+                if not rows:
+                    return 0
+
+                log_ids, device_ids, timestamps, energy = zip(*rows)
+                device_ids = np.array(device_ids, dtype=np.int64)
+                snapshot = self.detector.snapshot(device_ids)
+                timestamps = np.array(timestamps, dtype="datetime64[ms]").astype(np.int64)
+                alerts = self.detector.observe(device_ids, timestamps, np.array(energy, dtype=np.float64),
+                                               record=False)
+                if len(alerts):
+                    cur.executemany(self.db.sql(
+                        f"INSERT INTO {ALERT_TABLE} ({', '.join(ALERT_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)"
+                    ), list(zip(
+                        alerts["device_id"].tolist(),
+                        np.datetime_as_string(alerts["timestamp"].astype("datetime64[ms]"), unit="ms").tolist(),
+                        [KINDS[k] for k in alerts["kind"]],
+                        np.round(alerts["energy_kWh"], 6).tolist(),
+                        np.round(alerts["expected_kWh"], 6).tolist(),
+                        np.round(alerts["score"].astype(np.float64), 2).tolist()
+                    )))
+                cur.execute(self.db.sql(f"UPDATE {WATERMARK_TABLE} SET last_log_id = %s, "
+                                        "updated_at = CURRENT_TIMESTAMP WHERE name = %s"),
+                            (max(log_ids), WATERMARK_NAME))
+        except Exception:
+            if snapshot is not None:
+                self.detector.restore(snapshot)
+            raise
+        self.detector.record(alerts)
+        return len(rows)
+
+    def score(self) -> int:
+        """
+        Scores every committed log row past the watermark.
+        :return: Log rows scored.
+        """
+        with self._score_lock:
+            max_log_id = self.db.query("SELECT MAX(log_id) FROM energy_usage.EnergyConsumptionLog")[0][0] or 0
+            cutoff = self._committed.advance(max_log_id)
+            scored = 0
+            while True:
+                n = self._score_batch(cutoff)
+                scored += n
+                if n < self.batch_rows:
+                    break
+            self.rows_scored += scored
+            self.runs += 1
+            return scored
+
+    def _run(self):
+        while True:
+            try:
+                if self._lead():
+                    self.score()
+                    if self.detector.path and time.time() - self._saved_at >= self.save_interval:
+                        self.detector.save()
+                        self._state_mtime, self._saved_at = self._mtime(), time.time()
+                else:
+                    self.reload()
+            except Exception as e:
+                self.failed_runs += 1
+                print(f"Anomaly scoring failed: {str(e)}")
+            if self._stop.wait(self.interval):
+                return
+
+    def recent(self, device_id: int = None, since_ms: int = None, limit: int = 100) -> list:
+        """
+        Most recent stored alerts first, optionally for one device or after a reading time.
+        """
+        conditions, params = [], []
+        if device_id is not None:
+            conditions.append("device_id = %s")
+            params.append(int(device_id))
+        if since_ms is not None:
+            conditions.append("timestamp > %s")
+            params.append(np.datetime_as_string(np.datetime64(int(since_ms), "ms"), unit="ms"))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.db.query(
+            f"SELECT {', '.join(ALERT_COLUMNS)} FROM {ALERT_TABLE}{where} ORDER BY alert_id DESC LIMIT %s",
+            tuple(params) + (int(limit),)
+        )
+        return [{
+            "device_id": int(device),
+            "timestamp": str(np.datetime64(timestamp, "ms")),
+            "kind": kind,
+            "energy_kWh": round(float(energy), 6),
+            "expected_kWh": round(float(expected), 6),
+            "score": round(float(score), 2)
+        } for device, timestamp, kind, energy, expected, score in rows]
+
+    def profile(self, device_id: int) -> dict:
+        return self.detector.profile(device_id)
+
+    def stats(self) -> dict:
+        return {
+            **self.detector.stats(),
+            "leader": self.leader,
+            "rows_scored": self.rows_scored,
+            "runs": self.runs,
+            "failed_runs": self.failed_runs
+        }
+
+    def close(self):
+        """
+        Stops scoring; the leader saves its profiles and hands the lock to another process.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        if self.leader:
+            self.detector.close()
+            if self._leader_lock is not None:
+                self._leader_lock.release()
+            self.leader = False
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from database.db import Database
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Seed device anomaly profiles from the consumption log.")
+    parser.add_argument("--seed-days", type=int, default=14)
+    args = parser.parse_args()
+
+    database = Database.from_env()
+    if database is None:
+        print("Error: DATABASE_URL is not set")
+        exit(1)
+    detector = AnomalyDetector()
+    started = time.perf_counter()
+    readings = detector.seed(database, args.seed_days)
+    detector.close()
+    print(f"Seeded from {readings} readings in {time.perf_counter() - started:.1f}s; {detector.stats()}")
@@ -0,0 +1,528 @@
+'''
+Weather-Normalized Usage Baselines
+Per-household change-point regressions of daily kWh on outdoor temperature:
+
+    kWh/day = base + heating_slope * max(heating_balance - T, 0) + cooling_slope * max(T - cooling_balance, 0)
+
+with the balance points picked per household from a grid of candidates (either term may
+be absent). Every candidate model of every household is solved at once from running
+sums over days (counts, degree-day sums, products and kWh-weighted sums), so the whole
+fleet is fitted with batched 3x3 normal equations and no per-household loop. The sums
+only ever grow, so new days are folded in without touching history and the refit costs
+the same no matter how long the history is.
+
+Daily kWh comes from the household usage rollups; daily temperatures from the forecasts
+stored in others.WeatherForecast for the gridpoint nearest each household's address (see
+forecasting.DailyTemperatures). Households are folded in one batch per gridpoint; those
+with no stored gridpoint nearby get no baseline.
+
+Every gunicorn worker builds an engine, but only one per cache file updates it: the worker
+holding an exclusive lock on "<path>.lock" folds and saves, the others reload the saved
+cache when it changes. When that worker exits the lock passes to another one.
+
+Usage (from backend/):
+    python -m models.baseline --rebuild
+'''
+
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from data.leader_lock import LeaderLock
+from models.forecasting import DailyTemperatures
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "uems", "baseline.npz")
+# Candidate balance points (F)
+HEATING_POINTS = np.arange(45.0, 65.1, 2.5)
+COOLING_POINTS = np.arange(60.0, 80.1, 2.5)
+# Tiny ridge on the slopes keeps candidates whose degree-days are all zero solvable (slope 0)
+SLOPE_RIDGE = 1e-6
+# How often processes that do not update the cache check it for the updater's saves
+RELOAD_SECONDS = 60
+
+
+def degree_days(temperature_f: np.ndarray, heating_points: np.ndarray, cooling_points: np.ndarray) -> tuple:
+    """
+    :return: Tuple of (D, I) heating and (D, J) cooling degree-days for every candidate balance point.
+    """
+    temperature = np.asarray(temperature_f, dtype=np.float64)[:, None]
+    return np.maximum(heating_points - temperature, 0.0), np.maximum(temperature - cooling_points, 0.0)
+
+
+def _factorize(ids: np.ndarray) -> tuple:
+    """
+    :return: Tuple (sorted distinct ids, index of each id among them). Uses a lookup
+        table instead of sorting when the ids span a compact range (e.g. SERIAL keys).
+    """
+    if not len(ids):
+        return ids, np.zeros(0, dtype=np.int64)
+    low, span = ids.min(), ids.max() - ids.min() + 1
+    if span > 4 * len(ids) + 1_000_000:
+        return np.unique(ids, return_inverse=True)
+    present = np.bincount(ids - low, minlength=span) > 0
+    lookup = np.cumsum(present) - 1
+    return np.flatnonzero(present) + low, lookup[ids - low]
+
+
+class BaselineEngine:
+    def __init__(self, db=None, rollups=None, interval: float = 3600.0, history_days: int = 365,
+                 settle_days: int = 2, min_days: int = 14, heating_points: np.ndarray = HEATING_POINTS,
+                 cooling_points: np.ndarray = COOLING_POINTS, path: str = None, chunk: int = 2048):
+        """
+        :param db: Database holding others.WeatherForecast (and the rollups).
+        :param rollups: RollupEngine supplying daily household kWh.
+        :param interval: Seconds between background updates by the process holding the cache
+            lock; 0 disables the background thread.
+        :param history_days: Days fitted when starting without a cache.
+        :param settle_days: A day is folded in once it ended this many days ago, leaving time
+            for late telemetry to reach its rollup. Readings arriving after that are not
+            reflected until a rebuild.
+        :param min_days: Days a household needs before it gets a model.
+        :param path: Cache file for the running sums and fits; defaults to BASELINE_CACHE_PATH
+            or ~/.cache/uems/baseline.npz. Empty string disables it (and the coordination
+            between processes sharing it).
+        :param chunk: Households solved per batch, bounding the (chunk, I+1, J+1, 3, 3) stack.
+        """
+        self.db = db
+        self.rollups = rollups
+        self.interval = interval
+        self.history_days = history_days
+        self.settle_days = settle_days
+        self.min_days = min_days
+        self.heating_points = np.asarray(heating_points, dtype=np.float64)
+        self.cooling_points = np.asarray(cooling_points, dtype=np.float64)
+        self.path = os.getenv("BASELINE_CACHE_PATH", DEFAULT_CACHE_PATH) if path is None else path
+        self.chunk = chunk
+        self.temperatures = None
+        self.temperatures_loaded_at = None
+        self.leader = False
+        self._leader_lock = LeaderLock(f"{self.path}.lock") if self.path else None
+        self._cache_mtime = None
+        self.version = 0
+        self.updates = 0
+        self.failed_updates = 0
+        self.last_update_seconds = None
+        self.last_fit_seconds = None
+        self._lock = threading.Lock()
+        self._update_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._reset()
+        if self.path and os.path.exists(self.path):
+            try:
+                self.load(self.path)
+                self._cache_mtime = os.stat(self.path).st_mtime_ns
+            except Exception as e:
+                print(f"Ignoring unreadable baseline cache {self.path}: {str(e)}")
+                self._reset()
+        self._thread = None
+        if interval and db is not None and rollups is not None:
+            self._thread = threading.Thread(target=self._run, name="usage-baselines", daemon=True)
+            self._thread.start()
+
+    # Running sums per household. With I heating and J cooling candidates and h, c their
+    # degree-days on a day: x_sums = [1, h, c, h^2, c^2, h*c (I*J)], y_sums = y * [1, h, c]
+    # and yy = y^2, each summed over the household's days.
+    @property
+    def _sizes(self) -> tuple:
+        i, j = len(self.heating_points), len(self.cooling_points)
+        return 1 + 2 * i + 2 * j + i * j, 1 + i + j
+
+    def _reset(self):
+        x_size, y_size = self._sizes
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.x_sums = np.zeros((0, x_size))
+        self.y_sums = np.zeros((0, y_size))
+        self.yy = np.zeros(0)
+        self.through = None
+        self.coef = np.zeros((0, 3))
+        self.balance = np.zeros((0, 2))
+        self.r2 = np.zeros(0)
+        self.cv_rmse = np.zeros(0)
+
+    def _features(self, temperature_f: np.ndarray) -> tuple:
+        heating, cooling = degree_days(temperature_f, self.heating_points, self.cooling_points)
+        cross = (heating[:, :, None] * cooling[:, None, :]).reshape(len(heating), -1)
+        ones = np.ones((len(heating), 1))
+        return (np.hstack([ones, heating, cooling, heating ** 2, cooling ** 2, cross]),
+                np.hstack([ones, heating, cooling]))
+
+    def _rows_for(self, households: np.ndarray) -> np.ndarray:
+        """
+        Row of each (distinct, sorted) household in the sums, adding rows for households
+        not seen before.
+        """
+        new = households[~np.isin(households, self.keys, assume_unique=True)]
+        if len(new):
+            keys = np.union1d(self.keys, new)
+            old_rows = np.searchsorted(keys, self.keys)
+            for name in ("x_sums", "y_sums", "yy"):
+                current = getattr(self, name)
+                grown = np.zeros((len(keys),) + current.shape[1:])
+                grown[old_rows] = current
+                setattr(self, name, grown)
+            self.keys = keys
+        return np.searchsorted(self.keys, households)
+
+    def fold_locations(self, entity_ids: np.ndarray, days: np.ndarray, kwh: np.ndarray,
+                       temperatures: DailyTemperatures) -> int:
+        """
+        Folds daily usage against the temperatures of each household's nearest gridpoint,
+        one batch per gridpoint. Households without one are skipped.
+        :return: Household-days folded.
+        """
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        households = np.unique(entity_ids)
+        gridpoint = temperatures.for_households(self.db, households)[np.searchsorted(households, entity_ids)]
+        order = np.argsort(gridpoint, kind="stable")
+        rows, starts = np.unique(gridpoint[order], return_index=True)
+        days, kwh = np.asarray(days), np.asarray(kwh, dtype=np.float64)
+        folded = 0
+        for row, selected in zip(rows, np.split(order, starts[1:])):
+            if row >= 0:
+                folded += self.fold(entity_ids[selected], days[selected], kwh[selected], temperatures.by_date(row))
+        return folded
+
+    def fold(self, entity_ids: np.ndarray, days: np.ndarray, kwh: np.ndarray, temperatures: dict) -> int:
+        """
+        Adds daily usage of households sharing one temperature series to the running sums.
+        Days without a temperature are skipped.
+        :param entity_ids: Household id per value.
+        :param days: Day of each value (anything np.datetime64 accepts at day precision).
+        :param kwh: kWh used on that day.
+        :param temperatures: Date (YYYY-MM-DD) -> mean temperature (F).
+        :return: Household-days folded.
+        """
+        day_numbers = np.asarray(days).astype("datetime64[D]").astype(np.int64)
+        if not len(day_numbers):
+            return 0
+        first_day = day_numbers.min()
+        timeline = np.arange(first_day, day_numbers.max() + 1).astype("datetime64[D]")
+        temperature = np.array([temperatures.get(d, np.nan) for d in np.datetime_as_string(timeline).tolist()])
+        # Only days that have a temperature become columns
+        used = np.flatnonzero(~np.isnan(temperature))
+        column = np.full(len(timeline), -1)
+        column[used] = np.arange(len(used))
+        day_index = column[day_numbers - first_day]
+        known = day_index >= 0
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)[known]
+        day_index, kwh = day_index[known], np.asarray(kwh, dtype=np.float64)[known]
+        if not len(kwh):
+            return 0
+        x_features, y_features = self._features(temperature[used])
+        households, local = _factorize(entity_ids)
+
+        with self._lock:
+            rows = self._rows_for(households)
+            # Values are grouped by block of households (a linear-time radix sort on the
+            # block number); each block is laid out as a dense (households, days) matrix
+            # and folded with matrix products
+            blocks = local // self.chunk
+            order = np.argsort(blocks.astype(np.uint16) if len(households) < 65536 * self.chunk else blocks,
+                               kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(blocks))])
+            for b, start in enumerate(range(0, len(households), self.chunk)):
+                block = rows[start:start + self.chunk]
+                selected = order[bounds[b]:bounds[b + 1]]
+                cells = (local[selected] - start) * len(used) + day_index[selected]
+                shape = (len(block), len(used))
+                usage = np.bincount(cells, weights=kwh[selected], minlength=shape[0] * shape[1]).reshape(shape)
+                observed = (np.bincount(cells, minlength=shape[0] * shape[1]) > 0).reshape(shape)
+                self.x_sums[block] += observed.astype(np.float64) @ x_features
+                self.y_sums[block] += usage @ y_features
+                self.yy[block] += (usage ** 2).sum(axis=1)
+        return int(len(kwh))
+
+    def _solve(self, x_sums: np.ndarray, y_sums: np.ndarray, yy: np.ndarray) -> tuple:
+        """
+        Fits every candidate model of a block of households and keeps the best per household
+        (lowest BIC among candidates with non-negative base load and slopes).
+        :return: Tuple (coef (n, 3), balance points (n, 2) with NaN for absent terms, r2, cv_rmse).
+        """
+        i, j = len(self.heating_points), len(self.cooling_points)
+        n = len(yy)
+        offsets = np.cumsum([0, 1, i, j, i, j, i * j])
+        count, h, c, hh, cc, hc = (x_sums[:, offsets[k]:offsets[k + 1]] for k in range(6))
+        y, yh, yc = y_sums[:, :1], y_sums[:, 1:1 + i], y_sums[:, 1 + i:]
+        # Candidate 0 of each term is "absent": its degree-days are all zero
+        h, hh, yh = (np.pad(a, ((0, 0), (1, 0))) for a in (h, hh, yh))
+        c, cc, yc = (np.pad(a, ((0, 0), (1, 0))) for a in (c, cc, yc))
+        hc = np.pad(hc.reshape(n, i, j), ((0, 0), (1, 0), (1, 0)))
+
+        # Normal equations of every (heating, cooling) candidate pair, broadcast to (n, I+1, J+1)
+        # and solved in closed form (adjugate of the symmetric 3x3 Gram matrix)
+        g00, g01, g02 = count[:, :, None] + 1e-9, h[:, :, None], c[:, None, :]
+        g11, g12, g22 = hh[:, :, None] + SLOPE_RIDGE, hc, cc[:, None, :] + SLOPE_RIDGE
+        r0, r1, r2 = y[:, :, None], yh[:, :, None], yc[:, None, :]
+        a00 = g11 * g22 - g12 ** 2
+        a01 = g02 * g12 - g01 * g22
+        a02 = g01 * g12 - g02 * g11
+        a11 = g00 * g22 - g02 ** 2
+        a12 = g01 * g02 - g00 * g12
+        a22 = g00 * g11 - g01 ** 2
+        determinant = g00 * a00 + g01 * a01 + g02 * a02
+        coef = np.stack([a00 * r0 + a01 * r1 + a02 * r2,
+                         a01 * r0 + a11 * r1 + a12 * r2,
+                         a02 * r0 + a12 * r1 + a22 * r2], axis=-1) / determinant[..., None]
+
+        # Residual sum of squares from the sums alone: y'y - b'X'y at the least-squares solution
+        sse = np.maximum(yy[:, None, None] - (coef[..., 0] * r0 + coef[..., 1] * r1 + coef[..., 2] * r2), 1e-12)
+        days = np.maximum(count[:, 0], 1.0)[:, None, None]
+        heating_on = np.arange(i + 1)[None, :, None] > 0
+        cooling_on = np.arange(j + 1)[None, None, :] > 0
+        parameters = 1 + 2 * heating_on + 2 * cooling_on
+        score = days * np.log(sse / days) + parameters * np.log(days)
+        valid = (coef >= -1e-9).all(axis=-1)
+        # Heating must switch off at or below the temperature cooling switches on
+        heating_balance = np.concatenate([[-np.inf], self.heating_points])
+        cooling_balance = np.concatenate([[np.inf], self.cooling_points])
+        valid &= (heating_balance[:, None] <= cooling_balance[None, :])[None]
+        score = np.where(valid, score, np.inf)
+        # The base-load-only model is always a candidate
+        score[:, 0, 0] = np.where(np.isfinite(score[:, 0, 0]), score[:, 0, 0], np.finfo(np.float64).max)
+
+        best = score.reshape(n, -1).argmin(axis=1)
+        hi, ci = np.unravel_index(best, (i + 1, j + 1))
+        rows = np.arange(n)
+        chosen = np.maximum(coef[rows, hi, ci], 0.0)
+        chosen[:, 1] *= hi > 0
+        chosen[:, 2] *= ci > 0
+        balance = np.stack([np.where(hi > 0, heating_balance[hi], np.nan),
+                            np.where(ci > 0, cooling_balance[ci], np.nan)], axis=1)
+        chosen_sse = sse[rows, hi, ci]
+        total = np.maximum(yy - y[:, 0] ** 2 / days[:, 0, 0], 1e-12)
+        mean = y[:, 0] / days[:, 0, 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r2 = 1 - chosen_sse / total
+            cv_rmse = np.sqrt(chosen_sse / days[:, 0, 0]) / mean
+        r2, cv_rmse = np.where(count[:, 0] > 0, r2, np.nan), np.where(mean > 0, cv_rmse, np.nan)
+        return chosen, balance, r2, cv_rmse
+
+    def refit(self):
+        """
+        Refits every household from the running sums. Households with fewer than
+        min_days days keep no model (NaN coefficients).
+        """
+        started = time.perf_counter()
+        with self._lock:
+            x_sums, y_sums, yy, keys = self.x_sums.copy(), self.y_sums.copy(), self.yy.copy(), self.keys
+        n = len(keys)
+        coef, balance = np.full((n, 3), np.nan), np.full((n, 2), np.nan)
+        r2, cv_rmse = np.full(n, np.nan), np.full(n, np.nan)
+        for start in range(0, n, self.chunk):
+            block = slice(start, start + self.chunk)
+            coef[block], balance[block], r2[block], cv_rmse[block] = self._solve(x_sums[block], y_sums[block], yy[block])
+        sparse = x_sums[:, 0] < self.min_days
+        coef[sparse], balance[sparse], r2[sparse], cv_rmse[sparse] = np.nan, np.nan, np.nan, np.nan
+        with self._lock:
+            # Households may have been added by a concurrent fold; they stay unfitted until the next refit
+            self.coef, self.balance, self.r2, self.cv_rmse = (
+                self._grow(a, keys) for a in (coef, balance, r2, cv_rmse))
+            self.version += 1
+        self.last_fit_seconds = round(time.perf_counter() - started, 4)
+
+    def _grow(self, values: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        if len(keys) == len(self.keys):
+            return values
+        grown = np.full((len(self.keys),) + values.shape[1:], np.nan)
+        grown[np.searchsorted(self.keys, keys)] = values
+        return grown
+
+    def update(self, until: str = None) -> int:
+        """
+        Folds in the settled days since the last update (the last history_days on the
+        first run), refits and saves the cache.
+        :param until: First day not to fold; defaults to today minus settle_days.
+        :return: Household-days folded.
+        """
+        with self._update_lock:
+            started = time.perf_counter()
+            until = np.datetime64(until, "D") if until else np.datetime64("today", "D") - self.settle_days
+            start = self.through if self.through is not None else until - self.history_days
+            self._load_temperatures()
+            if start >= until:
+                return 0
+            entity_ids, buckets, kwh = self.rollups.series_all("household", str(start), str(until), "day")
+            folded = self.fold_locations(entity_ids, buckets, kwh, self.temperatures)
+            self.through = until
+            if folded or self.version == 0:
+                self.refit()
+            if self.path:
+                self.save(self.path)
+                self._cache_mtime = os.stat(self.path).st_mtime_ns
+            self.updates += 1
+            self.last_update_seconds = round(time.perf_counter() - started, 4)
+            return folded
+
+    def rebuild(self, until: str = None) -> int:
+        """
+        Drops the running sums and refits the last history_days from the rollups, e.g.
+        after late readings or a rollup rebuild.
+        """
+        with self._update_lock, self._lock:
+            self._reset()
+        return self.update(until)
+
+    def _lead(self) -> bool:
+        """
+        Takes (or keeps) the update lock on the cache file without waiting.
+        :return: True when this process is the one that updates the cache.
+        """
+        self.leader = self._leader_lock is None or self._leader_lock.acquire()
+        return self.leader
+
+    def reload(self) -> bool:
+        """
+        Loads the cache file if another process saved it since this one last read or wrote it.
+        :return: True when a newer cache was loaded.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns if self.path else None
+        except FileNotFoundError:
+            return False
+        if mtime is None or mtime == self._cache_mtime:
+            return False
+        self.load(self.path)
+        self._cache_mtime = mtime
+        return True
+
+    def _load_temperatures(self):
+        self.temperatures = DailyTemperatures.from_db(self.db)
+        self.temperatures_loaded_at = time.time()
+
+    def _run(self):
+        updated_at = None
+        while True:
+            try:
+                # Picks up the leader's saves, or the previous leader's after taking over
+                self.reload()
+                now = time.time()
+                if self._lead():
+                    if updated_at is None or now - updated_at >= self.interval:
+                        self.update()
+                        updated_at = now
+                elif self.temperatures_loaded_at is None or now - self.temperatures_loaded_at >= self.interval:
+                    self._load_temperatures()
+            except Exception as e:
+                self.failed_updates += 1
+                print(f"Usage baseline update failed: {str(e)}")
+            if self._stop.wait(min(self.interval, RELOAD_SECONDS)):
+                return
+
+    def temperatures_for(self, household_id: int, days) -> np.ndarray:
+        """
+        Daily temperatures (F) at the gridpoint nearest a household (NaN where none is stored).
+        """
+        if self.temperatures is None:
+            self._load_temperatures()
+        gridpoint = self.temperatures.for_households(self.db, [household_id])
+        if gridpoint[0] < 0:
+            return np.full(len(days), np.nan)
+        return self.temperatures.daily(np.asarray(days, dtype="datetime64[D]"), gridpoint)[:, 0]
+
+    def model(self, household_id: int) -> dict:
+        """
+        :return: The household's fitted baseline, or None when it has no model yet.
+        """
+        with self._lock:
+            row = np.searchsorted(self.keys, household_id)
+            if row >= len(self.coef) or self.keys[row] != household_id or np.isnan(self.coef[row, 0]):
+                return None
+            (base, heating, cooling), (heating_balance, cooling_balance) = self.coef[row], self.balance[row]
+            return {
+                "base_kWh_per_day": float(base),
+                "heating_kWh_per_degree_day": float(heating),
+                "heating_balance_f": None if np.isnan(heating_balance) else float(heating_balance),
+                "cooling_kWh_per_degree_day": float(cooling),
+                "cooling_balance_f": None if np.isnan(cooling_balance) else float(cooling_balance),
+                "days": int(self.x_sums[row, 0]),
+                "r2": None if np.isnan(self.r2[row]) else round(float(self.r2[row]), 4),
+                "cv_rmse": None if np.isnan(self.cv_rmse[row]) else round(float(self.cv_rmse[row]), 4),
+                "version": self.version
+            }
+
+    @staticmethod
+    def expected(model: dict, temperature_f: np.ndarray) -> np.ndarray:
+        """
+        Expected daily kWh at the given temperatures (NaN where the temperature is unknown).
+        """
+        temperature = np.asarray(temperature_f, dtype=np.float64)
+        result = np.full(len(temperature), model["base_kWh_per_day"])
+        if model["heating_balance_f"] is not None:
+            result += model["heating_kWh_per_degree_day"] * np.maximum(model["heating_balance_f"] - temperature, 0)
+        if model["cooling_balance_f"] is not None:
+            result += model["cooling_kWh_per_degree_day"] * np.maximum(temperature - model["cooling_balance_f"], 0)
+        return np.where(np.isnan(temperature), np.nan, result)
+
+    def save(self, path: str):
+        with self._lock:
+            arrays = {name: getattr(self, name) for name in ("keys", "x_sums", "y_sums", "yy", "coef", "balance",
+                                                               "r2", "cv_rmse", "heating_points", "cooling_points")}
+            arrays["through"] = np.array(str(self.through) if self.through is not None else "")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, path)
+
+    def load(self, path: str):
+        """
+        Restores the running sums and fits saved by another process or an earlier run.
+        A cache built with other candidate balance points is ignored.
+        """
+        with np.load(path) as saved:
+            if not (np.array_equal(saved["heating_points"], self.heating_points) and
+                    np.array_equal(saved["cooling_points"], self.cooling_points)):
+                print(f"Ignoring baseline cache {path}: built with other balance points")
+                return
+            with self._lock:
+                for name in ("keys", "x_sums", "y_sums", "yy", "coef", "balance", "r2", "cv_rmse"):
+                    setattr(self, name, saved[name])
+                through = str(saved["through"])
+                self.through = np.datetime64(through, "D") if through else None
+                self.version += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            fitted = int((~np.isnan(self.coef[:, 0])).sum()) if len(self.coef) else 0
+            return {
+                "households": len(self.keys),
+                "fitted": fitted,
+                "through": str(self.through) if self.through is not None else None,
+                "version": self.version,
+                "leader": self.leader,
+                "updates": self.updates,
+                "failed_updates": self.failed_updates,
+                "last_update_seconds": self.last_update_seconds,
+                "last_fit_seconds": self.last_fit_seconds
+            }
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        if self._leader_lock is not None:
+            # Another worker takes over on its next tick
+            self._leader_lock.release()
+            self.leader = False
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from database.db import Database
+    from database.rollups import RollupEngine
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Fit weather-normalized usage baselines for every household.")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the cached sums and refit the full history")
+    parser.add_argument("--history-days", type=int, default=365)
+    parser.add_argument("--until", help="First day not to fold (default: today minus the settle days)")
+    args = parser.parse_args()
+
+    database = Database.from_env()
+    if database is None:
+        print("Error: DATABASE_URL is not set")
+        exit(1)
+    engine = BaselineEngine(database, RollupEngine(database, interval=0), interval=0, history_days=args.history_days)
+    folded = engine.rebuild(args.until) if args.rebuild else engine.update(args.until)
+    print(f"Folded {folded} household-days; {engine.stats()}")
@@ -0,0 +1,370 @@
+'''
+Streaming Appliance Cycle Segmentation
+Splits washing-machine telemetry into cycles and phases (fill, wash, rinse, spin, off)
+as it arrives. Readings from any number of machines are cut into fixed-size windows,
+and each window's features (mean power, power coefficient of variation, vibration
+spread across the accelerometer axes) are computed for all machines at once with
+bincount. Only runs of windows with the same activity class go through the per-machine
+state machine, and every machine's state is one row of fixed-size arrays, so memory is
+constant however long the stream runs.
+
+Activity classes per window, calibrated on the washing-machine log:
+  - idle:     mean power below idle_w (standby)
+  - heat:     heater on (mean power at least heat_w)
+  - spin:     drum vibration (or, without an accelerometer, high steady power)
+  - low:      pumps and valves only (below low_w)
+  - agitate:  tumbling; the motor pulses, so power swings within the window
+Context turns classes into phases: low activity before any washing is fill, heating and
+tumbling are wash until the first drain or spin, after which they are rinse.
+
+Usage (from backend/):
+    python -m models.cycle_phases --source data/training_data/washing-machine-raw.parquet
+'''
+
+import argparse
+import numpy as np
+
+PHASES = ("off", "fill", "wash", "rinse", "spin")
+OFF, FILL, WASH, RINSE, SPIN = range(len(PHASES))
+IDLE, HEAT, SPINNING, LOW, AGITATE = range(5)
+
+# Accumulator columns: power count/sum/sum of squares, then the same for each accelerometer axis
+_POWER = 0
+_AXES = (3, 6, 9)
+_ACC_COLUMNS = 12
+
+
+class CycleSegmenter:
+    def __init__(self, window_s: float = 30, off_after_s: float = 300, idle_w: float = 5, low_w: float = 40,
+                 heat_w: float = 800, spin_min_w: float = 100, spin_vibration: float = 0.2, spin_cv: float = 0.2,
+                 capacity: int = 1024):
+        """
+        :param window_s: Window length in seconds; long enough to span several motor pulses.
+        :param off_after_s: Idle time that ends a cycle (shorter pauses stay in the current phase).
+        :param idle_w, low_w, heat_w: Mean-power thresholds (W) for the idle, low and heat classes.
+        :param spin_min_w: Minimum mean power (W) for a spin window.
+        :param spin_vibration: Accelerometer spread (g, root of the summed axis variances) that marks a spin.
+        :param spin_cv: Without accelerometer data, steady power (std/mean below this) at spin_min_w or more marks a spin.
+        :param capacity: Initial number of machine slots (grown as needed).
+        """
+        self.window_ms = int(window_s * 1000)
+        self.off_after_ms = int(off_after_s * 1000)
+        self.idle_w, self.low_w, self.heat_w = idle_w, low_w, heat_w
+        self.spin_min_w, self.spin_vibration, self.spin_cv = spin_min_w, spin_vibration, spin_cv
+        self._slots = {}
+        self.machine_ids = []
+        self._sorted_ids, self._sorted_slots = np.zeros(0), np.zeros(0, dtype=np.int64)
+        self._allocate(capacity)
+        self.samples = 0
+        self.windows = 0
+        self.late_samples = 0
+
+    def _allocate(self, capacity: int):
+        def grow(name, fill, dtype, shape=()):
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                array[:len(old)] = old
+            setattr(self, name, array)
+
+        grow("_open_w", -1, np.int64)
+        grow("_open", 0.0, np.float64, (_ACC_COLUMNS,))
+        grow("_last_w", -1, np.int64)
+        grow("_phase", OFF, np.int8)
+        grow("_washed", False, bool)
+        grow("_rinsing", False, bool)
+        grow("_cycle_start", -1, np.int64)
+        grow("_phase_start", -1, np.int64)
+        grow("_phase_energy", 0.0, np.float64)
+        grow("_cycle_energy", 0.0, np.float64, (len(PHASES),))
+        grow("_idle_since", -1, np.int64)
+        grow("_idle_energy", 0.0, np.float64)
+        self._capacity = capacity
+
+    def _slots_for(self, machine_ids: np.ndarray) -> np.ndarray:
+        """
+        Slot per reading. Known machines are found with a binary search over the sorted
+        ids; only batches that bring new machines touch the Python dictionary.
+        """
+        if len(self._sorted_ids):
+            position = np.minimum(np.searchsorted(self._sorted_ids, machine_ids), len(self._sorted_ids) - 1)
+            if (self._sorted_ids[position] == machine_ids).all():
+                return self._sorted_slots[position]
+        for machine_id in np.unique(machine_ids).tolist():
+            if machine_id not in self._slots:
+                self._slots[machine_id] = len(self.machine_ids)
+                self.machine_ids.append(machine_id)
+        if len(self.machine_ids) > self._capacity:
+            self._allocate(max(len(self.machine_ids), 2 * self._capacity))
+        ids = np.array(self.machine_ids)
+        order = np.argsort(ids, kind="stable")
+        self._sorted_ids, self._sorted_slots = ids[order], order
+        return self._slots_for(machine_ids)
+
+    def ingest(self, machine_ids, timestamps_ms, power, accel=None) -> list:
+        """
+        Adds a batch of readings, possibly from many machines and in any machine order
+        (each machine's readings must arrive in time order across batches; earlier windows are dropped).
+        :param machine_ids: Machine id per reading.
+        :param timestamps_ms: Epoch milliseconds per reading.
+        :param power: Power in watts (NaN for readings that carry only accelerometer data).
+        :param accel: Optional (n, 3) accelerometer readings in g (NaN where absent).
+        :return: Events completed by this batch (see _emit).
+        """
+        slots = self._slots_for(np.asarray(machine_ids))
+        timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+        windows = timestamps_ms // self.window_ms
+        on_time = windows >= np.maximum(self._open_w[slots], self._last_w[slots] + 1)
+        if not on_time.all():
+            self.late_samples += int((~on_time).sum())
+            slots, windows, timestamps_ms = slots[on_time], windows[on_time], timestamps_ms[on_time]
+            power = np.asarray(power)[on_time]
+            accel = None if accel is None else np.asarray(accel)[on_time]
+        self.samples += len(slots)
+        if not len(slots):
+            return []
+
+        # Windows still open from earlier batches join the aggregation as one pre-summed entry each
+        seen = np.zeros(len(self.machine_ids), dtype=bool)
+        seen[slots] = True
+        carried = np.flatnonzero(seen & (self._open_w[:len(seen)] >= 0))
+        key_slots = np.concatenate([slots, carried])
+        key_windows = np.concatenate([windows, self._open_w[carried]])
+        first_window = int(key_windows.min())
+        span = int(key_windows.max()) - first_window + 1
+        keys = key_slots * span + (key_windows - first_window)
+
+        if len(seen) * span <= 4 * len(keys) + 4096:
+            # Dense key space (a live batch spans a window or two): bin directly, no sort needed
+            occupied = np.bincount(keys, minlength=len(seen) * span) > 0
+            groups = np.flatnonzero(occupied)
+            index = (np.cumsum(occupied) - 1)[keys]
+        else:
+            groups, index = np.unique(keys, return_inverse=True)
+        sums = np.zeros((len(groups), _ACC_COLUMNS))
+        sums[index[len(slots):]] = self._open[carried]
+
+        # Raw sensor rows usually carry one channel each, so every channel is binned over its own rows only
+        channels = [(_POWER, np.asarray(power, dtype=np.float64))]
+        if accel is not None:
+            accel = np.asarray(accel, dtype=np.float64)
+            channels += [(c, accel[:, axis]) for axis, c in enumerate(_AXES)]
+        reading_index = index[:len(slots)]
+        for c, values in channels:
+            present = np.flatnonzero(~np.isnan(values))
+            if not len(present):
+                continue
+            values, at = values[present], reading_index[present]
+            sums[:, c] += np.bincount(at, minlength=len(groups))
+            sums[:, c + 1] += np.bincount(at, weights=values, minlength=len(groups))
+            sums[:, c + 2] += np.bincount(at, weights=values * values, minlength=len(groups))
+        group_slots = groups // span
+        group_windows = groups % span + first_window
+
+        # The newest window of each machine stays open; the rest are complete
+        newest = np.ones(len(groups), dtype=bool)
+        newest[:-1] = group_slots[1:] != group_slots[:-1]
+        self._open_w[group_slots[newest]] = group_windows[newest]
+        self._open[group_slots[newest]] = sums[newest]
+        closed = ~newest
+        return self._process(group_slots[closed], group_windows[closed], sums[closed])
+
+    def flush(self, now_ms: int = None) -> list:
+        """
+        Closes open windows that have ended and ends cycles idle for off_after_s, for
+        machines that stopped reporting. Without now_ms, closes everything (end of stream).
+        """
+        slots = np.flatnonzero(self._open_w[:len(self.machine_ids)] >= 0)
+        if now_ms is not None:
+            slots = slots[(self._open_w[slots] + 1) * self.window_ms <= now_ms]
+        events = self._process(slots, self._open_w[slots], self._open[slots].copy())
+        self._open_w[slots] = -1
+        self._open[slots] = 0.0
+
+        active = np.flatnonzero(self._phase[:len(self.machine_ids)] != OFF)
+        for slot in active.tolist():
+            if self._open_w[slot] >= 0:
+                continue  # still reporting
+            idle_since = int(self._idle_since[slot])
+            if idle_since < 0:
+                idle_since = (int(self._last_w[slot]) + 1) * self.window_ms
+            if now_ms is None or now_ms - idle_since >= self.off_after_ms:
+                self._end_cycle(slot, idle_since, events)
+        return events
+
+    def window_features(self, sums: np.ndarray) -> tuple:
+        """
+        :param sums: (n, 12) accumulator rows.
+        :return: Tuple (mean power W, power coefficient of variation, vibration spread g or NaN).
+        """
+        n = np.maximum(sums[:, _POWER], 1)
+        mean = sums[:, _POWER + 1] / n
+        variance = np.maximum(sums[:, _POWER + 2] / n - mean ** 2, 0.0)
+        cv = np.sqrt(variance) / np.maximum(mean, 1e-9)
+        mean[sums[:, _POWER] == 0] = np.nan
+        spread = np.zeros(len(sums))
+        has_accel = np.ones(len(sums), dtype=bool)
+        for c in _AXES:
+            count = sums[:, c]
+            has_accel &= count >= 2
+            axis_mean = sums[:, c + 1] / np.maximum(count, 1)
+            spread += np.maximum(sums[:, c + 2] / np.maximum(count, 1) - axis_mean ** 2, 0.0)
+        return mean, cv, np.where(has_accel, np.sqrt(spread), np.nan)
+
+    def classify(self, mean: np.ndarray, cv: np.ndarray, vibration: np.ndarray) -> np.ndarray:
+        """
+        Activity class per window (windows without power readings count as idle).
+        """
+        classes = np.full(len(mean), AGITATE, dtype=np.int8)
+        with np.errstate(invalid="ignore"):
+            classes[mean < self.low_w] = LOW
+            spinning = np.where(np.isnan(vibration), cv < self.spin_cv, vibration >= self.spin_vibration)
+            classes[spinning & (mean >= self.spin_min_w)] = SPINNING
+            classes[mean >= self.heat_w] = HEAT
+            classes[(mean < self.idle_w) | np.isnan(mean)] = IDLE
+        return classes
+
+    def _process(self, slots: np.ndarray, windows: np.ndarray, sums: np.ndarray) -> list:
+        events = []
+        if not len(slots):
+            return events
+        self.windows += len(slots)
+        mean, cv, vibration = self.window_features(sums)
+        classes = self.classify(mean, cv, vibration)
+        energy = np.nan_to_num(mean) * (self.window_ms / 3_600_000)
+
+        # Runs of consecutive windows with the same machine and class go through the state machine together
+        breaks = np.ones(len(slots), dtype=bool)
+        breaks[1:] = (slots[1:] != slots[:-1]) | (classes[1:] != classes[:-1]) | (windows[1:] != windows[:-1] + 1)
+        starts = np.flatnonzero(breaks)
+        ends = np.append(starts[1:], len(slots)) - 1
+        run_energy = np.add.reduceat(energy, starts)
+        for slot, cls, first, last, wh in zip(slots[starts].tolist(), classes[starts].tolist(),
+                                              windows[starts].tolist(), windows[ends].tolist(), run_energy.tolist()):
+            previous = int(self._last_w[slot])
+            if previous >= 0 and first > previous + 1:
+                # Missing windows count as idle time
+                self._advance(slot, IDLE, (previous + 1) * self.window_ms, first * self.window_ms, 0.0, events)
+            self._advance(slot, cls, first * self.window_ms, (last + 1) * self.window_ms, wh, events)
+            self._last_w[slot] = last
+        return events
+
+    def _advance(self, slot: int, cls: int, start: int, end: int, energy: float, events: list):
+        phase = int(self._phase[slot])
+        if cls == IDLE:
+            if phase == OFF:
+                return
+            if self._idle_since[slot] < 0:
+                self._idle_since[slot], self._idle_energy[slot] = start, 0.0
+            self._idle_energy[slot] += energy
+            if end - self._idle_since[slot] >= self.off_after_ms:
+                self._end_cycle(slot, int(self._idle_since[slot]), events)
+            return
+
+        if phase == OFF:
+            self._cycle_start[slot] = start
+            self._washed[slot] = self._rinsing[slot] = False
+            self._cycle_energy[slot] = 0.0
+            events.append(self._emit(slot, "cycle_start", time=start))
+        elif self._idle_since[slot] >= 0:
+            # A pause shorter than off_after_s belongs to the phase it interrupted
+            self._phase_energy[slot] += self._idle_energy[slot]
+            self._idle_since[slot] = -1
+
+        if cls == HEAT:
+            new_phase = WASH
+        elif cls == AGITATE:
+            new_phase = RINSE if self._rinsing[slot] else WASH
+        elif cls == SPINNING:
+            new_phase = SPIN
+        elif not self._washed[slot]:
+            new_phase = FILL
+        elif phase == SPIN:
+            new_phase = SPIN  # draining while the drum slows down
+        else:
+            new_phase = RINSE
+        if cls in (HEAT, AGITATE):
+            self._washed[slot] = True
+        elif self._washed[slot]:
+            self._rinsing[slot] = True
+
+        if new_phase != phase:
+            if phase != OFF:
+                events.append(self._phase_end(slot, phase, start))
+            self._phase[slot] = new_phase
+            self._phase_start[slot] = start
+            self._phase_energy[slot] = 0.0
+            events.append(self._emit(slot, "phase_start", phase=PHASES[new_phase], time=start))
+        self._phase_energy[slot] += energy
+
+    def _phase_end(self, slot: int, phase: int, end: int) -> dict:
+        start = int(self._phase_start[slot])
+        energy = float(self._phase_energy[slot])
+        self._cycle_energy[slot, phase] += energy
+        return self._emit(slot, "phase_end", phase=PHASES[phase], start=start, end=end, energy_Wh=round(energy, 3))
+
+    def _end_cycle(self, slot: int, end: int, events: list):
+        events.append(self._phase_end(slot, int(self._phase[slot]), end))
+        totals = self._cycle_energy[slot]
+        events.append(self._emit(slot, "cycle_end", start=int(self._cycle_start[slot]), end=end,
+                                 energy_Wh=round(float(totals.sum()), 3),
+                                 phases={PHASES[p]: round(float(totals[p]), 3) for p in np.flatnonzero(totals)}))
+        self._phase[slot] = OFF
+        self._idle_since[slot] = -1
+
+    def _emit(self, slot: int, event: str, **fields) -> dict:
+        for key in ("time", "start", "end"):
+            if key in fields:
+                fields[key] = str(np.datetime64(fields[key], "ms"))
+        return {"machine_id": self.machine_ids[slot], "event": event, **fields}
+
+    def state(self, machine_id) -> dict:
+        """
+        Current phase of a machine, e.g. {"phase": "wash", "since": "...", "cycle_start": "..."}.
+        """
+        slot = self._slots.get(machine_id)
+        if slot is None or self._phase[slot] == OFF:
+            return {"phase": PHASES[OFF]}
+        return {
+            "phase": PHASES[self._phase[slot]],
+            "since": str(np.datetime64(int(self._phase_start[slot]), "ms")),
+            "cycle_start": str(np.datetime64(int(self._cycle_start[slot]), "ms"))
+        }
+
+    def stats(self) -> dict:
+        return {
+            "machines": len(self.machine_ids),
+            "samples": self.samples,
+            "windows": self.windows,
+            "late_samples_dropped": self.late_samples,
+            "active_cycles": int((self._phase[:len(self.machine_ids)] != OFF).sum())
+        }
+
+
+def sensor_batches(source: str, machine_id=1, chunk_rows: int = 50_000):
+    """
+    Reads a raw washing-machine log as ingest() batches.
+    :return: Generator of (machine_ids, timestamps_ms, power, accel) tuples.
+    """
+    from data.pipelines.sensor_ingest import iter_chunks
+    for timestamps, columns in iter_chunks(source, chunk_rows, channels=["power", "aX", "aY", "aZ"]):
+        accel = np.stack([columns["aX"], columns["aY"], columns["aZ"]], axis=1)
+        yield np.full(len(timestamps), machine_id), timestamps, columns["power"], accel
+
+
+if __name__ == "__main__":
+    from data.pipelines.sensor_ingest import DEFAULT_SOURCE
+
+    parser = argparse.ArgumentParser(description="Segment a washing-machine sensor log into cycles and phases.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE)
+    parser.add_argument("--window-s", type=float, default=30)
+    parser.add_argument("--off-after-s", type=float, default=300)
+    args = parser.parse_args()
+
+    segmenter = CycleSegmenter(window_s=args.window_s, off_after_s=args.off_after_s)
+    for batch in sensor_batches(args.source):
+        for event in segmenter.ingest(*batch):
+            print(event)
+    for event in segmenter.flush():
+        print(event)
+    print(segmenter.stats())
@@ -0,0 +1,496 @@
+'''
+Hourly Load Forecasting
+Ridge regressions on calendar (daily/weekly Fourier terms) and weather (cooling and
+heating degree-hours) features. One ForecastModel holds the coefficients for many
+series at once, one row per appliance or household, so a whole fleet is fitted with
+batched normal equations and forecast with a single matrix product.
+
+Training sources:
+  - appliance models: hourly mean power (W) of every series in the ApplianceStore
+  - household models: hourly kWh from the usage rollups, with daily temperatures
+    from others.WeatherForecast at the gridpoint nearest each household's address
+    (households sharing a gridpoint are fitted together against its series)
+
+Usage (from backend/):
+    python -m models.forecasting --appliances --households
+'''
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+DAILY_HARMONICS = 3
+WEEKLY_HARMONICS = 2
+# Degree-hour base temperature (F)
+BALANCE_POINT_F = 65.0
+HOUR_MS = 3_600_000
+# Share of each series (most recent hours) held out to measure accuracy
+HOLDOUT_FRACTION = 0.2
+# Households farther than this (degrees, about 55 km) from every stored gridpoint get no temperatures
+MAX_GRIDPOINT_DEGREES = 0.5
+
+
+def feature_names(weather: bool) -> list:
+    names = ["bias"]
+    names += [f"{f}_day_{k}" for k in range(1, DAILY_HARMONICS + 1) for f in ("sin", "cos")]
+    names += [f"{f}_week_{k}" for k in range(1, WEEKLY_HARMONICS + 1) for f in ("sin", "cos")]
+    return names + (["cooling_degrees", "heating_degrees"] if weather else [])
+
+
+def build_features(timestamps_ms: np.ndarray, temperature_f: np.ndarray = None) -> np.ndarray:
+    """
+    Feature matrix for hourly timestamps (UTC epoch ms).
+    :param temperature_f: Outdoor temperature per timestamp; adds degree features when given
+        (NaN temperatures contribute 0).
+    :return: float64 array of shape (len(timestamps), len(feature_names(...))).
+    """
+    hours = np.asarray(timestamps_ms, dtype=np.int64) / HOUR_MS
+    columns = [np.ones_like(hours)]
+    for period, harmonics in ((24, DAILY_HARMONICS), (168, WEEKLY_HARMONICS)):
+        # The epoch started on a Thursday; weekly terms only need a consistent phase
+        angle = 2 * np.pi * (hours % period) / period
+        for k in range(1, harmonics + 1):
+            columns += [np.sin(k * angle), np.cos(k * angle)]
+    if temperature_f is not None:
+        temperature = np.nan_to_num(np.asarray(temperature_f, dtype=np.float64), nan=BALANCE_POINT_F)
+        columns += [np.maximum(temperature - BALANCE_POINT_F, 0), np.maximum(BALANCE_POINT_F - temperature, 0)]
+    return np.stack(columns, axis=1)
+
+
+def fit_ridge(X: np.ndarray, Y: np.ndarray, mask: np.ndarray = None, alpha: float = 1.0,
+              chunk: int = 4096) -> np.ndarray:
+    """
+    Ridge fit of many series sharing one feature matrix, each with its own missing hours.
+    :param X: (T, F) features.
+    :param Y: (T, K) targets, one column per series (values where mask is False are ignored).
+    :param mask: (T, K) True where a target is observed (default: all).
+    :param alpha: L2 penalty (the bias term is not penalized).
+    :param chunk: Series solved per batch, bounding the (chunk, F, F) Gram stack.
+    :return: (K, F) coefficients.
+    """
+    T, F = X.shape
+    mask = np.ones(Y.shape, dtype=bool) if mask is None else mask
+    penalty = alpha * np.eye(F)
+    penalty[0, 0] = 0.0
+    coef = np.zeros((Y.shape[1], F))
+    for start in range(0, Y.shape[1], chunk):
+        m = mask[:, start:start + chunk].astype(np.float64)
+        y = np.where(mask[:, start:start + chunk], Y[:, start:start + chunk], 0.0)
+        gram = np.einsum("tk,tf,tg->kfg", m, X, X, optimize=True) + penalty
+        rhs = (X.T @ (m * y)).T
+        # A tiny ridge on the bias keeps series with no observations solvable
+        gram[:, 0, 0] += 1e-9
+        coef[start:start + chunk] = np.linalg.solve(gram, rhs[..., None])[..., 0]
+    return coef
+
+
+class ForecastModel:
+    def __init__(self, name: str, keys: list, coef: np.ndarray, weather: bool, unit: str, meta: dict = None):
+        """
+        :param name: Registry name, e.g. "appliance_load" or "household_load".
+        :param keys: Series ids (appliance names or household ids), one per coef row.
+        :param coef: (len(keys), F) coefficients over feature_names(weather).
+        :param weather: Whether the model uses temperature features.
+        :param unit: Unit of predictions ("W" or "kWh").
+        """
+        self.name = name
+        self.keys = [str(k) for k in keys]
+        self.coef = coef
+        self.weather = weather
+        self.unit = unit
+        self.meta = meta or {}
+        self._rows = {k: i for i, k in enumerate(self.keys)}
+
+    def predict(self, keys: list, timestamps_ms: np.ndarray, temperature_f: np.ndarray = None,
+                locations: np.ndarray = None) -> dict:
+        """
+        Forecasts every requested series over the same timestamps, one matrix product per
+        location. Unknown keys are omitted from the result. A weather model given no
+        temperatures predicts as if it were at the balance point.
+        :param temperature_f: (T,) temperatures shared by every series, or (T, L) temperatures
+            per location (with locations).
+        :param locations: Column of temperature_f for each of keys; -1 for none.
+        :return: key -> float64 array of predictions (negative values clipped to 0).
+        """
+        known = [i for i, k in enumerate(keys) if str(k) in self._rows]
+        if not known:
+            return {}
+        if not self.weather:
+            temperature_f = None
+        elif temperature_f is None:
+            temperature_f = np.full(len(timestamps_ms), np.nan)
+        if locations is not None:
+            locations = np.asarray(locations, dtype=np.int64)[known]
+        coef = self.coef[[self._rows[str(keys[i])] for i in known]]
+        predictions = np.zeros((len(known), len(timestamps_ms)))
+        for X, columns in _design_groups(timestamps_ms, temperature_f, locations, len(known)):
+            predictions[columns] = np.maximum(coef[columns] @ X.T, 0.0)
+        return {keys[i]: predictions[j] for j, i in enumerate(known)}
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "coef.npy"), self.coef)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"name": self.name, "keys": self.keys, "weather": self.weather, "unit": self.unit,
+                       "features": feature_names(self.weather), **self.meta}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "ForecastModel":
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        coef = np.load(os.path.join(directory, "coef.npy"))
+        name, keys, weather, unit = (meta.pop(k) for k in ("name", "keys", "weather", "unit"))
+        meta.pop("features", None)
+        return cls(name, keys, coef, weather, unit, meta)
+
+
+def hourly_means(timestamps: np.ndarray, values: np.ndarray) -> tuple:
+    """
+    Averages a series onto whole UTC hours.
+    :return: Tuple (hour timestamps in epoch ms, mean value per hour), hours without data skipped.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    hours = np.asarray(timestamps).astype("datetime64[h]").astype(np.int64)[valid]
+    if not len(hours):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    offset = hours.min()
+    sums = np.bincount(hours - offset, weights=values[valid])
+    counts = np.bincount(hours - offset)
+    present = np.flatnonzero(counts)
+    return (present + offset) * HOUR_MS, sums[present] / counts[present]
+
+
+def _holdout_mask(mask: np.ndarray) -> np.ndarray:
+    """
+    Marks the last HOLDOUT_FRACTION of each column's observed rows.
+    """
+    counts = mask.sum(axis=0)
+    rank = np.cumsum(mask, axis=0)
+    return mask & (rank > np.ceil(counts * (1 - HOLDOUT_FRACTION)))
+
+
+def _design_groups(timestamps_ms: np.ndarray, temperature_f: np.ndarray, locations: np.ndarray, keys: int) -> list:
+    """
+    Splits the series into groups sharing one feature matrix.
+    :return: List of (X, series columns).
+    """
+    if temperature_f is None or np.ndim(temperature_f) == 1:
+        return [(build_features(timestamps_ms, temperature_f), np.arange(keys))]
+    groups, members = np.unique(locations, return_inverse=True)
+    order = np.argsort(members, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(members, minlength=len(groups)))])
+    return [
+        # Series without a location are fitted as if every hour were at the balance point
+        (build_features(timestamps_ms, temperature_f[:, location] if location >= 0
+                        else np.full(len(timestamps_ms), np.nan)), order[bounds[g]:bounds[g + 1]])
+        for g, location in enumerate(groups)
+    ]
+
+
+def _metrics(groups: list, Y: np.ndarray, mask: np.ndarray, alpha: float) -> dict:
+    test = _holdout_mask(mask)
+    errors, actual = [], []
+    for X, columns in groups:
+        held_out = test[:, columns]
+        coef = fit_ridge(X, Y[:, columns], (mask & ~test)[:, columns], alpha)
+        errors.append((np.maximum(X @ coef.T, 0.0) - Y[:, columns])[held_out])
+        actual.append(np.abs(Y[:, columns][held_out]))
+    errors, actual = np.concatenate(errors), np.concatenate(actual)
+    if not len(errors):
+        return {}
+    return {
+        "MAE": float(np.mean(np.abs(errors))),
+        "RMSE": float(np.sqrt(np.mean(errors ** 2))),
+        # Scale-free error across series of very different sizes
+        "WAPE": float(np.sum(np.abs(errors)) / max(np.sum(actual), 1e-12))
+    }
+
+
+def train(name: str, keys: list, timestamps_ms: np.ndarray, Y: np.ndarray, mask: np.ndarray, unit: str,
+          temperature_f: np.ndarray = None, alpha: float = 1.0, locations: np.ndarray = None) -> ForecastModel:
+    """
+    Measures holdout accuracy, then fits on all observations.
+    :param timestamps_ms: (T,) shared hourly timeline.
+    :param Y, mask: (T, K) targets and observed flags, one column per key.
+    :param temperature_f: (T,) temperatures shared by every series, (T, L) temperatures per
+        location (with locations), or None for a calendar-only model.
+    :param locations: (K,) column of temperature_f for each series; -1 for none.
+    """
+    started = time.perf_counter()
+    groups = _design_groups(timestamps_ms, temperature_f, locations, len(keys))
+    metrics = _metrics(groups, Y, mask, alpha)
+    coef = np.zeros((len(keys), groups[0][0].shape[1]))
+    for X, columns in groups:
+        coef[columns] = fit_ridge(X, Y[:, columns], mask[:, columns], alpha)
+    meta = {
+        "alpha": alpha,
+        "metrics": metrics,
+        "series": len(keys),
+        "observations": int(mask.sum()),
+        "locations": int(np.shape(temperature_f)[1]) if np.ndim(temperature_f) == 2 else None,
+        "trained_from": str(np.datetime64(int(timestamps_ms.min()), "ms")) if len(timestamps_ms) else None,
+        "trained_to": str(np.datetime64(int(timestamps_ms.max()), "ms")) if len(timestamps_ms) else None,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "training_seconds": round(time.perf_counter() - started, 3)
+    }
+    return ForecastModel(name, keys, coef, temperature_f is not None, unit, meta)
+
+
+def _align(series: dict) -> tuple:
+    """
+    key -> (hour timestamps ms, values) into a shared (T, K) matrix with an observed mask.
+    """
+    keys = list(series)
+    timeline = np.unique(np.concatenate([ts for ts, _ in series.values()])) if keys else np.zeros(0, np.int64)
+    Y = np.zeros((len(timeline), len(keys)))
+    mask = np.zeros(Y.shape, dtype=bool)
+    for j, key in enumerate(keys):
+        ts, values = series[key]
+        rows = np.searchsorted(timeline, ts)
+        Y[rows, j] = values
+        mask[rows, j] = True
+    return keys, timeline, Y, mask
+
+
+def train_appliance_model(store, alpha: float = 1.0) -> ForecastModel:
+    """
+    One calendar model per ApplianceStore series, predicting hourly mean power (W).
+    """
+    series = {name: hourly_means(s.timestamps, s.columns["power_consumption"].astype(np.float64))
+              for name, s in store.series.items()}
+    keys, timeline, Y, mask = _align(series)
+    return train("appliance_load", keys, timeline, Y, mask, "W", alpha=alpha)
+
+
+class DailyTemperatures:
+    def __init__(self, gridpoints: list, latitude: np.ndarray, longitude: np.ndarray, days: np.ndarray,
+                 temperature: np.ndarray):
+        """
+        Daily mean forecast temperature per NWS gridpoint.
+        :param gridpoints: Gridpoint keys ("TBW/71,98"), one per row of temperature.
+        :param latitude, longitude: Location of each gridpoint.
+        :param days: datetime64[D] dates, one per column of temperature.
+        :param temperature: (gridpoints, days) mean temperature (F), NaN when not stored.
+        """
+        self.gridpoints = list(gridpoints)
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self.days = np.asarray(days, dtype="datetime64[D]")
+        self.temperature = np.asarray(temperature, dtype=np.float64).reshape(len(self.gridpoints), len(self.days))
+
+    @classmethod
+    def from_db(cls, db) -> "DailyTemperatures":
+        """
+        Averages the day and night periods stored in others.WeatherForecast per gridpoint and date.
+        """
+        rows = db.query(
+            "SELECT gridpoint, AVG(latitude), AVG(longitude), date, AVG(temperature_f) "
+            "FROM others.WeatherForecast GROUP BY gridpoint, date"
+        )
+        if not rows:
+            return cls([], [], [], [], np.zeros((0, 0)))
+        gridpoint, latitude, longitude, date, temperature = zip(*rows)
+        gridpoints, row = np.unique(np.array(gridpoint, dtype=str), return_inverse=True)
+        days, column = np.unique(np.array([str(d)[:10] for d in date], dtype="datetime64[D]"), return_inverse=True)
+        grid = np.full((len(gridpoints), len(days)), np.nan)
+        grid[row, column] = np.array(temperature, dtype=np.float64)
+        coordinates = np.zeros((len(gridpoints), 2))
+        coordinates[row] = np.column_stack([np.array(latitude, dtype=np.float64), np.array(longitude, dtype=np.float64)])
+        return cls(gridpoints.tolist(), coordinates[:, 0], coordinates[:, 1], days, grid)
+
+    def nearest(self, latitude: np.ndarray, longitude: np.ndarray, max_degrees: float = MAX_GRIDPOINT_DEGREES,
+                chunk: int = 4096) -> np.ndarray:
+        """
+        Nearest gridpoint to each location (equirectangular distance).
+        :return: int64 gridpoint row per location; -1 when unknown or farther than max_degrees.
+        """
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        result = np.full(len(latitude), -1, dtype=np.int64)
+        if not self.gridpoints:
+            return result
+        for start in range(0, len(latitude), chunk):
+            lat, lon = latitude[start:start + chunk, None], longitude[start:start + chunk, None]
+            distance = np.hypot(lat - self.latitude, (lon - self.longitude) * np.cos(np.radians(lat)))
+            distance = np.where(np.isnan(distance), np.inf, distance)
+            best = distance.argmin(axis=1)
+            close = distance[np.arange(len(best)), best] <= max_degrees
+            result[start:start + chunk] = np.where(close, best, -1)
+        return result
+
+    def for_households(self, db, household_ids, zip_index=None) -> np.ndarray:
+        """
+        Nearest gridpoint to each household's address (see household_coordinates).
+        :return: int64 gridpoint row per household; -1 when it has none.
+        """
+        latitude, longitude = household_coordinates(db, household_ids, zip_index)
+        return self.nearest(latitude, longitude)
+
+    def by_date(self, gridpoint: int) -> dict:
+        """
+        :return: Date (YYYY-MM-DD) -> temperature (F) for one gridpoint row.
+        """
+        stored = ~np.isnan(self.temperature[gridpoint])
+        return dict(zip(np.datetime_as_string(self.days[stored]).tolist(), self.temperature[gridpoint, stored].tolist()))
+
+    def hourly(self, timestamps_ms: np.ndarray, gridpoints: np.ndarray) -> np.ndarray:
+        """
+        Each hour's daily temperature (UTC date) at the given gridpoint rows.
+        :return: (len(timestamps), len(gridpoints)) temperatures, NaN when not stored.
+        """
+        return self.daily(np.asarray(timestamps_ms, dtype=np.int64).astype("datetime64[ms]"), gridpoints)
+
+    def daily(self, days: np.ndarray, gridpoints: np.ndarray) -> np.ndarray:
+        """
+        Temperature on each day at the given gridpoint rows.
+        :return: (len(days), len(gridpoints)) temperatures, NaN when not stored.
+        """
+        days = np.asarray(days).astype("datetime64[D]")
+        column = np.searchsorted(self.days, days)
+        stored = column < len(self.days)
+        stored[stored] = self.days[column[stored]] == days[stored]
+        result = np.full((len(days), len(gridpoints)), np.nan)
+        if len(gridpoints):
+            result[stored] = self.temperature[np.asarray(gridpoints)][:, column[stored]].T
+        return result
+
+
+def household_coordinates(db, household_ids, zip_index=None) -> tuple:
+    """
+    Location of each household from its owner's house_address: the ZIP code's centroid, or
+    the coordinates themselves for a "lat,lon" address.
+    :param zip_index: ZipIndex to resolve ZIP codes with (default: the shared index).
+    :return: Tuple (latitude, longitude) float64 arrays aligned with household_ids, NaN when unknown.
+    """
+    from data.api_wrappers.electric_cost import rate_query
+    from data.api_wrappers.zip_index import get_zip_index
+
+    household_ids = np.asarray(household_ids, dtype=np.int64)
+    statement = ("SELECT h.household_id, u.house_address FROM household.Households h "
+                 "LEFT JOIN user_management.Users u ON u.user_id = h.user_id")
+    if len(household_ids) <= 1000:
+        # A few households (e.g. one API request): look them up instead of reading the whole table
+        statement += f" WHERE h.household_id IN ({', '.join(['%s'] * max(len(household_ids), 1))})"
+        rows = db.query(statement, tuple(int(h) for h in household_ids) or (-1,))
+    else:
+        rows = db.query(statement)
+    addresses = {household_id: address for household_id, address in rows}
+    keys = [rate_query(addresses.get(int(h)) or "")[0] for h in household_ids]
+    zipcodes = [key[len("zip:"):] if key.startswith("zip:") else "" for key in keys]
+    latitude, longitude = np.full(len(keys), np.nan), np.full(len(keys), np.nan)
+    if any(zipcodes):
+        resolved = (zip_index or get_zip_index()).lookup(zipcodes)
+        latitude[:] = resolved["latitude"]
+        longitude[:] = resolved["longitude"]
+    for i, key in enumerate(keys):
+        if key.startswith("coord:"):
+            latitude[i], longitude[i] = (float(v) for v in key[len("coord:"):].split(","))
+    return latitude, longitude
+
+
+def train_household_model(db, rollups, start: str, end: str, alpha: float = 1.0, zip_index=None) -> ForecastModel:
+    """
+    One model per household from hourly rollups over [start, end). Each household gets
+    temperature features from the stored forecasts of the gridpoint nearest its address;
+    the model is calendar-only when no household has any.
+    """
+    entity_ids, buckets, kwh = rollups.series_all("household", start, end, "hour")
+    timestamps = buckets.astype("datetime64[ms]").astype(np.int64)
+    keys, inverse = np.unique(entity_ids, return_inverse=True)
+    timeline, rows = np.unique(timestamps, return_inverse=True)
+    Y = np.zeros((len(timeline), len(keys)))
+    mask = np.zeros(Y.shape, dtype=bool)
+    Y[rows, inverse] = kwh
+    mask[rows, inverse] = True
+
+    temperatures = DailyTemperatures.from_db(db)
+    nearest = temperatures.for_households(db, keys, zip_index)
+    gridpoints, locations = np.unique(nearest, return_inverse=True)
+    # Only the gridpoints some household maps to become temperature columns
+    located = gridpoints >= 0
+    columns = np.where(located, np.cumsum(located) - 1, -1)
+    locations = columns[locations]
+    temperature = temperatures.hourly(timeline, gridpoints[located])
+    if np.isnan(temperature).all():
+        temperature, locations = None, None
+    return train("household_load", keys.tolist(), timeline, Y, mask, "kWh", temperature, alpha, locations)
+
+
+def hourly_temperatures(forecast: dict, timestamps_ms: np.ndarray) -> np.ndarray:
+    """
+    Temperature (F) at each timestamp from a NWS forecast payload, taking the period
+    that contains it (NaN outside the forecast).
+    """
+    periods = forecast.get("properties", {}).get("periods", [])
+    starts, ends, temperatures = [], [], []
+    for period in periods:
+        if period.get("temperature") is None or not period.get("startTime") or not period.get("endTime"):
+            continue
+        temperature = period["temperature"]
+        if period.get("temperatureUnit") == "C":
+            temperature = temperature * 9 / 5 + 32
+        starts.append(datetime.fromisoformat(period["startTime"]).timestamp() * 1000)
+        ends.append(datetime.fromisoformat(period["endTime"]).timestamp() * 1000)
+        temperatures.append(temperature)
+    result = np.full(len(timestamps_ms), np.nan)
+    if not starts:
+        return result
+    order = np.argsort(starts)
+    starts, ends, temperatures = (np.asarray(a)[order] for a in (starts, ends, temperatures))
+    index = np.searchsorted(starts, timestamps_ms, side="right") - 1
+    inside = (index >= 0) & (timestamps_ms < ends[np.clip(index, 0, None)])
+    result[inside] = temperatures[index[inside]]
+    return result
+
+
+def log_training(db, model: ForecastModel, version: int):
+    """
+    Writes a trained model's holdout metrics to ModelAccuracy and its training run to ModelExecutionLogs.
+    """
+    model_name = f"{model.name}:v{version}"
+    metrics = model.meta.get("metrics", {})
+    db.copy_rows("model_results.ModelAccuracy", ["model_name", "metric_name", "metric_value"],
+                 [(model_name, metric, round(value, 5)) for metric, value in metrics.items()])
+    parameters = {k: model.meta.get(k) for k in ("alpha", "series", "observations", "trained_from", "trained_to")}
+    db.copy_rows("model_results.ModelExecutionLogs", ["model_name", "execution_time_seconds", "parameters"],
+                 [(model_name, model.meta.get("training_seconds", 0), json.dumps({"stage": "train", **parameters}))])
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from data.api_wrappers.appliance_store import ApplianceStore
+    from data.pipelines.sensor_ingest import DEFAULT_STORE
+    from database.db import Database
+    from database.rollups import RollupEngine
+    from models.registry import ModelRegistry
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Train hourly load forecasting models and publish them to the registry.")
+    parser.add_argument("--appliances", action="store_true", help="Train the per-appliance model")
+    parser.add_argument("--households", action="store_true", help="Train the per-household model (needs DATABASE_URL)")
+    parser.add_argument("--start", default="2000-01-01")
+    parser.add_argument("--end", default=str(np.datetime64("today", "D") + 1))
+    parser.add_argument("--alpha", type=float, default=1.0)
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    database = Database.from_env()
+    trained = []
+    if args.appliances:
+        store = ApplianceStore.load(kaggle_dir=os.getenv("KAGGLE_APPLIANCES_DIR"), sensor_store=DEFAULT_STORE)
+        trained.append(train_appliance_model(store, args.alpha))
+    if args.households:
+        if database is None:
+            print("Error: DATABASE_URL is not set")
+            exit(1)
+        trained.append(train_household_model(database, RollupEngine(database, interval=0), args.start, args.end,
+                                             args.alpha))
+    for model in trained:
+        version = registry.publish(model)
+        if database is not None:
+            log_training(database, model, version)
+        print(f"{model.name} v{version}: {model.meta['series']} series, metrics {model.meta['metrics']}")
@@ -0,0 +1,146 @@
+'''
+Local Model Registry
+Versioned forecasting models on disk, one directory per version under
+<root>/<model name>/v<NNNN>, with a CURRENT file naming the live version. Publishing
+writes the version directory first and then swaps CURRENT with an atomic rename, so
+readers never see a half-written model.
+
+ModelServer keeps the live version of each model in memory and picks up a newly
+published one (from this or any other process) with a cheap stat of CURRENT.
+'''
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from models.forecasting import ForecastModel
+
+DEFAULT_REGISTRY_DIR = os.path.join(os.path.expanduser("~"), ".cache", "uems", "models")
+CURRENT_FILE = "CURRENT"
+
+
+class ModelRegistry:
+    def __init__(self, root: str = None):
+        """
+        :param root: Registry directory; defaults to MODEL_REGISTRY_DIR or ~/.cache/uems/models.
+        """
+        self.root = root or os.getenv("MODEL_REGISTRY_DIR", DEFAULT_REGISTRY_DIR)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _model_dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def current_path(self, name: str) -> str:
+        return os.path.join(self._model_dir(name), CURRENT_FILE)
+
+    def names(self) -> list:
+        return sorted(n for n in os.listdir(self.root) if os.path.isfile(self.current_path(n)))
+
+    def versions(self, name: str) -> list:
+        directory = self._model_dir(name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(d[1:]) for d in os.listdir(directory) if d.startswith("v") and d[1:].isdigit())
+
+    def current_version(self, name: str) -> int:
+        """
+        :return: Live version number, or None when the model has never been published.
+        """
+        try:
+            with open(self.current_path(name)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def publish(self, model: ForecastModel) -> int:
+        """
+        Stores the model as the next version and makes it live.
+        :return: The new version number.
+        """
+        directory = self._model_dir(model.name)
+        os.makedirs(directory, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=directory)
+        model.save(staging)
+        while True:
+            version = (self.versions(model.name) or [0])[-1] + 1
+            try:
+                # Renaming onto an existing directory fails, so concurrent publishers get distinct versions
+                os.rename(staging, os.path.join(directory, f"v{version:04d}"))
+                break
+            except OSError:
+                if not os.path.isdir(os.path.join(directory, f"v{version:04d}")):
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise
+        self.activate(model.name, version)
+        return version
+
+    def activate(self, name: str, version: int):
+        """
+        Points CURRENT at an existing version (also used to roll back).
+        """
+        if version not in self.versions(name):
+            raise ValueError(f"{name} has no version {version}")
+        fd, temp = tempfile.mkstemp(prefix=".current-", dir=self._model_dir(name))
+        with os.fdopen(fd, "w") as f:
+            f.write(str(version))
+        os.replace(temp, self.current_path(name))
+
+    def load(self, name: str, version: int = None) -> ForecastModel:
+        version = self.current_version(name) if version is None else version
+        if version is None:
+            raise FileNotFoundError(f"No published version of {name}")
+        model = ForecastModel.load(os.path.join(self._model_dir(name), f"v{version:04d}"))
+        model.meta["version"] = version
+        return model
+
+
+class ModelServer:
+    def __init__(self, registry: ModelRegistry, check_interval: float = 5.0):
+        """
+        Keeps the live version of every model loaded.
+        :param check_interval: Minimum seconds between checks of a model's CURRENT file.
+        """
+        self.registry = registry
+        self.check_interval = check_interval
+        self._models = {}
+        self._lock = threading.Lock()
+        self.reloads = 0
+        for name in registry.names():
+            self.get(name)
+
+    def get(self, name: str) -> ForecastModel:
+        """
+        Returns the in-memory model, reloading it first if a new version was published.
+        :return: ForecastModel, or None when the model is not in the registry.
+        """
+        now = time.monotonic()
+        entry = self._models.get(name)
+        if entry is not None and now - entry["checked"] < self.check_interval:
+            return entry["model"]
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None and now - entry["checked"] < self.check_interval:
+                return entry["model"]
+            try:
+                stamp = os.stat(self.registry.current_path(name)).st_mtime_ns
+            except FileNotFoundError:
+                return entry and entry["model"]
+            if entry is None or entry["stamp"] != stamp:
+                try:
+                    model = self.registry.load(name)
+                except (FileNotFoundError, ValueError, OSError) as e:
+                    print(f"Error loading model {name}: {e}")
+                    return entry and entry["model"]
+                self.reloads += entry is not None
+                entry = {"model": model, "stamp": stamp}
+            # Replacing the whole entry keeps readers outside the lock consistent
+            self._models[name] = {**entry, "checked": now}
+            return entry["model"]
+
+    def stats(self) -> dict:
+        return {
+            "models": {name: {"version": e["model"].meta.get("version"), "series": len(e["model"].keys)}
+                       for name, e in self._models.items()},
+            "reloads": self.reloads
+        }
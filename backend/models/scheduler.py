@@ -0,0 +1,330 @@
+'''
+Appliance Load-Shifting Scheduler
+Finds the cheapest daily run window for each household's shiftable appliances
+(washing machine, dishwasher, dryer) under its state's time-of-use schedule,
+within the user's preferred finish hour, and turns every window that beats the
+appliance's usual run time into a model_results.OptimizationDecisions row.
+
+A day is 96 fifteen-minute slots. Each appliance's typical cycle is extracted once
+from the appliance store as an energy-per-slot profile. The cost of starting it at
+every slot is a single (96 x cycle length) matrix-vector product with the slot prices.
+Households with the same (state, appliance, finish hour) share one solution, and
+batches are spread over a process pool with per-household timings logged to
+model_results.ModelExecutionLogs.
+
+Usage (from backend/, with DATABASE_URL set):
+    python -m models.scheduler --base-rate 0.14 --processes 8
+'''
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from models.tou_cost import MINUTES_PER_DAY, TouSchedule, load_schedules
+
+MODEL_NAME = "tou_load_shift"
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = MINUTES_PER_DAY // SLOT_MINUTES
+SHIFTABLE_APPLIANCES = ("washing_machine", "dishwasher", "dryer")
+# Power below this counts as idle when finding cycles in a series
+IDLE_WATTS = 50
+# Idle gaps shorter than this (e.g. a soak between wash phases) stay inside one cycle
+MAX_GAP_MINUTES = 10
+DECISION_COLUMNS = ("model_name", "device_id", "recommended_action", "estimated_savings_kWh")
+EXECUTION_LOG_COLUMNS = ("model_name", "execution_time_seconds", "parameters")
+
+
+class ShiftableLoad:
+    def __init__(self, name: str, energy_kwh: np.ndarray, baseline_start: int):
+        """
+        One run of an appliance that can be moved in time.
+        :param energy_kwh: Energy drawn in each slot of the run, from its start.
+        :param baseline_start: Slot of the day the appliance usually starts in.
+        """
+        self.name = name
+        self.energy_kwh = np.asarray(energy_kwh, dtype=np.float64)[:SLOTS_PER_DAY]
+        self.baseline_start = int(baseline_start) % SLOTS_PER_DAY
+
+    @classmethod
+    def from_series(cls, series) -> "ShiftableLoad":
+        """
+        Extracts the typical cycle of an ApplianceSeries: runs of non-idle power (short
+        idle gaps merged), of which the one with the median energy becomes the profile,
+        started at the most common start slot among all runs.
+        :return: ShiftableLoad, or None when the series contains no cycles.
+        """
+        power = np.nan_to_num(series.columns["power_consumption"].astype(np.float64))
+        minutes = (series.timestamps - series.timestamps[0]).astype("timedelta64[ms]").astype(np.int64) / 60_000
+        if len(power) < 2:
+            return None
+        step = float(np.median(np.diff(minutes)))
+
+        on = np.flatnonzero(power > IDLE_WATTS)
+        if not len(on):
+            return None
+        breaks = np.flatnonzero(np.diff(minutes[on]) > max(MAX_GAP_MINUTES, step))
+        starts, ends = on[np.r_[0, breaks + 1]], on[np.r_[breaks, len(on) - 1]]
+
+        energies = np.array([np.sum(power[s:e + 1]) * step / 60_000 for s, e in zip(starts, ends)])
+        typical = int(np.argsort(energies)[len(energies) // 2])
+        s, e = starts[typical], ends[typical]
+        # Spread each sample's energy evenly over the slots its sampling interval covers
+        parts = max(1, int(round(step / SLOT_MINUTES)))
+        offsets = np.repeat(minutes[s:e + 1] - minutes[s], parts) + np.tile(np.arange(parts) * step / parts, e + 1 - s)
+        weights = np.repeat(power[s:e + 1] * step / 60_000 / parts, parts)
+        profile = np.bincount((offsets // SLOT_MINUTES).astype(np.int64), weights=weights)
+
+        start_minutes = series.timestamps[starts].astype("datetime64[m]").astype(np.int64) % MINUTES_PER_DAY
+        baseline = np.bincount(start_minutes // SLOT_MINUTES, minlength=SLOTS_PER_DAY).argmax()
+        return cls(series.name, profile, baseline)
+
+
+def appliance_loads(store, names: tuple = SHIFTABLE_APPLIANCES) -> dict:
+    """
+    Typical cycles of the shiftable appliances present in an ApplianceStore.
+    :return: appliance name -> ShiftableLoad.
+    """
+    loads = {}
+    for name in names:
+        series = store.get(name)
+        load = ShiftableLoad.from_series(series) if series is not None else None
+        if load is not None:
+            loads[name] = load
+    return loads
+
+
+def appliance_for_device(device_name: str, appliances) -> str:
+    """
+    Maps a household.Devices name ("Washing Machine", "Bosch dishwasher") to an appliance key.
+    """
+    normalized = "_".join((device_name or "").lower().replace("-", " ").split())
+    return next((name for name in appliances if name in normalized), None)
+
+
+def slot_prices(schedule: TouSchedule) -> np.ndarray:
+    """
+    Average $/kWh of every 15-minute slot of the day.
+    """
+    return schedule.rates.reshape(SLOTS_PER_DAY, SLOT_MINUTES).mean(axis=1)
+
+
+def _format_slot(slot: int) -> str:
+    hour, minute = divmod(int(slot) % SLOTS_PER_DAY * SLOT_MINUTES, 60)
+    suffix = "AM" if hour < 12 else "PM"
+    hour = hour % 12 or 12
+    return f"{hour} {suffix}" if not minute else f"{hour}:{minute:02d} {suffix}"
+
+
+def best_window(schedule: TouSchedule, load: ShiftableLoad, finish_hour: int = None) -> dict:
+    """
+    Cheapest start slot for one run of a load.
+    :param finish_hour: Hour of the day (0-23) the run must be finished by, e.g.
+        UserPreferences.preferred_hours; None allows any start.
+    :return: Dictionary with start/baseline slots, per-run cost of each, and the kWh the
+        move takes out of peak-priced slots; None when no start satisfies finish_hour.
+    """
+    prices = slot_prices(schedule)
+    length = len(load.energy_kwh)
+    # Row s holds the prices of slots s .. s + length - 1, wrapping past midnight
+    windows = sliding_window_view(np.concatenate([prices, prices]), length)[:SLOTS_PER_DAY]
+    costs = windows @ load.energy_kwh
+    peak = (windows > schedule.base_rate + 1e-12) @ load.energy_kwh
+
+    starts = np.arange(SLOTS_PER_DAY)
+    if finish_hour is not None:
+        finish = int(finish_hour) % 24 * 60 // SLOT_MINUTES
+        allowed = (finish - starts) % SLOTS_PER_DAY >= length
+        if not allowed.any():
+            return None
+        costs = np.where(allowed, costs, np.inf)
+    # Among equally cheap starts, stay closest to when the appliance usually runs
+    distance = np.minimum((starts - load.baseline_start) % SLOTS_PER_DAY, (load.baseline_start - starts) % SLOTS_PER_DAY)
+    cheapest = np.flatnonzero(costs <= costs.min() + 1e-9)
+    start = int(cheapest[np.argmin(distance[cheapest])])
+    baseline = load.baseline_start
+    return {
+        "start": start,
+        "end": (start + length) % SLOTS_PER_DAY,
+        "cost": float(costs[start]),
+        "baseline_start": baseline,
+        "baseline_end": (baseline + length) % SLOTS_PER_DAY,
+        "baseline_cost": float(windows[baseline] @ load.energy_kwh),
+        "peak_kwh_avoided": float(peak[baseline] - peak[start])
+    }
+
+
+def recommended_action(appliance: str, window: dict) -> str:
+    label = appliance.replace("_", " ")
+    savings = window["baseline_cost"] - window["cost"]
+    return (f"Run {label} {_format_slot(window['start'])}-{_format_slot(window['end'])} instead of "
+            f"{_format_slot(window['baseline_start'])}-{_format_slot(window['baseline_end'])} "
+            f"(saves ${savings:.2f} per cycle)")[:255]
+
+
+def optimize_household(household: dict, schedules: dict, loads: dict, memo: dict = None) -> list:
+    """
+    Decisions for one household.
+    :param household: {"household_id", "state", "preferred_hours", "devices": [(device_id, device_name), ...]}
+    :param schedules: state_id -> TouSchedule.
+    :param loads: appliance -> ShiftableLoad.
+    :param memo: Shared dict caching windows per (state, appliance, finish hour).
+    :return: List of OptimizationDecisions rows (model_name, device_id, action, peak kWh avoided).
+    """
+    schedule = schedules.get(household.get("state"))
+    if schedule is None:
+        return []
+    memo = {} if memo is None else memo
+    rows = []
+    for device_id, device_name in household.get("devices", []):
+        appliance = appliance_for_device(device_name, loads)
+        if appliance is None:
+            continue
+        key = (schedule.state_id, appliance, household.get("preferred_hours"))
+        if key not in memo:
+            memo[key] = best_window(schedule, loads[appliance], household.get("preferred_hours"))
+        window = memo[key]
+        if window is None or window["baseline_cost"] - window["cost"] < 0.005:
+            continue
+        rows.append((MODEL_NAME, device_id, recommended_action(appliance, window),
+                     round(max(window["peak_kwh_avoided"], 0.0), 4)))
+    return rows
+
+
+# Per-process state for pool workers, set once by _init_worker instead of pickled per task
+_worker = {}
+
+
+def _init_worker(schedules: dict, loads: dict):
+    _worker.update(schedules=schedules, loads=loads, memo={})
+
+
+def _optimize_chunk(households: list) -> tuple:
+    decisions, timings = [], []
+    for household in households:
+        started = time.perf_counter()
+        rows = optimize_household(household, _worker["schedules"], _worker["loads"], _worker["memo"])
+        timings.append((household["household_id"], time.perf_counter() - started, len(rows)))
+        decisions.extend(rows)
+    return decisions, timings
+
+
+class LoadScheduler:
+    def __init__(self, schedules: dict, loads: dict, processes: int = None, chunk_size: int = 5000):
+        """
+        :param schedules: state_id -> TouSchedule.
+        :param loads: appliance -> ShiftableLoad.
+        :param processes: Worker processes (default: CPU count); 1 runs in the calling process.
+        :param chunk_size: Households per task sent to a worker.
+        """
+        self.schedules = schedules
+        self.loads = loads
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def run(self, households: list) -> dict:
+        """
+        Optimizes every household.
+        :return: {"decisions": OptimizationDecisions rows, "execution_logs": ModelExecutionLogs rows, "stats": {...}}
+        """
+        started = time.perf_counter()
+        chunks = [households[i:i + self.chunk_size] for i in range(0, len(households), self.chunk_size)]
+        if self.processes == 1 or len(chunks) <= 1:
+            _init_worker(self.schedules, self.loads)
+            results = [_optimize_chunk(chunk) for chunk in chunks]
+        else:
+            # spawn: the web process has live threads and sockets a forked child must not inherit
+            with ProcessPoolExecutor(self.processes, mp_context=mp.get_context("spawn"), initializer=_init_worker,
+                                     initargs=(self.schedules, self.loads)) as pool:
+                results = list(pool.map(_optimize_chunk, chunks))
+
+        decisions = [row for chunk_decisions, _ in results for row in chunk_decisions]
+        logs = [
+            (MODEL_NAME, round(seconds, 6), json.dumps({"household_id": household_id, "decisions": count}))
+            for _, timings in results for household_id, seconds, count in timings
+        ]
+        elapsed = time.perf_counter() - started
+        stats = {
+            "households": len(households),
+            "decisions": len(decisions),
+            "processes": self.processes if len(chunks) > 1 else 1,
+            "seconds": round(elapsed, 3)
+        }
+        logs.append((MODEL_NAME, round(elapsed, 6), json.dumps({"batch": True, **stats})))
+        return {"decisions": decisions, "execution_logs": logs, "stats": stats}
+
+
+def load_households(db) -> list:
+    """
+    Households with their devices, preferred finish hour, and state (from the ZIP code
+    in the owner's house_address).
+    """
+    from data.api_wrappers.electric_cost import rate_query
+    from data.api_wrappers.zip_index import get_zip_index
+
+    rows = db.query(
+        "SELECT h.household_id, u.house_address, p.preferred_hours, d.device_id, d.device_name "
+        "FROM household.Households h "
+        "JOIN household.Rooms r ON r.household_id = h.household_id "
+        "JOIN household.Devices d ON d.room_id = r.room_id "
+        "LEFT JOIN user_management.Users u ON u.user_id = h.user_id "
+        "LEFT JOIN user_management.UserPreferences p ON p.user_id = h.user_id "
+        "ORDER BY h.household_id, d.device_id"
+    )
+    households = {}
+    for household_id, address, preferred_hours, device_id, device_name in rows:
+        household = households.setdefault(household_id, {
+            "household_id": household_id, "address": address, "preferred_hours": preferred_hours, "devices": []
+        })
+        if (device_id, device_name) not in household["devices"]:
+            household["devices"].append((device_id, device_name))
+
+    households = list(households.values())
+    keys = [rate_query(h["address"] or "")[0] for h in households]
+    zipcodes = [key[len("zip:"):] if key.startswith("zip:") else "" for key in keys]
+    states = get_zip_index().lookup(zipcodes)["state"] if households else []
+    for household, state in zip(households, states):
+        household["state"] = state.decode() or None
+        del household["address"]
+    return households
+
+
+def store_results(db, result: dict, batch_rows: int = 50_000):
+    """
+    Bulk-writes the decisions and execution logs of LoadScheduler.run.
+    """
+    for table, columns, rows in (
+        ("model_results.OptimizationDecisions", DECISION_COLUMNS, result["decisions"]),
+        ("model_results.ModelExecutionLogs", EXECUTION_LOG_COLUMNS, result["execution_logs"]),
+    ):
+        for i in range(0, len(rows), batch_rows):
+            db.copy_rows(table, list(columns), rows[i:i + batch_rows])
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from data.api_wrappers.appliance_store import ApplianceStore
+    from data.pipelines.sensor_ingest import DEFAULT_STORE
+    from database.db import Database
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compute cost-minimal appliance run windows for every household.")
+    parser.add_argument("--base-rate", type=float, required=True, help="Off-peak $/kWh applied to every state")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    database = Database.from_env()
+    if database is None:
+        print("Error: DATABASE_URL is not set")
+        exit(1)
+    store = ApplianceStore.load(kaggle_dir=os.getenv("KAGGLE_APPLIANCES_DIR"), sensor_store=DEFAULT_STORE)
+    scheduler = LoadScheduler(load_schedules(database, args.base_rate), appliance_loads(store),
+                              args.processes, args.chunk_size)
+    result = scheduler.run(load_households(database))
+    store_results(database, result)
+    for key, value in result["stats"].items():
+        print(f"{key}: {value}")
@@ -0,0 +1,402 @@
+'''
+What-If Usage Simulation
+Estimates annual kWh and cost of every household under alternative scenarios: another
+time-of-use tariff (a state's pricing.PeakEnergyPricing windows or a candidate
+schedule) and device changes (run an appliance off-peak or at a set time, replace it
+with a more efficient one, remove it).
+
+Each household is its daily kWh per appliance category: device energy from the usage
+rollups (or, for devices without readings, the rated power_usage_per_hour_kWh over
+NOMINAL_HOURS_PER_DAY), spread over the 15-minute slots of the day with the
+appliance's typical hour-of-day profile from the ApplianceStore; devices that match no
+appliance share a flat "other" profile. A scenario rescales categories, moves shiftable ones to a new
+start slot with the appliance's cycle profile (see scheduler.ShiftableLoad), and prices
+every slot, as one array expression over (households x scenarios x slots). PeakEnergyPricing
+windows repeat daily, so the annual totals are the daily ones times DAYS_PER_YEAR.
+Fleet runs are split into household chunks spread over a process pool, which a server
+creates once (simulation_pool) and shares between runs.
+
+Usage (from backend/, with DATABASE_URL set):
+    python -m models.simulation --base-rate 0.14 --scenarios scenarios.json --processes 8
+'''
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from models.forecasting import HOUR_MS, hourly_means
+from models.scheduler import SLOT_MINUTES, SLOTS_PER_DAY, appliance_for_device, best_window, load_households, slot_prices
+from models.tou_cost import TouSchedule, minute_of_day
+
+DAYS_PER_YEAR = 365
+OTHER = "other"
+# Daily use assumed for a device with no readings, in hours at its rated power
+NOMINAL_HOURS_PER_DAY = 1.0
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+
+
+def hourly_shape(series) -> np.ndarray:
+    """
+    An ApplianceSeries' mean power by hour of day (UTC) as the share of its daily energy
+    in each 15-minute slot (flat when the series has no power readings).
+    """
+    timestamps, watts = hourly_means(series.timestamps, series.columns["power_consumption"].astype(np.float64))
+    hours = (timestamps // HOUR_MS) % 24
+    counts = np.bincount(hours, minlength=24)
+    means = np.bincount(hours, weights=np.maximum(watts, 0), minlength=24) / np.maximum(counts, 1)
+    if means.sum() <= 0:
+        return np.full(SLOTS_PER_DAY, 1.0 / SLOTS_PER_DAY)
+    return np.repeat(means / means.sum() / SLOTS_PER_HOUR, SLOTS_PER_HOUR)
+
+
+def appliance_shapes(store) -> dict:
+    """
+    :return: category -> (SLOTS_PER_DAY,) daily profile summing to 1, for every series in
+        the store plus a flat profile for OTHER.
+    """
+    shapes = {name: hourly_shape(series) for name, series in store.series.items()}
+    shapes[OTHER] = np.full(SLOTS_PER_DAY, 1.0 / SLOTS_PER_DAY)
+    return shapes
+
+
+class FleetProfiles:
+    def __init__(self, keys: np.ndarray, states: list, categories: list, energy: np.ndarray, shapes: np.ndarray):
+        """
+        :param keys: Household ids.
+        :param states: State of each household (None when unknown).
+        :param categories: Appliance categories, the second axis of energy.
+        :param energy: (households, categories) daily kWh.
+        :param shapes: (categories, SLOTS_PER_DAY) share of each category's daily kWh per slot.
+        """
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.states = list(states)
+        self.categories = list(categories)
+        self.energy = np.asarray(energy, dtype=np.float64).reshape(len(self.keys), len(self.categories))
+        self.shapes = shapes
+
+    def select(self, household_ids: list) -> "FleetProfiles":
+        """
+        The given households, in the given order; unknown ids are dropped.
+        """
+        rows = {k: i for i, k in enumerate(self.keys.tolist())}
+        index = [rows[h] for h in household_ids if h in rows]
+        return FleetProfiles(self.keys[index], [self.states[i] for i in index], self.categories,
+                             self.energy[index], self.shapes)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __sizeof__(self):
+        # Reported to the TTLCache holding fleets, which cannot size arrays itself
+        return self.keys.nbytes + self.energy.nbytes + self.shapes.nbytes + 64 * len(self.states)
+
+
+def build_profiles(households: list, device_kwh: dict, device_power: dict, shapes: dict) -> FleetProfiles:
+    """
+    :param households: As from scheduler.load_households.
+    :param device_kwh: device_id -> measured mean daily kWh.
+    :param device_power: device_id -> rated kWh per hour of use, for devices without readings.
+    :param shapes: category -> daily profile, as from appliance_shapes (must include OTHER).
+    """
+    categories = [c for c in shapes if c != OTHER] + [OTHER]
+    column = {c: i for i, c in enumerate(categories)}
+    energy = np.zeros((len(households), len(categories)))
+    for row, household in enumerate(households):
+        for device_id, device_name in household["devices"]:
+            category = appliance_for_device(device_name, categories[:-1]) or OTHER
+            kwh = device_kwh.get(device_id)
+            if kwh is None:
+                kwh = device_power.get(device_id, 0.0) * NOMINAL_HOURS_PER_DAY
+            energy[row, column[category]] += kwh
+    return FleetProfiles([h["household_id"] for h in households], [h.get("state") for h in households],
+                         categories, energy, np.stack([shapes[c] for c in categories]))
+
+
+def load_fleet(db, rollups, store, start: str, end: str) -> FleetProfiles:
+    """
+    Profiles of every household, with device energy averaged from the monthly usage
+    rollups over [start, end) (from each device's first month with readings).
+    """
+    households = load_households(db)
+    device_power = {device_id: float(power) for device_id, power in
+                    db.query("SELECT device_id, power_usage_per_hour_kWh FROM household.Devices")}
+    device_kwh = {}
+    if rollups is not None:
+        device_ids, buckets, kwh = rollups.series_all("device", start, end, "month")
+        if len(device_ids):
+            keys, inverse = np.unique(device_ids, return_inverse=True)
+            totals = np.bincount(inverse, weights=kwh)
+            first = np.full(len(keys), np.datetime64(end, "s"))
+            np.minimum.at(first, inverse, buckets)
+            days = (np.datetime64(end, "s") - np.maximum(first, np.datetime64(start, "s"))) / np.timedelta64(1, "D")
+            device_kwh = dict(zip(keys.tolist(), (totals / np.maximum(days, 1.0)).tolist()))
+    return build_profiles(households, device_kwh, device_power, appliance_shapes(store))
+
+
+def parse_slot(value) -> int:
+    """
+    Hour of the day (0-23) or "HH:MM" -> 15-minute slot.
+    """
+    minutes = int(value) * 60 if isinstance(value, (int, float)) else minute_of_day(value)
+    return minutes % (24 * 60) // SLOT_MINUTES
+
+
+class Scenario:
+    def __init__(self, name: str, schedule: TouSchedule = None, changes: dict = None):
+        """
+        :param schedule: Tariff applied to every household; None keeps each household's
+            own state schedule.
+        :param changes: category -> {"scale": factor (0 removes), "shift_to": "off_peak" or slot}.
+        """
+        self.name = name
+        self.schedule = schedule
+        self.changes = changes or {}
+
+    @classmethod
+    def from_dict(cls, spec: dict, schedules: dict, base_rate: float, name: str = None) -> "Scenario":
+        """
+        Builds a scenario from its JSON form:
+            {"name": "...",
+             "tariff": "current" | {"state": "CA"} | {"windows": [{"start": "16:00", "end": "21:00", "rate": 0.42}],
+                                                       "base_rate": 0.11},
+             "changes": [{"appliance": "washing_machine", "shift_to": "off_peak" | "22:00" | 22, "scale": 0.8},
+                         {"appliance": "oven", "remove": true}]}
+        :param schedules: state_id -> TouSchedule from pricing.PeakEnergyPricing.
+        :param base_rate: Off-peak $/kWh of state tariffs and the default for candidate schedules.
+        :raises ValueError: For malformed specs.
+        """
+        if not isinstance(spec, dict):
+            raise ValueError("Each scenario must be an object")
+        name = spec.get("name") or name
+        tariff = spec.get("tariff", "current")
+        schedule = None
+        if isinstance(tariff, dict) and "state" in tariff:
+            state = str(tariff["state"]).upper()
+            schedule = schedules.get(state) or TouSchedule([], base_rate, state)
+        elif isinstance(tariff, dict) and "windows" in tariff:
+            try:
+                windows = [(w["start"], w["end"], float(w["rate"])) for w in tariff["windows"]]
+                schedule = TouSchedule(windows, float(tariff.get("base_rate", base_rate)), name)
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"Tariff windows need start, end and rate ({str(e)})")
+        elif tariff != "current":
+            raise ValueError('tariff must be "current", {"state": ...} or {"windows": [...], "base_rate": ...}')
+
+        changes = {}
+        for change in spec.get("changes", []):
+            if not isinstance(change, dict) or not change.get("appliance"):
+                raise ValueError("Each change needs an appliance")
+            scale = 0.0 if change.get("remove") else float(change.get("scale", 1.0))
+            if scale < 0:
+                raise ValueError("scale must not be negative")
+            shift_to = change.get("shift_to")
+            if shift_to is not None and shift_to != "off_peak":
+                shift_to = parse_slot(shift_to)
+            changes[str(change["appliance"]).lower()] = {"scale": scale, "shift_to": shift_to}
+        return cls(name, schedule, changes)
+
+
+def _simulate_chunk(tables: dict, energy: np.ndarray, schedule_index: np.ndarray) -> tuple:
+    """
+    Daily kWh, cost and peak-priced kWh of a chunk of households under every scenario.
+    :param tables: Rate tables and scenario changes from Simulator._tables.
+    :param energy: (households, categories) daily kWh.
+    :param schedule_index: (households,) each household's own schedule in the rate table.
+    :return: Tuple of three (households, scenarios) arrays.
+    """
+    t = tables
+    scenarios = np.arange(len(t["fixed_schedule"]))
+    schedule = np.where(t["fixed_schedule"][None, :] >= 0, t["fixed_schedule"][None, :], schedule_index[:, None])
+    # Categories kept in place are rescaled; shifted ones are re-spread with their cycle profile
+    load = (energy[:, None, :] * (t["scale"] * ~t["shifted"])[None]) @ t["shapes"]
+    for c in np.flatnonzero(t["shifted"].any(axis=0)):
+        load += (energy[:, c, None, None] * t["scale"][None, :, c, None]) * t["shifted_profiles"][scenarios, schedule, c]
+    rates = t["rates"][schedule]
+    kwh = load.sum(axis=2)
+    cost = np.einsum("hsn,hsn->hs", load, rates)
+    peak = np.einsum("hsn,hsn->hs", load, t["peak"][schedule])
+    return kwh, cost, peak
+
+
+def _simulate_part(tables: dict, energy: np.ndarray, schedule_index: np.ndarray, chunk_size: int) -> tuple:
+    """
+    One pool task: a contiguous part of the fleet, simulated chunk by chunk, so the tables
+    are sent to each worker process once per run.
+    """
+    results = [_simulate_chunk(tables, energy[i:i + chunk_size], schedule_index[i:i + chunk_size])
+               for i in range(0, len(energy), chunk_size)]
+    return tuple(np.concatenate([r[k] for r in results]) for k in range(3))
+
+
+def simulation_pool(processes: int) -> ProcessPoolExecutor:
+    """
+    Process pool for Simulator.run, meant to be created once and shared by every run.
+    """
+    # spawn: the web process has live threads and sockets a forked child must not inherit
+    return ProcessPoolExecutor(processes, mp_context=mp.get_context("spawn"))
+
+
+class Simulator:
+    def __init__(self, schedules: dict, base_rate: float, cycles: dict, processes: int = None,
+                 chunk_size: int = 2000, pool: ProcessPoolExecutor = None):
+        """
+        :param schedules: state_id -> TouSchedule for households' current tariffs; households
+            in other states pay base_rate flat.
+        :param base_rate: Off-peak $/kWh.
+        :param cycles: appliance -> ShiftableLoad (scheduler.appliance_loads); only these can be shifted.
+        :param processes: Worker processes (default: CPU count); 1 runs in the calling process.
+            With a pool, the number of tasks a run is split into.
+        :param chunk_size: Households per chunk, bounding the (chunk, scenarios, slots) arrays.
+        :param pool: Long-lived pool (see simulation_pool) to run on; without one, a pool is
+            started and stopped by every run.
+        """
+        self.schedules = schedules
+        self.base_rate = float(base_rate)
+        self.cycles = cycles
+        self.pool = pool
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def _tables(self, fleet: FleetProfiles, scenarios: list) -> tuple:
+        """
+        Rate table of every schedule involved, and per-scenario scale factors and shifted
+        profiles over (scenario, schedule, category).
+        """
+        flat = TouSchedule([], self.base_rate)
+        table = [flat] + list(self.schedules.values())
+        fixed = []
+        for scenario in scenarios:
+            if scenario.schedule is None:
+                fixed.append(-1)
+            else:
+                fixed.append(len(table))
+                table.append(scenario.schedule)
+        rates = np.stack([slot_prices(s) for s in table])
+        peak = rates > np.array([s.base_rate for s in table])[:, None] + 1e-12
+
+        categories = fleet.categories
+        scale = np.ones((len(scenarios), len(categories)))
+        shifted = np.zeros(scale.shape, dtype=bool)
+        shifted_profiles = np.zeros((len(scenarios), len(table), len(categories), SLOTS_PER_DAY))
+        for s, scenario in enumerate(scenarios):
+            for category, change in scenario.changes.items():
+                if category not in categories:
+                    raise ValueError(f"Unknown appliance {category!r}; expected one of {', '.join(categories)}")
+                c = categories.index(category)
+                scale[s, c] = change["scale"]
+                if change["shift_to"] is None:
+                    continue
+                cycle = self.cycles.get(category)
+                if cycle is None:
+                    raise ValueError(f"{category} cannot be shifted; shiftable: {', '.join(self.cycles) or 'none'}")
+                shifted[s, c] = True
+                share = cycle.energy_kwh / max(cycle.energy_kwh.sum(), 1e-12)
+                # Only the schedules this scenario prices with: its own, or every household's
+                candidates = [fixed[s]] if fixed[s] >= 0 else range(1 + len(self.schedules))
+                for k in candidates:
+                    if change["shift_to"] == "off_peak":
+                        start = best_window(table[k], cycle)["start"]
+                    else:
+                        start = change["shift_to"]
+                    slots = (start + np.arange(len(share))) % SLOTS_PER_DAY
+                    np.add.at(shifted_profiles[s, k, c], slots, share)
+        state_index = {state: i + 1 for i, state in enumerate(self.schedules)}
+        schedule_index = np.array([state_index.get(state, 0) for state in fleet.states], dtype=np.intp)
+        tables = {"fixed_schedule": np.array(fixed, dtype=np.intp), "rates": rates, "peak": peak, "scale": scale,
+                  "shifted": shifted, "shifted_profiles": shifted_profiles, "shapes": fleet.shapes}
+        return tables, schedule_index
+
+    def run(self, fleet: FleetProfiles, scenarios: list) -> dict:
+        """
+        Annual kWh, cost and peak-priced kWh of every household under every scenario.
+        :return: {"kWh", "cost", "peak_kWh": (households, scenarios) arrays, "stats": {...}}
+        """
+        started = time.perf_counter()
+        tables, schedule_index = self._tables(fleet, scenarios)
+        chunks = -(-len(fleet) // self.chunk_size)
+        parts = min(self.processes, chunks)
+        # Whole chunks per part, so parts split the fleet where the chunks would
+        bounds = [min(len(fleet), self.chunk_size * (chunks * p // max(parts, 1))) for p in range(parts + 1)]
+        tasks = [(tables, fleet.energy[lo:hi], schedule_index[lo:hi], self.chunk_size)
+                 for lo, hi in zip(bounds, bounds[1:])]
+        if parts <= 1:
+            results = [_simulate_part(*task) for task in tasks]
+        elif self.pool is not None:
+            results = [future.result() for future in [self.pool.submit(_simulate_part, *task) for task in tasks]]
+        else:
+            with simulation_pool(parts) as pool:
+                results = list(pool.map(_simulate_part, *zip(*tasks)))
+
+        empty = np.zeros((0, len(scenarios)))
+        kwh, cost, peak = (np.concatenate([r[i] for r in results]) * DAYS_PER_YEAR if results else empty
+                           for i in range(3))
+        return {
+            "kWh": kwh,
+            "cost": cost,
+            "peak_kWh": peak,
+            "stats": {
+                "households": len(fleet),
+                "scenarios": len(scenarios),
+                "processes": max(parts, 1),
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+        }
+
+
+def summarize(fleet: FleetProfiles, scenarios: list, result: dict, baseline: int = 0) -> list:
+    """
+    Fleet totals per scenario, with savings against the baseline scenario.
+    """
+    summary = []
+    for s, scenario in enumerate(scenarios):
+        savings = result["cost"][:, baseline] - result["cost"][:, s]
+        summary.append({
+            "name": scenario.name,
+            "kWh": round(float(result["kWh"][:, s].sum()), 2),
+            "cost": round(float(result["cost"][:, s].sum()), 2),
+            "peak_kWh": round(float(result["peak_kWh"][:, s].sum()), 2),
+            "savings": round(float(savings.sum()), 2),
+            "households_saving": int((savings > 0.005).sum()),
+            "median_household_savings": round(float(np.median(savings)), 2) if len(fleet) else None
+        })
+    return summary
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from data.api_wrappers.appliance_store import ApplianceStore
+    from data.pipelines.sensor_ingest import DEFAULT_STORE
+    from database.db import Database
+    from database.rollups import RollupEngine
+    from models.scheduler import appliance_loads
+    from models.tou_cost import load_schedules
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Annual kWh and cost of every household under what-if scenarios.")
+    parser.add_argument("--base-rate", type=float, required=True, help="Off-peak $/kWh applied to every state")
+    parser.add_argument("--scenarios", required=True, help="JSON file with a list of scenarios")
+    parser.add_argument("--start", default=str(np.datetime64("today", "D") - DAYS_PER_YEAR))
+    parser.add_argument("--end", default=str(np.datetime64("today", "D")))
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    database = Database.from_env()
+    if database is None:
+        print("Error: DATABASE_URL is not set")
+        exit(1)
+    store = ApplianceStore.load(kaggle_dir=os.getenv("KAGGLE_APPLIANCES_DIR"), sensor_store=DEFAULT_STORE)
+    schedules = load_schedules(database, args.base_rate)
+    with open(args.scenarios) as f:
+        specs = json.load(f)
+    scenarios = [Scenario("current")] + [Scenario.from_dict(spec, schedules, args.base_rate, f"scenario {i + 1}")
+                                         for i, spec in enumerate(specs)]
+    fleet = load_fleet(database, RollupEngine(database, interval=0), store, args.start, args.end)
+    simulator = Simulator(schedules, args.base_rate, appliance_loads(store), args.processes, args.chunk_size)
+    result = simulator.run(fleet, scenarios)
+    for row in summarize(fleet, scenarios, result):
+        print(json.dumps(row))
+    print(result["stats"])
@@ -0,0 +1,154 @@
+'''
+Time-of-Use Cost Engine
+Prices usage time series against the peak windows in pricing.PeakEnergyPricing.
+Each schedule is compiled once into a 1440-entry per-minute rate table and its running
+sum, so the rate for any interval, including one that crosses a window edge or
+midnight, is two array lookups. Whole arrays of intervals are priced in one NumPy pass.
+'''
+
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+
+
+def minute_of_day(value) -> int:
+    """
+    datetime.time (PostgreSQL), "HH:MM[:SS]" string (SQLite) or minutes -> minute of the day.
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value) % MINUTES_PER_DAY
+    if hasattr(value, "hour"):
+        return value.hour * 60 + value.minute
+    hours, minutes = str(value).split(":")[:2]
+    return (int(hours) * 60 + int(minutes)) % MINUTES_PER_DAY
+
+
+class TouSchedule:
+    def __init__(self, windows: list, base_rate: float, state_id: str = None):
+        """
+        :param windows: List of (start, end, rate); start/end as accepted by minute_of_day.
+            A window with end <= start wraps past midnight (22:00-06:00), and one with
+            end == start covers the whole day. Where windows overlap the highest rate applies.
+        :param base_rate: Rate ($/kWh) outside every window, e.g. the NREL residential rate.
+        :param state_id: State the schedule belongs to (informational).
+        """
+        self.state_id = state_id
+        self.base_rate = float(base_rate)
+        self.windows = [(minute_of_day(s), minute_of_day(e), float(r)) for s, e, r in windows]
+        self.rates = np.full(MINUTES_PER_DAY, self.base_rate)
+        minutes = np.arange(MINUTES_PER_DAY)
+        for start, end, rate in self.windows:
+            inside = (minutes >= start) & (minutes < end) if end > start else (minutes >= start) | (minutes < end)
+            self.rates[inside] = np.maximum(self.rates[inside], rate)
+        # Running sum over two days, so an interval starting late in the day can run past midnight
+        self.cumulative = np.concatenate(([0.0], np.cumsum(np.tile(self.rates, 2))))
+
+    @classmethod
+    def from_rows(cls, rows: list, base_rate: float, state_id: str = None) -> "TouSchedule":
+        """
+        :param rows: (start_time, end_time, peak_rate) rows from pricing.PeakEnergyPricing.
+        """
+        return cls([(start, end, float(rate)) for start, end, rate in rows], base_rate, state_id)
+
+
+def load_schedules(db, base_rates, states: list = None) -> dict:
+    """
+    Builds one schedule per state from pricing.PeakEnergyPricing.
+    :param base_rates: Off-peak rate for every state, or a dict of state_id -> rate
+        (states missing from the dict are skipped).
+    :param states: Restrict to these states (default: every state in the table).
+    :return: state_id -> TouSchedule.
+    """
+    rows = db.query("SELECT state_id, start_time, end_time, peak_rate FROM pricing.PeakEnergyPricing")
+    windows = {}
+    for state_id, start, end, rate in rows:
+        windows.setdefault(state_id, []).append((start, end, rate))
+    schedules = {}
+    for state_id in states or list(windows):
+        base_rate = base_rates.get(state_id) if isinstance(base_rates, dict) else base_rates
+        if base_rate is not None:
+            schedules[state_id] = TouSchedule(windows.get(state_id, []), base_rate, state_id)
+    return schedules
+
+
+def _as_epoch_ms(timestamps) -> np.ndarray:
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind == "M":
+        return timestamps.astype("datetime64[ms]").astype(np.int64)
+    return timestamps.astype(np.int64)
+
+
+def interval_rates(schedules, timestamps, duration_minutes=60, schedule_index=None,
+                   utc_offset_minutes: int = 0) -> np.ndarray:
+    """
+    Average rate over each interval [timestamp, timestamp + duration), weighting every
+    minute by its rate, so usage is assumed spread evenly across the interval.
+    Intervals shorter than a minute take the rate of the minute they start in.
+    :param schedules: One TouSchedule, or a list of them selected per interval by schedule_index.
+    :param timestamps: datetime64 array or epoch milliseconds (UTC).
+    :param duration_minutes: Interval length in whole minutes (scalar or per interval).
+    :param schedule_index: Index into schedules per interval (required for a list).
+    :param utc_offset_minutes: Offset of the schedule's local time from UTC (e.g. -300 for EST).
+        A fixed offset; DST changes are not modeled.
+    :return: float64 array of $/kWh, one per interval.
+    """
+    if isinstance(schedules, TouSchedule):
+        schedules, schedule_index = [schedules], 0
+    cumulative = np.stack([s.cumulative for s in schedules])
+    index = np.broadcast_to(np.asarray(schedule_index if schedule_index is not None else 0, dtype=np.intp),
+                            np.shape(timestamps))
+
+    minutes = _as_epoch_ms(timestamps) // 60_000 + utc_offset_minutes
+    start = minutes % MINUTES_PER_DAY
+    duration = np.broadcast_to(np.asarray(duration_minutes, dtype=np.int64), start.shape)
+    full_days, remainder = np.divmod(duration, MINUTES_PER_DAY)
+    total = (full_days * cumulative[index, MINUTES_PER_DAY]
+             + cumulative[index, start + remainder] - cumulative[index, start])
+    first_minute = cumulative[index, start + 1] - cumulative[index, start]
+    return np.where(duration > 0, total / np.maximum(duration, 1), first_minute)
+
+
+def price(schedules, timestamps, kwh, duration_minutes=60, schedule_index=None,
+          utc_offset_minutes: int = 0) -> np.ndarray:
+    """
+    Cost ($) of each interval's usage. Arguments as for interval_rates; kwh is the
+    energy used in each interval.
+    """
+    rates = interval_rates(schedules, timestamps, duration_minutes, schedule_index, utc_offset_minutes)
+    return rates * np.asarray(kwh, dtype=np.float64)
+
+
+def monthly_bills(entity_ids, timestamps, kwh, schedules, duration_minutes=60, schedule_index=None,
+                  utc_offset_minutes: int = 0) -> dict:
+    """
+    Prices every interval and totals kWh and cost per (entity, local calendar month).
+    :param entity_ids: Device, room or household id per interval.
+    :return: Dictionary of equal-length arrays: entity_id, month ("YYYY-MM"), kWh, cost.
+    """
+    entity_ids = np.asarray(entity_ids, dtype=np.int64)
+    kwh = np.asarray(kwh, dtype=np.float64)
+    timestamps_ms = _as_epoch_ms(timestamps)
+    cost = price(schedules, timestamps_ms, kwh, duration_minutes, schedule_index, utc_offset_minutes)
+    if not len(entity_ids):
+        return {"entity_id": entity_ids, "month": np.array([], dtype="<U7"), "kWh": kwh, "cost": cost}
+
+    local = (timestamps_ms + utc_offset_minutes * 60_000).astype("datetime64[ms]")
+    months = local.astype("datetime64[M]").astype(np.int64)
+    month_span = months.max() - months.min() + 1
+    combined = (entity_ids - entity_ids.min()) * month_span + (months - months.min())
+    key_range = int(combined.max()) + 1
+    if key_range <= max(4 * len(combined), 1 << 20):
+        # Dense key space (the usual fleet x months case): bin directly, no sort needed
+        present = np.bincount(combined, minlength=key_range) > 0
+        keys = np.flatnonzero(present)
+        kwh_sums = np.bincount(combined, weights=kwh, minlength=key_range)[keys]
+        cost_sums = np.bincount(combined, weights=cost, minlength=key_range)[keys]
+    else:
+        keys, group = np.unique(combined, return_inverse=True)
+        kwh_sums, cost_sums = np.bincount(group, weights=kwh), np.bincount(group, weights=cost)
+    return {
+        "entity_id": keys // month_span + entity_ids.min(),
+        "month": np.datetime_as_string((keys % month_span + months.min()).astype("datetime64[M]")).astype("<U7"),
+        "kWh": kwh_sums,
+        "cost": cost_sums
+    }
@@ -1,12 +1,19 @@
 #!/bin/bash
+# Usage: ./start_server.sh         production server (gunicorn, see gunicorn.conf.py)
+#        ./start_server.sh --dev   Flask development server
 
 # Activate virtual environment if it exists
 if [ -d "venv" ]; then
     source venv/bin/activate
 fi
 
-# Install requirements
-pip install -r requirements.txt
+# Install requirements only when requirements.txt changed since the last install
+STAMP=".requirements.sha256"
+if ! sha256sum --check --status "$STAMP" 2>/dev/null; then
+    pip install -r requirements.txt && sha256sum requirements.txt > "$STAMP"
+fi
 
-# Run the Flask app
-python app.py 
\ No newline at end of file
+if [ "$1" = "--dev" ]; then
+    exec python app.py
+fi
+exec gunicorn -c gunicorn.conf.py "app:create_app(preload=True)"
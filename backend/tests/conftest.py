@@ -0,0 +1,34 @@
+import pytest
+from database.db import Database
+
+
+@pytest.fixture
+def db():
+    database = Database("sqlite:///:memory:")
+    database.apply_schema()
+    yield database
+    database.close()
+
+
+def add_devices(db, device_ids, household_id=1):
+    """
+    One household with one room holding the given devices.
+    """
+    db.execute("INSERT INTO household.Households (household_id) VALUES (%s)", (household_id,))
+    db.execute("INSERT INTO household.Rooms (room_id, household_id, room_name) VALUES (%s, %s, 'Kitchen')",
+               (household_id, household_id))
+    db.executemany("INSERT INTO household.Devices (device_id, room_id, device_name, power_usage_per_hour_kWh) "
+                   "VALUES (%s, %s, 'Device', 1.0)", [(d, household_id) for d in device_ids])
+
+
+@pytest.fixture
+def app_module():
+    """
+    The Flask app module with no shared or worker state; tests set the globals they need.
+    """
+    pytest.importorskip("kagglehub")
+    import app
+    yield app
+    for name in ("database", "write_behind", "persistence", "telemetry_buffer", "rollups", "baselines",
+                 "anomaly_scorer", "topic_hub"):
+        setattr(app, name, None)
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from models.anomalies import AnomalyDetector, AnomalyScorer
+from tests.conftest import add_devices
+
+
+def log(db, rows):
+    db.copy_rows("energy_usage.EnergyConsumptionLog", ["device_id", "timestamp", "energy_used_kWh"], rows)
+
+
+def daily_readings(device_id, days, kwh=1.0):
+    return [(device_id, f"2024-06-{day:02d}T10:00:00", kwh) for day in days]
+
+
+def scorer(db, path, interval=0):
+    return AnomalyScorer(db, AnomalyDetector(warmup=3, path=path), interval=interval)
+
+
+def test_stored_readings_are_scored_once_and_alerts_are_shared(db, tmp_path):
+    add_devices(db, [1, 2])
+    # Readings stored before scoring starts are history, not alerted on
+    log(db, daily_readings(1, [1], kwh=99.0))
+    first = scorer(db, str(tmp_path / "state.npz"))
+    assert first._lead()
+    assert first.score() == 0
+
+    log(db, daily_readings(1, range(2, 12)) + daily_readings(2, range(2, 12)))
+    assert first.score() == 20
+    assert first.score() == 0
+    log(db, daily_readings(1, [12], kwh=50.0) + daily_readings(2, [12]))
+    assert first.score() == 2
+
+    alerts = first.recent()
+    assert [(a["device_id"], a["kind"], a["timestamp"]) for a in alerts] == [(1, "spike", "2024-06-12T10:00:00.000")]
+    assert first.recent(device_id=2) == []
+    # Any worker reads the same alerts from the database
+    second = scorer(db, str(tmp_path / "state.npz"))
+    assert not second._lead()
+    assert second.recent(since_ms=0) == alerts
+    first.close()
+    second.close()
+
+
+def test_other_workers_reload_profiles_and_take_over(db, tmp_path):
+    add_devices(db, [1])
+    path = str(tmp_path / "state.npz")
+    first, second = scorer(db, path), scorer(db, path)
+    assert first._lead() and not second._lead()
+    first.score()
+    log(db, daily_readings(1, range(1, 6)))
+    first.score()
+    assert second.profile(1) is None
+
+    first.detector.save()
+    assert second.reload()
+    assert second.profile(1)["readings"][10] == 5
+
+    first.close()
+    # Closing saved the profiles and released the lock
+    assert second._lead()
+    log(db, daily_readings(1, [6]))
+    assert second.score() == 1
+    assert second.profile(1)["readings"][10] == 6
+    second.close()
+
+
+def test_failed_write_rolls_the_profiles_back(db, tmp_path):
+    add_devices(db, [1])
+    detector = scorer(db, "")
+    detector.score()
+    readings = daily_readings(1, range(1, 6)) + daily_readings(1, [6], kwh=50.0)
+    log(db, readings)
+    # The watermark update fails, as if the connection dropped before the commit
+    db.execute("CREATE TRIGGER energy_usage.fail_watermark BEFORE UPDATE ON RollupWatermark "
+               "BEGIN SELECT RAISE(ABORT, 'connection lost'); END")
+    with pytest.raises(Exception, match="connection lost"):
+        detector.score()
+    assert detector.profile(1) is None
+    assert detector.stats()["readings_seen"] == 0
+    db.execute("DROP TRIGGER energy_usage.fail_watermark")
+
+    # The retried batch is scored once, like by a scorer that never failed
+    assert detector.score() == 6
+    expected = AnomalyDetector(warmup=3, path="")
+    expected.observe([1] * len(readings), [np.datetime64(t, "ms").astype(np.int64) for _, t, _ in readings],
+                     [kwh for _, _, kwh in readings])
+    assert detector.profile(1) == expected.profile(1)
+    assert [a["timestamp"] for a in detector.recent()] == ["2024-06-06T10:00:00.000"]
+    assert detector.stats()["alerts"] == {"spike": 1, "shift": 0}
@@ -0,0 +1,56 @@
+import numpy as np
+from models.baseline import BaselineEngine
+from tests.test_forecasting import DAYS, add_households, store_forecasts
+
+
+class DailyRollups:
+    def __init__(self, entity_ids, days, kwh):
+        self.arrays = (np.asarray(entity_ids, dtype=np.int64), np.asarray(days, dtype="datetime64[s]"),
+                       np.asarray(kwh, dtype=np.float64))
+
+    def series_all(self, level, start, end, grain, entity_id=None):
+        return self.arrays
+
+
+def two_climates(db):
+    # Coordinates as addresses, so no ZIP index is needed
+    add_households(db, ["28.06,-82.41", "61.22,-149.86", "40.71,-74.01"])
+    rng = np.random.default_rng(3)
+    tampa, anchorage = rng.integers(55, 95, len(DAYS)), rng.integers(35, 75, len(DAYS))
+    store_forecasts(db, {"TBW/71,98": tampa, "AFC/142,236": anchorage})
+    kwh = np.concatenate([10 + 0.8 * np.maximum(tampa - 70.0, 0), 8 + 0.5 * np.maximum(55.0 - anchorage, 0),
+                          np.full(len(DAYS), 12.0)])
+    return DailyRollups(np.repeat([1, 2, 3], len(DAYS)), np.tile(DAYS, 3), kwh)
+
+
+def test_households_are_fitted_against_their_own_gridpoint(db, tmp_path):
+    engine = BaselineEngine(db, two_climates(db), interval=0, path=str(tmp_path / "baseline.npz"))
+    assert engine.update(until="2024-07-01") == 2 * len(DAYS)
+
+    tampa, anchorage = engine.model(1), engine.model(2)
+    assert tampa["cooling_balance_f"] == 70.0 and abs(tampa["cooling_kWh_per_degree_day"] - 0.8) < 1e-6
+    assert tampa["heating_balance_f"] is None
+    assert anchorage["heating_balance_f"] == 55.0 and abs(anchorage["heating_kWh_per_degree_day"] - 0.5) < 1e-6
+    assert anchorage["cooling_balance_f"] is None
+    # No gridpoint is stored near New York
+    assert engine.model(3) is None
+    assert np.isnan(engine.temperatures_for(3, DAYS[:2])).all()
+    assert not np.isnan(engine.temperatures_for(1, DAYS[:2])).any()
+
+
+def test_only_the_lock_holder_updates_and_the_others_reload(db, tmp_path):
+    rollups = two_climates(db)
+    path = str(tmp_path / "baseline.npz")
+    first = BaselineEngine(db, rollups, interval=0, path=path)
+    second = BaselineEngine(db, rollups, interval=0, path=path)
+    assert first._lead() and not second._lead()
+
+    first.update(until="2024-07-01")
+    assert second.model(1) is None
+    assert second.reload()
+    assert not second.reload()
+    assert second.model(1)["cooling_kWh_per_degree_day"] == first.model(1)["cooling_kWh_per_degree_day"]
+
+    first.close()
+    assert second._lead()
+    second.close()
@@ -0,0 +1,43 @@
+import asyncio
+from data.api_wrappers.cache import TTLCache
+
+
+def test_none_results_are_cached_for_negative_ttl():
+    cache = TTLCache("test", negative_ttl=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None, None
+
+    assert cache.get_or_load("99999", loader) is None
+    assert cache.get_or_load("99999", loader) is None
+    assert len(calls) == 1
+
+
+def test_none_results_are_not_cached_without_negative_ttl():
+    cache = TTLCache("test")
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None, None
+
+    cache.get_or_load("99999", loader)
+    cache.get_or_load("99999", loader)
+    assert len(calls) == 2
+
+
+def test_async_none_results_are_cached_for_negative_ttl():
+    cache = TTLCache("test", negative_ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return None, None
+
+    async def lookups():
+        return [await cache.get_or_load_async("99999", loader) for _ in range(3)]
+
+    assert asyncio.run(lookups()) == [None, None, None]
+    assert len(calls) == 1
@@ -0,0 +1,76 @@
+import asyncio
+from data.api_wrappers.http_client import UpstreamError
+from data.pipelines.eia_sync import EIASync, next_month
+
+LATEST = "2024-03"
+
+
+class ScriptedClient:
+    def run(self, coro):
+        return asyncio.run(coro)
+
+
+class ScriptedFetcher:
+    """
+    Serves every requested (period, state, sector) up to LATEST; queries starting at a
+    month in failing_starts raise instead.
+    """
+    def __init__(self, failing_starts=()):
+        self.client = ScriptedClient()
+        self.failing_starts = set(failing_starts)
+        self.queries = []
+
+    async def get_retail_sales_async(self, states, sectors, start=None, end=None, page_size=None):
+        self.queries.append((start, tuple(states), tuple(sectors)))
+        if start in self.failing_starts:
+            raise UpstreamError("503 error for url: https://api.eia.gov/v2/electricity/retail-sales/data", 503)
+        records, period = [], start
+        while period <= LATEST:
+            records += [{"period": period, "stateid": state, "stateDescription": state, "sectorid": sector,
+                         "sectorName": sector, "sales": 100.0, "sales-units": "million kilowatt hours"}
+                        for state in states for sector in sectors]
+            period = next_month(period)
+        return records
+
+
+def set_watermarks(db, watermarks):
+    db.executemany("INSERT INTO energy_usage.EIASyncWatermark (state_id, sector_id, last_period) VALUES (%s, %s, %s)",
+                   [(state, sector, f"{period}-01") for (state, sector), period in watermarks.items()])
+
+
+WATERMARKS = {("FL", "ALL"): "2023-12", ("FL", "RES"): "2024-01", ("GA", "ALL"): "2024-01", ("GA", "RES"): "2024-01"}
+
+
+def test_plan_queries_cover_exactly_the_planned_pairs():
+    sync = EIASync(None, ScriptedFetcher(), states=["FL", "GA"], sectors=["ALL", "RES"])
+    assert sync.plan(WATERMARKS) == [
+        ("2024-01", ["FL"], ["ALL"]),
+        ("2024-02", ["FL"], ["RES"]),
+        ("2024-02", ["GA"], ["ALL", "RES"]),
+    ]
+
+
+def test_failed_query_keeps_its_pairs_watermark(db):
+    set_watermarks(db, WATERMARKS)
+    sync = EIASync(db, ScriptedFetcher(failing_starts=["2024-01"]), states=["FL", "GA"], sectors=["ALL", "RES"])
+    stats = sync.sync()
+    assert [error["start"] for error in stats["errors"]] == ["2024-01"]
+    watermarks = sync.watermarks()
+    assert watermarks[("FL", "ALL")] == "2023-12"
+    assert watermarks[("FL", "RES")] == watermarks[("GA", "ALL")] == LATEST
+    assert db.query("SELECT COUNT(*) FROM energy_usage.HistoricalElectricityUsage WHERE state_id = 'FL' "
+                    "AND sector_id = 'ALL'") == [(0,)]
+
+    # The next run retries the missed months
+    sync.fetcher.failing_starts.clear()
+    assert sync.sync()["errors"] == []
+    assert sync.watermarks()[("FL", "ALL")] == LATEST
+    assert db.query("SELECT COUNT(*) FROM energy_usage.HistoricalElectricityUsage WHERE state_id = 'FL' "
+                    "AND sector_id = 'ALL'") == [(3,)]
+
+
+def test_records_outside_the_planned_pairs_are_ignored(db):
+    sync = EIASync(db, ScriptedFetcher(), states=["FL"], sectors=["RES"])
+    records = asyncio.run(sync.fetcher.get_retail_sales_async(["FL", "GA"], ["RES"], "2024-03"))
+    assert sync.store(records, {}, {("FL", "RES")}) == 1
+    assert sync.watermarks() == {("FL", "RES"): "2024-03"}
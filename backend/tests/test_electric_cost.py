@@ -0,0 +1,64 @@
+import asyncio
+import json
+import threading
+import pytest
+from data.api_wrappers.electric_cost import UtilityRatesFetcher, rate_query
+from data.api_wrappers.http_client import HttpResponse
+from data.api_wrappers.rate_cache import RateCache
+
+NREL_RESPONSE = {"outputs": {"utility_name": "Tampa Electric Co", "residential": 0.1278}}
+
+
+class NrelClient:
+    def __init__(self):
+        self.requests = 0
+
+    async def get(self, url, params=None, headers=None):
+        self.requests += 1
+        return HttpResponse(200, {}, url, json.dumps(NREL_RESPONSE).encode())
+
+
+class ThreadRecordingRateCache(RateCache):
+    """
+    RateCache that records which thread each lookup and store ran on.
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def get(self, key, allow_stale=False):
+        self.threads.append(threading.get_ident())
+        return super().get(key, allow_stale)
+
+    def set(self, key, value, ttl=None):
+        self.threads.append(threading.get_ident())
+        super().set(key, value, ttl)
+
+
+def test_rate_store_calls_run_off_the_event_loop(tmp_path):
+    rate_cache = ThreadRecordingRateCache(str(tmp_path / "rates.sqlite"))
+    client = NrelClient()
+
+    async def lookup():
+        fetcher = UtilityRatesFetcher("key", client=client, rate_cache=rate_cache)
+        return await fetcher.get_residential_rate_async("33620"), threading.get_ident()
+
+    result, loop_thread = asyncio.run(lookup())
+    assert result == {"utility_name": "Tampa Electric Co", "residential_rate": 0.1278}
+    assert len(rate_cache.threads) == 2
+    assert loop_thread not in rate_cache.threads
+
+    # A fresh process-local cache is served from the shared store without calling NREL
+    result, _ = asyncio.run(lookup())
+    assert result["residential_rate"] == 0.1278
+    assert client.requests == 1
+
+
+@pytest.mark.parametrize("address", ["28.06123,-82.41234", "28.061,-82.41234", " 28.06123 , -82.41234 "])
+def test_coordinates_with_five_digit_fractions_are_not_zip_codes(address):
+    assert rate_query(address) == ("coord:28.06,-82.41", {"lat": 28.06, "lon": -82.41})
+
+
+@pytest.mark.parametrize("address", ["33602", "33602-1234", "Tampa, FL 33602", "1 Main St, Tampa FL 33602-1234, USA"])
+def test_addresses_ending_in_a_zip_share_its_key(address):
+    assert rate_query(address) == ("zip:33602", {"address": "33602"})
@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+from data.api_wrappers.zip_index import ZipIndex
+from models.forecasting import (BALANCE_POINT_F, HOUR_MS, DailyTemperatures, feature_names, train,
+                                train_household_model)
+
+# Tampa and Anchorage, each with one stored forecast gridpoint
+ZIPS = ZipIndex(np.array([33620, 99501], dtype=np.uint32), np.array([28.06, 61.22], dtype=np.float32),
+                np.array([-82.41, -149.86], dtype=np.float32), np.array([b"FL", b"AK"], dtype="S2"))
+GRIDPOINTS = {"TBW/71,98": (28.05, -82.42), "AFC/142,236": (61.21, -149.88)}
+DAYS = np.arange(np.datetime64("2024-06-01"), np.datetime64("2024-07-01"))
+
+
+class HourlyRollups:
+    def __init__(self, entity_ids, buckets, kwh):
+        self.arrays = (np.asarray(entity_ids, dtype=np.int64), np.asarray(buckets, dtype="datetime64[s]"),
+                       np.asarray(kwh, dtype=np.float64))
+
+    def series_all(self, level, start, end, grain, entity_id=None):
+        return self.arrays
+
+
+def add_households(db, addresses):
+    for household_id, address in enumerate(addresses, start=1):
+        db.execute("INSERT INTO user_management.Users (user_id, first_name, last_name, email, phone_number, "
+                   "house_address) VALUES (%s, 'A', 'B', %s, %s, %s)",
+                   (household_id, f"user{household_id}@example.com", str(household_id), address))
+        db.execute("INSERT INTO household.Households (household_id, user_id) VALUES (%s, %s)",
+                   (household_id, household_id))
+
+
+def store_forecasts(db, temperatures):
+    rows = []
+    for gridpoint, series in temperatures.items():
+        latitude, longitude = GRIDPOINTS[gridpoint]
+        for day, temperature in zip(DAYS, series):
+            rows += [(gridpoint, latitude, longitude, str(day), period, int(temperature), "Sunny", 5.0)
+                     for period in ("Day", "Night")]
+    db.executemany("INSERT INTO others.WeatherForecast (gridpoint, latitude, longitude, date, time_period, "
+                   "temperature_f, forecast_description, wind_speed_mph) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                   rows)
+
+
+def test_households_map_to_their_nearest_gridpoint(db):
+    add_households(db, ["4202 E Fowler Ave, Tampa, FL 33620", "Anchorage, AK 99501", "61.2,-149.9",
+                        "Nowhere 00000"])
+    store_forecasts(db, {"TBW/71,98": np.full(len(DAYS), 85.0), "AFC/142,236": np.full(len(DAYS), 55.0)})
+    temperatures = DailyTemperatures.from_db(db)
+    rows = temperatures.for_households(db, [1, 2, 3, 4], ZIPS)
+    assert [temperatures.gridpoints[r] if r >= 0 else None for r in rows] == [
+        "TBW/71,98", "AFC/142,236", "AFC/142,236", None
+    ]
+    assert temperatures.by_date(rows[0])["2024-06-15"] == 85.0
+    # A location far from every stored gridpoint gets none
+    assert temperatures.nearest([40.7], [-74.0]).tolist() == [-1]
+
+
+def test_household_model_uses_each_households_own_temperatures(db):
+    add_households(db, ["Tampa, FL 33620", "Anchorage, AK 99501"])
+    rng = np.random.default_rng(7)
+    tampa = rng.integers(80, 90, len(DAYS))
+    anchorage = rng.integers(48, 58, len(DAYS))
+    store_forecasts(db, {"TBW/71,98": tampa, "AFC/142,236": anchorage})
+
+    hours = np.arange(len(DAYS) * 24)
+    buckets = DAYS[0].astype("datetime64[s]") + hours * 3600
+    # Tampa cools at 0.1 kWh per degree above the balance point; Anchorage heats at 0.05 per degree below
+    tampa_kwh = 0.5 + 0.1 * np.maximum(np.repeat(tampa, 24) - BALANCE_POINT_F, 0)
+    anchorage_kwh = 0.3 + 0.05 * np.maximum(BALANCE_POINT_F - np.repeat(anchorage, 24), 0)
+    rollups = HourlyRollups(np.repeat([1, 2], len(hours)), np.concatenate([buckets, buckets]),
+                            np.concatenate([tampa_kwh, anchorage_kwh]))
+
+    model = train_household_model(db, rollups, "2024-06-01", "2024-07-01", alpha=1e-6, zip_index=ZIPS)
+    assert model.weather and model.meta["locations"] == 2
+    names = feature_names(True)
+    cooling, heating = names.index("cooling_degrees"), names.index("heating_degrees")
+    assert abs(model.coef[0, cooling] - 0.1) < 1e-3
+    assert abs(model.coef[1, heating] - 0.05) < 1e-3
+    assert model.meta["metrics"]["WAPE"] < 0.01
+
+    timestamps = np.arange(24) * HOUR_MS + buckets[0].astype("datetime64[ms]").astype(np.int64)
+    assert abs(model.predict(["1"], timestamps, np.full(24, 85.0))["1"].mean() - 2.5) < 0.01
+
+
+def degree_model(keys=(1, 2)):
+    """
+    Households using 1 kWh plus 0.1 kWh per cooling degree; the second also 0.05 per heating degree.
+    """
+    names = feature_names(True)
+    model = train("household_load", list(keys), np.zeros(1, dtype=np.int64), np.zeros((1, len(keys))),
+                  np.zeros((1, len(keys)), dtype=bool), "kWh", np.zeros(1))
+    model.coef[:] = 0
+    model.coef[:, names.index("bias")] = 1.0
+    model.coef[:, names.index("cooling_degrees")] = 0.1
+    model.coef[1, names.index("heating_degrees")] = 0.05
+    return model
+
+
+def test_predict_gives_each_series_its_own_location():
+    timestamps = np.arange(3) * HOUR_MS
+    temperature = np.column_stack([np.full(3, 85.0), np.full(3, 45.0)])
+    predictions = degree_model().predict(["2", "9", "1"], timestamps, temperature, np.array([1, 0, -1]))
+    assert set(predictions) == {"1", "2"}
+    np.testing.assert_allclose(predictions["2"], 2.0)
+    # No location: the balance point
+    np.testing.assert_allclose(predictions["1"], 1.0)
+
+
+class GridpointWeather:
+    """
+    WeatherFetcher stand-in with one gridpoint per whole degree of latitude.
+    """
+    def __init__(self, temperatures):
+        self.temperatures = temperatures
+        self.requests = []
+
+    async def get_weather_for_locations_async(self, coordinates):
+        self.requests.append(coordinates)
+        keys = [f"GRID/{int(lat)}" for lat, _ in coordinates]
+        periods = {key: {"properties": {"periods": [{"startTime": "2024-06-01T00:00:00+00:00",
+                                                      "endTime": "2024-06-02T00:00:00+00:00",
+                                                      "temperature": self.temperatures[key]}]}}
+                   for key in set(keys)}
+        return keys, periods
+
+
+def test_forecast_endpoint_uses_each_households_own_weather(db, app_module, monkeypatch):
+    add_households(db, ["28.06,-82.41", "61.22,-149.86", "28.40,-82.10"])
+    weather = GridpointWeather({"GRID/28": 85, "GRID/61": 45})
+    model = degree_model((1, 2, 3))
+    monkeypatch.setattr(app_module, "weather_fetcher", weather)
+    monkeypatch.setattr(app_module, "model_server", type("Server", (), {"get": lambda self, name: model})())
+    app_module.database = db
+
+    response = app_module.app.test_client().get(
+        "/api/forecast?model=household&ids=1,2,3,4&hours=2&start=2024-06-01T00")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["weather"] and body["unknown_ids"] == ["4"]
+    assert body["forecasts"]["1"] == body["forecasts"]["3"] == pytest.approx([3.0, 3.0])
+    assert body["forecasts"]["2"] == pytest.approx([2.0, 2.0])
+    # One request for the three distinct locations
+    assert len(weather.requests) == 1 and len(weather.requests[0]) == 3
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import pytest
+from data.api_wrappers.electric_usage import EIADataFetcher
+from data.api_wrappers.http_client import HttpResponse
+from database.persistence import Persistence
+from database.write_behind import WriteBehindQueue
+
+GRIDPOINT = {"key": "TBW/71,98", "forecast_url": "https://api.weather.gov/gridpoints/TBW/71,98/forecast",
+             "latitude": 28.0587, "longitude": -82.4139}
+
+
+class StaticClient:
+    """
+    Stands in for AsyncHttpClient, answering every request with the same JSON payload.
+    """
+    def __init__(self, payload: dict):
+        self.payload = payload
+
+    async def get(self, url, params=None, headers=None):
+        return HttpResponse(200, {}, url, json.dumps(self.payload).encode())
+
+    def run(self, coro):
+        return asyncio.run(coro)
+
+
+def forecast(periods):
+    return {"properties": {"periods": [
+        {"name": name, "startTime": start, "isDaytime": daytime, "temperature": temperature,
+         "temperatureUnit": "F", "windSpeed": "5 to 10 mph", "shortForecast": "Sunny"}
+        for name, start, daytime, temperature in periods
+    ]}}
+
+
+@pytest.fixture
+def persistence(db):
+    writer = WriteBehindQueue(db, flush_interval=60)
+    yield Persistence(writer)
+    writer.close()
+
+
+def test_write_behind_queue_bulk_writes_rows_on_flush(db):
+    writer = WriteBehindQueue(db, flush_interval=60)
+    rows = [("Utility", 0.1 + i / 1000, "2024-01-01 00:00:00") for i in range(1200)]
+    assert writer.submit_many("energy_usage.ElectricityCost", ("utility_name", "residential_rate", "log_date"),
+                              rows) == 1200
+    writer.flush(timeout=5)
+    assert db.query("SELECT COUNT(*) FROM energy_usage.ElectricityCost") == [(1200,)]
+    assert writer.stats()["rows_written"] == 1200
+    writer.close()
+
+
+def test_write_behind_queue_counts_failed_batches_without_stopping(db):
+    writer = WriteBehindQueue(db, flush_interval=60)
+    writer.submit("energy_usage.NoSuchTable", ("a",), (1,))
+    writer.submit("energy_usage.ElectricityCost", ("utility_name", "residential_rate", "log_date"),
+                  ("Utility", 0.12, "2024-01-01 00:00:00"))
+    writer.flush(timeout=5)
+    assert writer.stats()["failed_batches"] == 1
+    assert db.query("SELECT COUNT(*) FROM energy_usage.ElectricityCost") == [(1,)]
+    writer.close()
+
+
+def test_repeated_forecasts_upsert_one_row_per_gridpoint_and_half_day(db, persistence):
+    persistence.record_weather_forecast(forecast([
+        ("Friday", "2024-07-05T06:00:00-04:00", True, 91),
+        ("Friday Night", "2024-07-05T18:00:00-04:00", False, 77),
+    ]), GRIDPOINT)
+    # Fetched a day later, the same periods are named differently and revised
+    persistence.record_weather_forecast(forecast([
+        ("Today", "2024-07-05T06:00:00-04:00", True, 93),
+        ("Tonight", "2024-07-05T18:00:00-04:00", False, 78),
+    ]), GRIDPOINT)
+    persistence.writer.flush(timeout=5)
+    rows = db.query("SELECT gridpoint, latitude, longitude, date, time_period, temperature_f "
+                    "FROM others.WeatherForecast ORDER BY time_period")
+    assert rows == [("TBW/71,98", 28.0587, -82.4139, "2024-07-05", "Day", 93),
+                    ("TBW/71,98", 28.0587, -82.4139, "2024-07-05", "Night", 78)]
+
+
+def test_revised_eia_periods_replace_stored_ones(db, persistence):
+    def result(sales):
+        return {"success": True, "data": [
+            {"period": "2024-01", "stateid": "FL", "stateDescription": "Florida", "sectorid": "RES",
+             "sectorName": "residential", "sales": sales, "sales-units": "million kilowatt hours"}
+        ]}
+
+    persistence.record_historical_usage(result(100.0))
+    persistence.record_historical_usage(result(101.5))
+    persistence.writer.flush(timeout=5)
+    assert db.query("SELECT period, state_id, sector_id, sales FROM energy_usage.HistoricalElectricityUsage") == [
+        ("2024-01-01", "FL", "RES", 101.5)
+    ]
+
+
+def test_eia_results_are_persisted_through_on_fetch(db, persistence):
+    client = StaticClient({"response": {"total": 1, "data": [
+        {"period": "2024-02", "stateid": "GA", "stateDescription": "Georgia", "sectorid": "ALL",
+         "sectorName": "all sectors", "sales": 11000.0, "sales-units": "million kilowatt hours"}
+    ]}})
+    fetcher = EIADataFetcher("key", client=client, on_fetch=persistence.record_historical_usage)
+    assert fetcher.get_historical_electricity_usage({"state": "GA"})["success"]
+    persistence.writer.flush(timeout=5)
+    assert db.query("SELECT state_id, sales FROM energy_usage.HistoricalElectricityUsage") == [("GA", 11000.0)]
+
+
+def test_model_executions_keep_microsecond_timings(db, persistence):
+    persistence.record_model_execution("household_load:v1", 0.0004567891, {"stage": "predict"})
+    persistence.writer.flush(timeout=5)
+    [(seconds,)] = db.query("SELECT execution_time_seconds FROM model_results.ModelExecutionLogs")
+    assert float(seconds) == pytest.approx(0.000457, abs=1e-9)
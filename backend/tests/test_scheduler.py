@@ -0,0 +1,29 @@
+import numpy as np
+from models.scheduler import LoadScheduler, ShiftableLoad, store_results
+from models.tou_cost import TouSchedule
+
+
+def test_per_household_timings_keep_sub_millisecond_precision(db):
+    schedules = {"FL": TouSchedule([("16:00", "21:00", 0.30)], base_rate=0.10, state_id="FL")}
+    # A one-hour washing machine cycle that usually starts at 18:00, inside the peak window
+    loads = {"washing_machine": ShiftableLoad("washing_machine", np.full(4, 0.25), baseline_start=72)}
+    households = [{"household_id": i, "state": "FL", "preferred_hours": None,
+                   "devices": [(i, "Washing Machine")]} for i in range(1, 4)]
+    db.executemany("INSERT INTO household.Households (household_id) VALUES (%s)", [(i,) for i in range(1, 4)])
+    db.executemany("INSERT INTO household.Rooms (room_id, household_id, room_name) VALUES (%s, %s, 'Laundry')",
+                   [(i, i) for i in range(1, 4)])
+    db.executemany("INSERT INTO household.Devices (device_id, room_id, device_name, power_usage_per_hour_kWh) "
+                   "VALUES (%s, %s, 'Washing Machine', 0.5)", [(i, i) for i in range(1, 4)])
+
+    result = LoadScheduler(schedules, loads, processes=1).run(households)
+    assert result["stats"]["decisions"] == 3
+    store_results(db, result)
+
+    stored = db.query("SELECT execution_time_seconds, parameters FROM model_results.ModelExecutionLogs "
+                      "ORDER BY log_id")
+    assert len(stored) == 4
+    per_household = [float(seconds) for seconds, parameters in stored[:3]]
+    # Households served from the window memo take microseconds; three decimals would store 0.000
+    assert all(seconds > 0 for seconds in per_household)
+    assert all(seconds < 0.001 for seconds in per_household[1:])
+    assert db.query("SELECT COUNT(*) FROM model_results.OptimizationDecisions") == [(3,)]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from models.scheduler import SLOTS_PER_DAY, ShiftableLoad
+from models.simulation import DAYS_PER_YEAR, FleetProfiles, Scenario, Simulator, simulation_pool
+from models.tou_cost import TouSchedule
+
+SCHEDULES = {"CA": TouSchedule([("16:00", "21:00", 0.42)], base_rate=0.14, state_id="CA")}
+CYCLES = {"washing_machine": ShiftableLoad("washing_machine", [0.5, 0.5, 0.25], baseline_start=72)}
+
+
+def make_fleet(households):
+    rng = np.random.default_rng(3)
+    shapes = rng.random((2, SLOTS_PER_DAY))
+    return FleetProfiles(np.arange(households), ["CA" if i % 2 else "TX" for i in range(households)],
+                         ["washing_machine", "other"], rng.random((households, 2)) * 5,
+                         shapes / shapes.sum(axis=1, keepdims=True))
+
+
+def make_scenarios():
+    return [Scenario("current"),
+            Scenario.from_dict({"changes": [{"appliance": "washing_machine", "shift_to": "off_peak"}]},
+                               SCHEDULES, 0.14, "shift"),
+            Scenario.from_dict({"tariff": {"state": "CA"}, "changes": [{"appliance": "other", "scale": 0.5}]},
+                               SCHEDULES, 0.14, "ca")]
+
+
+def test_shared_pool_matches_in_process_run():
+    fleet, scenarios = make_fleet(250), make_scenarios()
+    expected = Simulator(SCHEDULES, 0.14, CYCLES, processes=1, chunk_size=40).run(fleet, scenarios)
+    pool = simulation_pool(2)
+    try:
+        simulator = Simulator(SCHEDULES, 0.14, CYCLES, processes=2, chunk_size=40, pool=pool)
+        # The same pool serves every run
+        for _ in range(2):
+            result = simulator.run(fleet, scenarios)
+            assert result["stats"]["processes"] == 2
+            for key in ("kWh", "cost", "peak_kWh"):
+                np.testing.assert_allclose(result[key], expected[key])
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.parametrize("households", [0, 1, 40, 41, 119])
+def test_parts_cover_the_fleet(households):
+    fleet = make_fleet(households)
+    result = Simulator(SCHEDULES, 0.14, CYCLES, processes=3, chunk_size=40).run(fleet, make_scenarios()[:1])
+    assert result["kWh"].shape == (households, 1)
+    np.testing.assert_allclose(result["kWh"][:, 0], fleet.energy.sum(axis=1) * DAYS_PER_YEAR, rtol=1e-9)
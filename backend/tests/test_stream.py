@@ -0,0 +1,71 @@
+from concurrent.futures import Future
+from urllib.parse import quote
+import pytest
+from data.api_wrappers.electric_cost import rate_query
+from data.topic_hub import TopicHub
+
+ADDRESS = "4202 E Fowler Ave, Tampa, FL 33620"
+
+
+class IdleClient:
+    """
+    Stands in for AsyncHttpClient; topic refreshers are never run.
+    """
+    def spawn(self, coro):
+        coro.close()
+        return Future()
+
+    def call_later(self, delay, callback):
+        pass
+
+
+@pytest.fixture
+def stream_app(app_module, monkeypatch):
+    hub = TopicHub(IdleClient())
+
+    async def load(argument):
+        return {}
+
+    hub.register('rates', load, interval=60, canonical=lambda address: rate_query(address)[0])
+    hub.register('weather', load, interval=60, canonical=app_module.canonical_zipcode)
+    monkeypatch.setattr(app_module, "topic_hub", hub)
+    return app_module
+
+
+def first_chunk(response) -> str:
+    chunks = response.response
+    try:
+        return next(iter(chunks)).decode()
+    finally:
+        response.close()
+
+
+def test_address_topic_with_commas_is_one_topic(stream_app):
+    client = stream_app.app.test_client()
+    response = client.get(f"/api/stream?topic={quote('rates:' + ADDRESS)}&topic=weather:33620", buffered=False)
+    assert response.status_code == 200
+    assert "subscribed to rates:zip:33620, weather:33620" in first_chunk(response)
+    assert stream_app.topic_hub.stats()["rates:zip:33620"]["subscribers"] == 0
+
+
+def test_comma_separated_topics_still_accepted(stream_app):
+    response = stream_app.app.test_client().get("/api/stream?topics=rates:33620,weather:33620", buffered=False)
+    assert "subscribed to rates:zip:33620, weather:33620" in first_chunk(response)
+
+
+def test_streams_beyond_the_per_worker_cap_get_503(stream_app, monkeypatch):
+    monkeypatch.setattr(stream_app, "STREAM_MAX_CONNECTIONS", 1)
+    client = stream_app.app.test_client()
+    held = client.get("/api/stream?topic=weather:33620", buffered=False)
+    assert held.status_code == 200
+    rejected = client.get("/api/stream?topic=weather:33620", buffered=False)
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "5"
+    held.close()
+    assert stream_app.stream_connections["open"] == 0
+    again = client.get("/api/stream?topic=weather:33620", buffered=False)
+    assert again.status_code == 200
+    again.close()
+    # An invalid topic releases its slot too
+    assert client.get("/api/stream?topic=weather:Tampa").status_code == 400
+    assert stream_app.stream_connections["open"] == 0
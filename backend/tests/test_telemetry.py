@@ -0,0 +1,121 @@
+import threading
+import numpy as np
+from database.telemetry import KnownDevices, TelemetryBuffer
+from tests.conftest import add_devices
+
+
+class FlakyCopy:
+    """
+    Wraps a Database so the next copy_rows calls fail, as during a database outage.
+    """
+    def __init__(self, db, failures: int):
+        self.db = db
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def copy_rows(self, table, columns, rows):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("server closed the connection unexpectedly")
+        return self.db.copy_rows(table, columns, rows)
+
+
+def readings(device_ids, start_s=1_717_243_200):
+    device_ids = np.asarray(device_ids, dtype=np.int64)
+    return device_ids, (start_s + np.arange(len(device_ids))) * 1000, np.full(len(device_ids), 0.25)
+
+
+def logged(db):
+    return db.query("SELECT COUNT(*) FROM energy_usage.EnergyConsumptionLog")[0][0]
+
+
+def test_failed_flush_keeps_readings_and_writes_them_on_retry(db):
+    add_devices(db, [1, 2])
+    buffer = TelemetryBuffer(FlakyCopy(db, failures=1), capacity=100, flush_interval=3600)
+    assert buffer.add(*readings([1, 2, 1]))
+    assert buffer.flush() == 0
+    assert logged(db) == 0
+    assert buffer.stats()["awaiting_retry"] == 3
+
+    assert buffer.add(*readings([2], start_s=1_717_250_000))
+    assert buffer.flush() == 4
+    assert logged(db) == 4
+    assert buffer.stats()["awaiting_retry"] == 0
+    buffer.close()
+
+
+def test_readings_awaiting_retry_count_against_capacity(db):
+    add_devices(db, [1])
+    buffer = TelemetryBuffer(FlakyCopy(db, failures=1), capacity=4, flush_interval=3600)
+    assert buffer.add(*readings([1, 1, 1]))
+    buffer.flush()
+    assert not buffer.add(*readings([1, 1]))
+    assert buffer.add(*readings([1]))
+    buffer.close()
+    assert logged(db) == 4
+
+
+class StalledCopy(FlakyCopy):
+    """
+    FlakyCopy whose copy_rows waits to be released, holding a flush mid-write.
+    """
+    def __init__(self, db, failures: int):
+        super().__init__(db, failures)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def copy_rows(self, table, columns, rows):
+        self.writing.set()
+        self.release.wait(timeout=5)
+        return super().copy_rows(table, columns, rows)
+
+
+def test_readings_being_flushed_count_against_capacity(db):
+    add_devices(db, [1])
+    stalled = StalledCopy(db, failures=1)
+    buffer = TelemetryBuffer(stalled, capacity=4, flush_interval=3600)
+    assert buffer.add(*readings([1, 1, 1]))
+    flush = threading.Thread(target=buffer.flush)
+    flush.start()
+    assert stalled.writing.wait(timeout=5)
+    assert not buffer.add(*readings([1, 1]))
+    assert buffer.add(*readings([1], start_s=1_717_250_000))
+    stalled.release.set()
+    flush.join(timeout=5)
+    buffer.close()
+    assert logged(db) == 4
+
+
+def test_retry_discards_readings_of_deleted_devices(db):
+    add_devices(db, [1, 2])
+    devices = KnownDevices(db)
+    buffer = TelemetryBuffer(FlakyCopy(db, failures=1), capacity=100, flush_interval=3600, devices=devices)
+    buffer.add(*readings([1, 2, 2]))
+    db.execute("DELETE FROM household.Devices WHERE device_id = 2")
+    buffer.flush()
+    assert buffer.stats()["readings_discarded"] == 2
+    assert buffer.flush() == 1
+    buffer.close()
+
+
+def test_known_devices_reports_unknown_ids_and_picks_up_new_ones(db):
+    add_devices(db, [1, 2])
+    devices = KnownDevices(db, min_refresh_interval=0)
+    assert devices.unknown(np.array([1, 7, 2, 7])).tolist() == [7]
+    db.execute("INSERT INTO household.Devices (device_id, room_id, device_name, power_usage_per_hour_kWh) "
+               "VALUES (7, 1, 'Heater', 1.5)")
+    assert devices.unknown(np.array([7])).tolist() == []
+
+
+def test_telemetry_endpoint_rejects_unknown_devices(db, app_module):
+    add_devices(db, [1, 2])
+    app_module.telemetry_buffer = TelemetryBuffer(db, capacity=100, flush_interval=3600, devices=KnownDevices(db))
+    client = app_module.app.test_client()
+    response = client.post('/api/telemetry', json={'device_id': [1, 99], 'timestamp': [1717243200, 1717243200],
+                                                   'energy_used_kWh': [0.1, 0.2]})
+    assert response.status_code == 400
+    assert response.get_json()['unknown_device_ids'] == [99]
+    assert app_module.telemetry_buffer.stats()['buffered'] == 0
+    app_module.telemetry_buffer.close()
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from database.rollups import RollupEngine
+from models.tou_cost import TouSchedule, interval_rates, load_schedules, monthly_bills
+from tests.conftest import add_devices
+
+PEAK = [("16:00", "21:00", 0.30)]
+
+
+def test_interval_crossing_a_window_edge_is_minute_weighted():
+    schedule = TouSchedule(PEAK, base_rate=0.10)
+    timestamps = np.array(["2024-06-01T15:30", "2024-06-01T17:00", "2024-06-01T20:45"], dtype="datetime64[m]")
+    assert np.allclose(interval_rates(schedule, timestamps, 60), [0.20, 0.30, 0.15])
+
+
+def test_overnight_window_wraps_past_midnight():
+    schedule = TouSchedule([("22:00", "06:00", 0.25)], base_rate=0.10)
+    timestamps = np.array(["2024-06-01T23:30", "2024-06-02T05:30", "2024-06-02T12:00"], dtype="datetime64[m]")
+    assert np.allclose(interval_rates(schedule, timestamps, 60), [0.25, 0.175, 0.10])
+
+
+def test_overlapping_windows_take_the_highest_rate():
+    schedule = TouSchedule([("16:00", "21:00", 0.30), ("18:00", "19:00", 0.50), ("00:00", "06:00", 0.05)], 0.10)
+    assert schedule.rates[18 * 60] == pytest.approx(0.50)
+    assert schedule.rates[20 * 60] == pytest.approx(0.30)
+    # A window cheaper than the base rate never undercuts it
+    assert schedule.rates[3 * 60] == pytest.approx(0.10)
+
+
+def test_monthly_bills_group_by_entity_and_local_month():
+    schedule = TouSchedule(PEAK, base_rate=0.10)
+    # 03:00 UTC on July 1st is still June 30th at UTC-5
+    timestamps = np.array(["2024-06-30T17:00", "2024-07-01T03:00", "2024-07-01T03:00"], dtype="datetime64[s]")
+    bills = monthly_bills([1, 1, 2], timestamps, [1.0, 2.0, 4.0], schedule, utc_offset_minutes=-300)
+    assert list(bills["entity_id"]) == [1, 2]
+    assert list(bills["month"]) == ["2024-06", "2024-06"]
+    assert np.allclose(bills["kWh"], [3.0, 4.0])
+    # 12:00 and 22:00 local are both off-peak
+    assert np.allclose(bills["cost"], [0.30, 0.40])
+
+
+def test_load_schedules_reads_peak_windows(db):
+    db.execute("INSERT INTO pricing.PeakEnergyPricing (state_id, start_time, end_time, peak_rate) "
+               "VALUES ('FL', '16:00:00', '21:00:00', 0.30)")
+    schedules = load_schedules(db, {"FL": 0.12, "GA": 0.11}, ["FL", "GA"])
+    assert set(schedules) == {"FL", "GA"}
+    assert schedules["FL"].rates[17 * 60] == pytest.approx(0.30)
+    assert schedules["GA"].windows == []
+
+
+def test_cost_endpoint_bills_only_the_requested_entity(db, app_module):
+    add_devices(db, [1], household_id=1)
+    add_devices(db, [2], household_id=2)
+    db.execute("INSERT INTO pricing.PeakEnergyPricing (state_id, start_time, end_time, peak_rate) "
+               "VALUES ('FL', '16:00:00', '21:00:00', 0.30)")
+    db.copy_rows("energy_usage.EnergyConsumptionLog", ["device_id", "timestamp", "energy_used_kWh"],
+                 [(1, "2024-06-01T17:10:00", 2.0), (1, "2024-06-01T09:00:00", 1.0), (2, "2024-06-01T17:00:00", 8.0)])
+    app_module.database = db
+    app_module.rollups = RollupEngine(db, interval=0)
+    app_module.rollups.refresh()
+
+    response = app_module.app.test_client().get(
+        "/api/cost?level=household&id=1&start=2024-06-01&end=2024-06-02&state=FL&base_rate=0.10")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [bill["id"] for bill in body["bills"]] == [1]
+    assert body["energy_kWh"] == 3.0
+    assert body["cost"] == pytest.approx(0.70)
@@ -0,0 +1,28 @@
+import numpy as np
+from data.api_wrappers.zip_index import ZipIndex
+
+
+def make_index(zips):
+    zips = np.array(sorted(zips), dtype=np.uint32)
+    return ZipIndex(zips, np.arange(len(zips), dtype=np.float32), -np.arange(len(zips), dtype=np.float32),
+                    np.array([b"FL"] * len(zips), dtype="S2"))
+
+
+def test_lookup_resolves_zip_and_zip_plus_four():
+    result = make_index([336, 33620, 94105]).lookup(["33620", "94105-1234", " 00336 "])
+    assert result["found"].tolist() == [True, True, True]
+    assert result["state"][0] == b"FL"
+
+
+def test_lookup_rejects_inputs_that_are_not_five_digits():
+    result = make_index([336, 33620]).lookup(["336", "3362", "336200", "abcde", ""])
+    assert not result["found"].any()
+    assert np.isnan(result["latitude"]).all()
+
+
+def test_lookup_on_empty_index_reports_not_found():
+    index = ZipIndex(np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32),
+                     np.zeros(0, dtype="S2"))
+    result = index.lookup(["33620", "94105"])
+    assert result["found"].tolist() == [False, False]
+    assert index.get_coordinates("33620") == (None, None)
@@ -24,31 +24,30 @@ const Dashboard = ({ user, selectedRoom, setSelectedDevice }) => {
     return () => clearTimeout(timer);
   }, []);
 
-  // Fetch electricity cost data
+  // Follow the electricity rate; the server pushes an update whenever it changes
   useEffect(() => {
-    const fetchElectricityData = async () => {
-      try {
-        const address = user.address || user.zipCode || "33620";
-        const response = await fetch(`http://localhost:5000/api/electric-cost?address=${address}`);
-        
-        if (!response.ok) {
-          throw new Error(`Electric cost API returned status ${response.status}`);
-        }
-        
-        const data = await response.json();
-        setElectricityData(data);
-        
-        // Update electricity rate if available
-        if (data && data.residential_rate) {
-          setElectricityRate(parseFloat(data.residential_rate));
-        }
-      } catch (err) {
-        console.error("Failed to fetch electricity cost data:", err);
-        // Keep using the default rate
+    const address = user.address || user.zipCode || "33620";
+    // One topic parameter per topic: street addresses contain commas
+    const source = new EventSource(
+      `http://localhost:5000/api/stream?topic=${encodeURIComponent(`rates:${address}`)}`
+    );
+
+    source.onmessage = (event) => {
+      const { data } = JSON.parse(event.data);
+      if (data.error) {
+        console.error("Failed to fetch electricity cost data:", data.error);
+        // Keep using the current rate
+        return;
+      }
+      setElectricityData(data);
+
+      // Update electricity rate if available
+      if (data.residential_rate) {
+        setElectricityRate(parseFloat(data.residential_rate));
       }
     };
 
-    fetchElectricityData();
+    return () => source.close();
   }, [user.address, user.zipCode]);
 
   // Handle keyboard shortcut for search
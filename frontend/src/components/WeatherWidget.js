@@ -68,55 +68,55 @@ const getWeatherIcon = (forecast) => {
   return weatherIcons.default || cloud;
 };
 
+// Shown when the weather service cannot be reached
+const fallbackWeather = {
+  current: {
+    temperature: 75,
+    temperatureUnit: "F",
+    shortForecast: "Sunny",
+    windSpeed: "10 mph",
+    windDirection: "SW"
+  },
+  forecast: [
+    { name: "Tonight", temperature: 68, shortForecast: "Clear" },
+    { name: "Monday", temperature: 78, shortForecast: "Partly Cloudy" },
+    { name: "Monday Night", temperature: 65, shortForecast: "Cloudy" },
+    { name: "Tuesday", temperature: 72, shortForecast: "Rainy" },
+    { name: "Tuesday Night", temperature: 66, shortForecast: "Mostly Cloudy" }
+  ]
+};
+
 function WeatherWidget({ zipCode = "33620" }) {
   const [weatherData, setWeatherData] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    const fetchWeatherData = async () => {
-      try {
-        setLoading(true);
-        const response = await fetch(`http://localhost:5000/api/weather?zipcode=${zipCode}`);
-        
-        if (!response.ok) {
-          throw new Error(`Weather API returned status ${response.status}`);
-        }
-        
-        const data = await response.json();
+    // The server runs one refresher per ZIP code and pushes changes to every open dashboard
+    const source = new EventSource(`http://localhost:5000/api/stream?topics=weather:${zipCode}`);
+    setLoading(true);
+
+    source.onmessage = (event) => {
+      const { data } = JSON.parse(event.data);
+      if (data.error) {
+        console.error("Failed to fetch weather data:", data.error);
+        setError(data.error);
+        // Use fallback weather data for demo purposes
+        setWeatherData((current) => current || fallbackWeather);
+      } else {
         setWeatherData(data);
         setError(null);
-      } catch (err) {
-        console.error("Failed to fetch weather data:", err);
-        setError(err.message);
-        // Use fallback weather data for demo purposes
-        setWeatherData({
-          current: {
-            temperature: 75,
-            temperatureUnit: "F",
-            shortForecast: "Sunny",
-            windSpeed: "10 mph",
-            windDirection: "SW"
-          },
-          forecast: [
-            { name: "Tonight", temperature: 68, shortForecast: "Clear" },
-            { name: "Monday", temperature: 78, shortForecast: "Partly Cloudy" },
-            { name: "Monday Night", temperature: 65, shortForecast: "Cloudy" },
-            { name: "Tuesday", temperature: 72, shortForecast: "Rainy" },
-            { name: "Tuesday Night", temperature: 66, shortForecast: "Mostly Cloudy" }
-          ]
-        });
-      } finally {
-        setLoading(false);
       }
+      setLoading(false);
+    };
+
+    // EventSource reconnects by itself; show demo data until the first update arrives
+    source.onerror = () => {
+      setWeatherData((current) => current || fallbackWeather);
+      setLoading(false);
     };
 
-    fetchWeatherData();
-    
-    // Refresh weather data every hour
-    const intervalId = setInterval(fetchWeatherData, 60 * 60 * 1000);
-    
-    return () => clearInterval(intervalId);
+    return () => source.close();
   }, [zipCode]);
 
   if (loading) {